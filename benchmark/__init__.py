@@ -0,0 +1,6 @@
+"""
+End-to-end deployment benchmark of the SDN Domain Orchestrator.
+
+Synthetic NF-FGs are deployed through the DO class against a local stand-in
+of the ONOS REST API; see benchmark/run.py for the command line interface.
+"""
@@ -0,0 +1,188 @@
+"""
+Local stand-in of the ONOS REST API.
+
+It serves a SyntheticTopology, accepts flow and application requests
+without touching any switch, and counts every call it receives so that
+the benchmark can report controller calls per operation.
+"""
+
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ControllerStub(object):
+
+    def __init__(self, topology, host='127.0.0.1', port=0):
+        """
+        :type topology: benchmark.topology.SyntheticTopology
+        :param port: TCP port, 0 picks a free one
+        """
+        self.topology = topology
+        self.calls = Counter()
+        self.flows = {}     # (device, flow id) -> flow json
+        self.groups = {}    # (device, app cookie) -> group json
+        self.__lock = threading.Lock()
+        self.__next_flow_id = 1
+        self.__server = _ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.__server.server_address[:2]
+        return "http://" + host + ":" + str(port)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def reset_counters(self):
+        with self.__lock:
+            self.calls.clear()
+
+    def snapshot_counters(self):
+        with self.__lock:
+            return dict(self.calls)
+
+    # [ request handling ]
+
+    def _count(self, call_type):
+        with self.__lock:
+            self.calls[call_type] += 1
+
+    def _new_flow(self, device_id, body):
+        with self.__lock:
+            flow_id = str(self.__next_flow_id)
+            self.__next_flow_id += 1
+            self.flows[(device_id, flow_id)] = body
+        return flow_id
+
+    def _delete_flow(self, device_id, flow_id):
+        with self.__lock:
+            return self.flows.pop((device_id, flow_id), None) is not None
+
+    def _new_group(self, device_id, body):
+        with self.__lock:
+            self.groups[(device_id, json.loads(body)['appCookie'])] = body
+
+    def _delete_group(self, device_id, app_cookie):
+        with self.__lock:
+            return self.groups.pop((device_id, app_cookie), None) is not None
+
+    def _devices(self):
+        return {'devices': [{'id': switch_id, 'available': True} for switch_id in self.topology.switches]}
+
+    def _ports(self, device_id):
+        return {'ports': [{'port': port, 'isEnabled': True, 'annotations': {'portName': port}}
+                          for port in self.topology.get_ports(device_id)]}
+
+    def _links(self):
+        return {'links': self.topology.links}
+
+    def __handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _reply(self, code, payload=None, headers=None):
+                body = b''
+                if payload is not None:
+                    body = json.dumps(payload).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length).decode('utf-8') if length > 0 else ''
+
+            def _path(self):
+                return [p for p in self.path.split('?')[0].split('/') if p != '']
+
+            def do_GET(self):
+                path = self._path()
+                if path[:3] == ['onos', 'v1', 'devices']:
+                    if len(path) == 3:
+                        stub._count('get_devices')
+                        return self._reply(200, stub._devices())
+                    stub._count('get_device_ports')
+                    return self._reply(200, stub._ports(path[3]))
+                if path[:3] == ['onos', 'v1', 'links']:
+                    stub._count('get_links')
+                    return self._reply(200, stub._links())
+                if path[:3] == ['onos', 'v1', 'applications']:
+                    stub._count('get_application')
+                    return self._reply(200, {'name': path[3] if len(path) > 3 else None, 'state': 'ACTIVE'})
+                if path[:2] == ['onos', 'apps-capabilities']:
+                    stub._count('get_capabilities')
+                    return self._reply(200, {'functional-capabilities': []})
+                if path[:2] == ['onos', 'ovsdb']:
+                    stub._count('ovsdb')
+                    return self._reply(200)
+                stub._count('unknown')
+                return self._reply(404)
+
+            def do_POST(self):
+                path = self._path()
+                body = self._read_body()
+                if path[:3] == ['onos', 'v1', 'flows'] and len(path) == 4:
+                    stub._count('create_flow')
+                    flow_id = stub._new_flow(path[3], body)
+                    location = stub.endpoint + '/onos/v1/flows/' + path[3] + '/' + flow_id
+                    return self._reply(201, headers={'Location': location})
+                if path[:3] == ['onos', 'v1', 'groups'] and len(path) == 4:
+                    stub._count('create_group')
+                    stub._new_group(path[3], body)
+                    return self._reply(201)
+                if path[:3] == ['onos', 'v1', 'applications']:
+                    stub._count('activate_application')
+                    return self._reply(200, {'state': 'ACTIVE'})
+                if path[:3] == ['onos', 'v1', 'network']:
+                    stub._count('push_configuration')
+                    return self._reply(200)
+                if path[:2] == ['onos', 'ovsdb']:
+                    stub._count('ovsdb')
+                    return self._reply(200)
+                stub._count('unknown')
+                return self._reply(404)
+
+            def do_DELETE(self):
+                path = self._path()
+                if path == ['onos', 'v1', 'flows']:
+                    stub._count('delete_flows')
+                    for flow in json.loads(self._read_body() or '{}').get('flows', []):
+                        stub._delete_flow(flow['deviceId'], flow['flowId'])
+                    return self._reply(204)
+                if path[:3] == ['onos', 'v1', 'flows'] and len(path) == 5:
+                    stub._count('delete_flow')
+                    return self._reply(204 if stub._delete_flow(path[3], path[4]) else 404)
+                if path[:3] == ['onos', 'v1', 'groups'] and len(path) == 5:
+                    stub._count('delete_group')
+                    return self._reply(204 if stub._delete_group(path[3], path[4]) else 404)
+                if path[:3] == ['onos', 'v1', 'applications']:
+                    stub._count('deactivate_application')
+                    return self._reply(204)
+                if path[:2] == ['onos', 'ovsdb']:
+                    stub._count('ovsdb')
+                    return self._reply(204)
+                stub._count('unknown')
+                return self._reply(404)
+
+        return Handler
@@ -0,0 +1,170 @@
+"""
+Flow table size of the compiled paths.
+
+The same synthetic graphs are deployed, against the local ONOS REST
+stand-in, once for each way of compiling the paths:
+ - full-matches:    every switch of a path matches the whole match of the flow rule;
+ - minimal-matches: middle and last switches match only ingress port and internal vlan
+                    ('minimal_transit_matches' option);
+ - shared-tunnels:  flow rules along the same path share the transit and egress flows
+                    ('shared_tunnels' option);
+ - multi-table:     flow rules are classified in table 0 of the first switch, the forwarding
+                    in table 1 is shared by the flow rules entering the path from the same port
+                    ('multi_table_pipeline' option).
+For each mode the flows left on the (emulated) switches are reported:
+total, per switch and per table, per link, match criteria and size of the flow json; the flow
+table occupancy counters of the orchestrator are checked against them. '--path-weights' and
+'--k-paths' select how the paths are chosen, '--ecmp' spreads the flow rules over the equal
+cost paths through select groups, '--protection' adds backup paths switched to by fast failover
+groups (see the [traffic_engineering] options), '--path-tagging mpls' tags the paths with MPLS labels.
+
+Usage:
+    $ python3 -m benchmark.flow_tables --topology fat-tree --size 4 --graphs 50 --flow-rules 16
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from benchmark.nffg_generator import NffgGenerator
+from benchmark.topology import TOPOLOGIES, build
+from benchmark.run import BASE_FOLDER, PATH_TAGGINGS, PATH_WEIGHTS, RUN_FOLDER, _prepare_environment
+
+# mode -> (shared_tunnels, minimal_matches, multi_table)
+MODES = OrderedDict([
+    ('full-matches', (False, False, False)),
+    ('minimal-matches', (False, True, False)),
+    ('shared-tunnels', (True, False, False)),
+    ('multi-table', (False, False, True))
+])
+
+
+def _run_worker(args):
+    from benchmark.controller_stub import ControllerStub
+
+    topology = build(args.topology, args.size)
+    generator = NffgGenerator(topology, endpoints=args.endpoints, flow_rules=args.flow_rules)
+    graphs = [generator.generate() for _ in range(args.graphs)]
+
+    stub = ControllerStub(topology)
+    stub.start()
+    args.controller_endpoint = stub.endpoint
+    args.storage = 'sqlite-disk'
+    args.shared_tunnels, args.minimal_matches, args.multi_table = MODES[args.mode]
+    config_file, db_path = _prepare_environment(args, generator)
+    os.chdir(BASE_FOLDER)
+    os.environ["FROG4_SDN_DO_CONF"] = config_file
+
+    from nffg_library.nffg import NF_FG
+    from do_core.user_authentication import UserAuthentication
+    from do_core.do import DO
+    from do_core.sql.graph_session import GraphSession
+
+    user_data = UserAuthentication().authenticateUserFromCredentials('admin', 'admin', 'admin_tenant')
+
+    start = time.perf_counter()
+    try:
+        for nffg_dict in graphs:
+            nffg = NF_FG()
+            nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+            do = DO(user_data)
+            do.validate_nffg(nffg)
+            do.post_nffg(nffg)
+        elapsed = time.perf_counter() - start
+        calls = stub.snapshot_counters()
+        flows = dict(stub.flows)
+        groups = dict(stub.groups)
+        occupancy = GraphSession().getFlowTableOccupancy()
+        occupancy = {switch_id: occupancy.flows(switch_id) for switch_id in topology.switches}
+    finally:
+        stub.stop()
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    per_switch = Counter(device_id for device_id, flow_id in flows)
+    per_table = Counter(str(json.loads(body).get('tableId', 0)) for body in flows.values())
+    link_ports = set((link['src']['device'], link['src']['port']) for link in topology.links)
+    per_link = Counter((device_id, str(instruction['port']))
+                       for (device_id, flow_id), body in flows.items()
+                       for instruction in json.loads(body)['treatment']['instructions']
+                       if instruction['type'] == 'OUTPUT' and (device_id, str(instruction['port'])) in link_ports)
+    criteria = [len(json.loads(body)['selector']['criteria']) for body in flows.values()]
+    sizes = [len(body) for body in flows.values()]
+    n = len(flows)
+    return OrderedDict([
+        ('flows', n),
+        ('flows_per_graph', n / args.graphs if args.graphs > 0 else None),
+        ('flows_per_switch_max', max(per_switch.values()) if n > 0 else 0),
+        ('flows_per_switch_mean', n / len(topology.switches)),
+        ('flows_per_table', OrderedDict(sorted(per_table.items()))),
+        ('links_used', len(per_link)),
+        ('flows_per_link_max', max(per_link.values()) if len(per_link) > 0 else 0),
+        ('match_criteria_mean', sum(criteria) / n if n > 0 else None),
+        ('flow_json_bytes_mean', sum(sizes) / n if n > 0 else None),
+        ('flow_json_bytes_total', sum(sizes)),
+        ('create_flow_calls', calls.get('create_flow', 0)),
+        ('groups', len(groups)),
+        # switches whose occupancy counter differs from the flows they hold
+        ('occupancy_mismatches', sum(1 for switch_id in topology.switches
+                                     if occupancy[switch_id] != per_switch.get(switch_id, 0))),
+        ('deploy_seconds', elapsed)
+    ])
+
+
+def _spawn_worker(args, mode):
+    result_file = os.path.join(BASE_FOLDER, RUN_FOLDER, mode + ".flow_tables.json")
+    os.makedirs(os.path.dirname(result_file), exist_ok=True)
+    command = [sys.executable, "-m", "benchmark.flow_tables", "--worker", result_file, "--mode", mode,
+               "--topology", args.topology, "--size", str(args.size), "--graphs", str(args.graphs),
+               "--endpoints", str(args.endpoints), "--flow-rules", str(args.flow_rules),
+               "--path-weights", args.path_weights, "--k-paths", str(args.k_paths),
+               "--path-tagging", args.path_tagging]
+    if args.ecmp:
+        command.append("--ecmp")
+    if args.protection:
+        command.append("--protection")
+    subprocess.check_call(command, cwd=BASE_FOLDER, stdout=subprocess.DEVNULL)
+    with open(result_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flow table size of the compiled paths")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="fat-tree")
+    parser.add_argument("--size", type=int, default=4)
+    parser.add_argument("--graphs", type=int, default=20)
+    parser.add_argument("--endpoints", type=int, default=4)
+    parser.add_argument("--flow-rules", type=int, default=16)
+    parser.add_argument("--path-weights", choices=PATH_WEIGHTS, default="hops", help="weights of the links")
+    parser.add_argument("--k-paths", type=int, default=1, help="lightest paths compared")
+    parser.add_argument("--ecmp", action="store_true", help="spread flow rules over equal cost paths")
+    parser.add_argument("--protection", action="store_true", help="protect flow rules with backup paths")
+    parser.add_argument("--path-tagging", choices=PATH_TAGGINGS, default="vlan", help="header tagging the paths")
+    parser.add_argument("--mode", action="append", choices=list(MODES), help="can be repeated (default: all)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        args.mode = args.mode[0]
+        results = _run_worker(args)
+        with open(args.worker, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    report = OrderedDict([
+        ('params', OrderedDict([(k, getattr(args, k)) for k in
+                                ('topology', 'size', 'graphs', 'endpoints', 'flow_rules', 'path_weights',
+                                 'k_paths', 'ecmp', 'protection', 'path_tagging')])),
+        ('results', OrderedDict((mode, _spawn_worker(args, mode)) for mode in (args.mode or list(MODES))))
+    ])
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Overlap lookups of the flow matches on a switch port.
+
+Synthetic matches (host and prefix destinations, different ether types and protocols, vlans and
+some wildcarded fields) are stored in the match overlap index for a single ingress port and
+priority, then random matches are looked up. For each number of stored matches are reported the
+microseconds per lookup of the index and of a scan comparing the match with every stored one,
+and the lookups whose results differ (0 expected). No controller or database is needed.
+
+Usage:
+    $ python3 -m benchmark.match_overlap --flows 1000 10000 100000 --lookups 2000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from do_core.sql.match_overlap_index import MatchOverlapIndex, MATCH_FIELDS, IP_FIELDS, match_key
+
+SWITCH_ID = 'of:0000000000000001'
+PORT = '1'
+PRIORITY = 10
+
+
+def _random_match(rnd):
+    # mostly what the paths install: IPv4 host destinations behind an internal vlan, a few wider matches
+    match = SimpleNamespace()
+    match.ether_type = '0x800' if rnd.random() < 0.98 else rnd.choice(['0x806', None])
+    match.protocol = rnd.choice(['tcp', 'udp', None]) if match.ether_type == '0x800' else None
+    match.dest_ip = None
+    if match.ether_type == '0x800' and rnd.random() < 0.99:
+        prefix = 32 if rnd.random() < 0.95 else rnd.choice([24, 16])
+        match.dest_ip = '10.%d.%d.%d/%d' % (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), prefix)
+    match.source_ip = None
+    match.dest_port = rnd.randrange(1, 65536) if match.protocol is not None and rnd.random() < 0.5 else None
+    match.vlan_id = rnd.randrange(100, 164) if rnd.random() < 0.95 else None
+    return match
+
+
+def _overlap(key, other):
+    # the definition of overlapping matches, field by field
+    for field, value, other_value in zip(MATCH_FIELDS, key, other):
+        if value is None or other_value is None or value == other_value:
+            continue
+        if field in IP_FIELDS and isinstance(value, tuple) and isinstance(other_value, tuple):
+            wide, narrow = (value, other_value) if value[2] <= other_value[2] else (other_value, value)
+            shift = (32 if wide[0] == 4 else 128) - wide[2]
+            if wide[0] == narrow[0] and wide[1] >> shift == narrow[1] >> shift:
+                continue
+        return False
+    return True
+
+
+def _run(flows, lookups, seed):
+    rnd = random.Random(seed)
+    index = MatchOverlapIndex()
+    index.reset()
+    stored = []
+    for flow_id in range(flows):
+        match = _random_match(rnd)
+        index.add(flow_id, SWITCH_ID, PORT, 0, PRIORITY, match)
+        stored.append((flow_id, match_key(match)))
+    queries = [_random_match(rnd) for _ in range(lookups)]
+
+    start = time.perf_counter()
+    indexed = [index.overlapping(SWITCH_ID, PORT, PRIORITY, match) for match in queries]
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scanned = []
+    for match in queries:
+        key = match_key(match)
+        scanned.append(set(flow_id for flow_id, other in stored if _overlap(key, other)))
+    scan_seconds = time.perf_counter() - start
+
+    index.reset()
+    return OrderedDict([
+        ('flows', flows),
+        ('lookups', lookups),
+        ('overlaps_per_lookup', sum(len(found) for found in scanned) / float(lookups)),
+        ('index_us_per_lookup', index_seconds * 1e6 / lookups),
+        ('scan_us_per_lookup', scan_seconds * 1e6 / lookups),
+        ('wrong_lookups', sum(1 for a, b in zip(indexed, scanned) if a != b))
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overlap lookups of the flow matches on a switch port")
+    parser.add_argument("--flows", type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = [_run(flows, args.lookups, args.seed) for flows in args.flows]
+    print(json.dumps(results, indent=2))
+    return 0 if all(result['wrong_lookups'] == 0 for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Generator of synthetic NF-FGs (and of the matching domain description)
+over a SyntheticTopology.
+
+Each generated graph reserves its own edge ports, so graphs produced by the
+same generator can be deployed at the same time without colliding on the
+ingress switches.
+"""
+
+import copy
+import json
+from collections import OrderedDict
+
+VNF_FUNCTIONAL_CAPABILITY = 'nat'
+VNF_APPLICATION_NAME = 'it.polito.onosapp.nat'
+FIRST_VLAN_ID = 280
+FLOW_PRIORITY = 40001
+
+
+class NffgGenerator(object):
+
+    def __init__(self, topology, endpoints=4, flow_rules=8, vlan_endpoints=0, gre_endpoints=0, detached_vnfs=0):
+        """
+        :param topology: where endpoints are attached
+        :param endpoints: number of 'interface' endpoints per graph
+        :param flow_rules: number of endpoint-to-endpoint flow rules per graph
+        :param vlan_endpoints: number of 'vlan' endpoints per graph
+        :param gre_endpoints: number of 'gre-tunnel' endpoints per graph
+        :param detached_vnfs: number of VNFs per graph, each one attached to two endpoints
+        :type topology: benchmark.topology.SyntheticTopology
+        """
+        self.topology = topology
+        self.endpoints = endpoints
+        self.flow_rules = flow_rules
+        self.vlan_endpoints = vlan_endpoints
+        self.gre_endpoints = gre_endpoints
+        self.detached_vnfs = detached_vnfs
+
+        self.__graph_counter = 0
+        self.__edge_cursor = 0
+        self.__vlan_cursor = FIRST_VLAN_ID
+        self.__interfaces = OrderedDict()   # "switch/port" -> list of vlan ids
+
+        if endpoints + vlan_endpoints + gre_endpoints < 2 and (flow_rules > 0 or detached_vnfs > 0):
+            raise ValueError("At least two endpoints are needed to generate flow rules")
+
+    def __next_edge_switch(self):
+        switch_id = self.topology.edge_switches[self.__edge_cursor % len(self.topology.edge_switches)]
+        self.__edge_cursor += 1
+        return switch_id
+
+    def __new_interface(self, vlan_id=None):
+        switch_id = self.__next_edge_switch()
+        port = self.topology.new_edge_port(switch_id)
+        vlans = self.__interfaces.setdefault(switch_id + "/" + port, [])
+        if vlan_id is not None:
+            vlans.append(vlan_id)
+        return switch_id, port
+
+    def generate(self):
+        """
+        Build a new NF-FG dictionary, ready for ValidateNF_FG and NF_FG.parseDict.
+        """
+        self.__graph_counter += 1
+        graph = self.__graph_counter
+        end_points = []
+
+        for _ in range(self.endpoints):
+            switch_id, port = self.__new_interface()
+            end_points.append({
+                'id': "%05d%03d" % (graph, len(end_points) + 1),
+                'name': 'interface-endpoint',
+                'type': 'interface',
+                'interface': {'node-id': switch_id, 'if-name': port}
+            })
+        for _ in range(self.vlan_endpoints):
+            vlan_id = self.__vlan_cursor
+            self.__vlan_cursor += 1
+            switch_id, port = self.__new_interface(vlan_id)
+            end_points.append({
+                'id': "%05d%03d" % (graph, len(end_points) + 1),
+                'name': 'vlan-endpoint',
+                'type': 'vlan',
+                'vlan': {'vlan-id': str(vlan_id), 'node-id': switch_id, 'if-name': port}
+            })
+        for g in range(self.gre_endpoints):
+            end_points.append({
+                'id': "%05d%03d" % (graph, len(end_points) + 1),
+                'name': 'gre-endpoint',
+                'type': 'gre-tunnel',
+                'gre-tunnel': {
+                    'local-ip': '10.255.0.1',
+                    'remote-ip': '10.255.%d.%d' % (graph % 250 + 1, g % 250 + 2),
+                    'gre-key': hex(graph * 1000 + g)
+                }
+            })
+
+        flow_rules = []
+        n = len(end_points)
+        for k in range(self.flow_rules):
+            src = end_points[k % n]
+            dst = end_points[(k + 1 + (k // n) % (n - 1)) % n]
+            flow_rules.append(self.__flow_rule("%09d" % (k + 1), 'endpoint:' + src['id'], 'endpoint:' + dst['id'], k))
+
+        vnfs = []
+        for v in range(self.detached_vnfs):
+            vnf_id = "%08d" % (v + 1)
+            ports = []
+            for p in range(2):
+                port_id = "L2Port:%d" % p
+                ports.append({'id': port_id, 'name': 'data-port'})
+                endpoint = 'endpoint:' + end_points[(2 * v + p) % n]['id']
+                vnf_port = 'vnf:' + vnf_id + ':' + port_id
+                flow_rules.append(self.__flow_rule("1%08d" % (len(flow_rules) + 1), endpoint, vnf_port,
+                                                   len(flow_rules)))
+                flow_rules.append(self.__flow_rule("1%08d" % (len(flow_rules) + 1), vnf_port, endpoint))
+            vnfs.append({
+                'id': vnf_id,
+                'name': VNF_FUNCTIONAL_CAPABILITY,
+                'functional_capability': VNF_FUNCTIONAL_CAPABILITY,
+                'vnf_template': 'nat.json',
+                'ports': ports
+            })
+
+        forwarding_graph = {
+            'id': str(graph),
+            'name': 'benchmark-graph-' + str(graph),
+            'end-points': end_points,
+            'big-switch': {'flow-rules': flow_rules}
+        }
+        if len(vnfs) > 0:
+            forwarding_graph['VNFs'] = vnfs
+        return {'forwarding-graph': forwarding_graph}
+
+    @staticmethod
+    def update(nffg_dict):
+        """
+        Return a copy of the graph where the last endpoint-to-endpoint flow rule
+        is replaced by a new one, so that a PUT has something to delete and something to add.
+        """
+        updated = copy.deepcopy(nffg_dict)
+        flow_rules = updated['forwarding-graph']['big-switch']['flow-rules']
+        for i in reversed(range(len(flow_rules))):
+            flow_rule = flow_rules[i]
+            if flow_rule['match']['port_in'].startswith('endpoint:') and \
+                    flow_rule['actions'][0]['output_to_port'].startswith('endpoint:'):
+                new_flow_rule = copy.deepcopy(flow_rule)
+                new_flow_rule['id'] = flow_rule['id'] + "9"
+                new_flow_rule['match']['dest_ip'] = '10.254.254.254'
+                flow_rules[i] = new_flow_rule
+                break
+        return updated
+
+    @staticmethod
+    def __flow_rule(flow_rule_id, port_in, output, k=None):
+        match = {'port_in': port_in}
+        if k is not None:
+            # distinct L3 matches, so flow rules sharing an ingress port do not collide
+            match['ether_type'] = '0x800'
+            match['dest_ip'] = '10.%d.%d.%d' % ((k >> 16) & 255, (k >> 8) & 255, k & 255)
+        return {
+            'id': flow_rule_id,
+            'priority': FLOW_PRIORITY,
+            'match': match,
+            'actions': [{'output_to_port': output}]
+        }
+
+    def get_domain_description(self):
+        """
+        Domain description listing every edge interface reserved so far
+        and the functional capability used by the generated VNFs.
+        """
+        interfaces = []
+        for index, name in enumerate(self.__interfaces, start=1):
+            interface = OrderedDict()
+            interface['config'] = {'enabled': True}
+            interface['name'] = name
+            interface['subinterfaces'] = {'subinterface': [{
+                'config': {'name': name.split('/')[-1], 'enabled': True},
+                'netgroup-if-capabilities:capabilities': {'netgroup-if-capabilities:gre': False},
+                'netgroup-if-gre:gre': []
+            }]}
+            vlans = self.__interfaces[name]
+            if len(vlans) > 0:
+                interface['netgroup-if-ethernet:ethernet'] = {'netgroup-vlan:vlans': {'netgroup-vlan:vlan': [
+                    {'netgroup-vlan:config': {'netgroup-vlan:vlan-id': vlan_id}, 'netgroup-vlan:vlan-id': vlan_id}
+                    for vlan_id in vlans
+                ]}}
+            interface['index'] = index
+            interface['netgroup-if-side:side'] = 'edge'
+            interfaces.append(interface)
+
+        return {'netgroup-domain:informations': OrderedDict([
+            ('capabilities', {
+                'functional-capabilities': {'functional-capability': [{
+                    'type': VNF_FUNCTIONAL_CAPABILITY,
+                    'name': VNF_APPLICATION_NAME,
+                    'ready': True,
+                    'template': 'nat.json',
+                    'family': 'Network',
+                    'function-specifications': {'function-specification': []}
+                }]},
+                'infrastructural-capabilities': {'infrastructural-capability': [
+                    {'name': 'onos', 'type': 'sdn_controller'}
+                ]}
+            }),
+            ('name', 'benchmark_domain'),
+            ('type', 'ONOS'),
+            ('hardware-informations', {'interfaces': {'interface': interfaces}}),
+            ('management-address', '127.0.0.1:10000'),
+            ('id', '00000001')
+        ])}
+
+    def get_domain_description_json(self):
+        return json.dumps(self.get_domain_description(), indent=2)
@@ -0,0 +1,168 @@
+"""
+Concurrent paths per port with vlan and MPLS path tagging.
+
+The same synthetic graphs are deployed one after the other, against the local ONOS
+REST stand-in, once for each 'path_tagging' option, until the tags run out:
+ - vlan: paths are tagged with internal vlan ids, free on the ingress port of each switch
+         ('--vlan-ids' restricts the [vlan] available_ids, to reach the limit with few graphs);
+ - mpls: paths are tagged with MPLS labels, free on each switch ([mpls] available_labels).
+For each mode are reported: graphs deployed and failed (with their errors), paths crossing
+the busiest link (transit flows matching on its ingress port), distinct tags in use there, and
+tags allocated twice on the same switch (0 expected). With the default linear topology of two
+switches every path crosses the same link.
+
+Usage:
+    $ python3 -m benchmark.path_tagging --graphs 200 --vlan-ids 100-163
+"""
+
+import argparse
+import configparser
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from benchmark.nffg_generator import NffgGenerator
+from benchmark.topology import TOPOLOGIES, build
+from benchmark.run import BASE_FOLDER, PATH_TAGGINGS, RUN_FOLDER, _prepare_environment
+
+
+def _tag(flow):
+    # vlan id or MPLS label matched by a flow, None if it matches neither
+    for criterion in flow['selector']['criteria']:
+        if criterion['type'] == 'VLAN_VID':
+            return 'vlan', criterion['vlanId']
+        if criterion['type'] == 'MPLS_LABEL':
+            return 'mpls', criterion['label']
+    return None
+
+
+def _run_worker(args):
+    from benchmark.controller_stub import ControllerStub
+
+    topology = build(args.topology, args.size)
+    generator = NffgGenerator(topology, endpoints=args.endpoints, flow_rules=args.flow_rules)
+    graphs = [generator.generate() for _ in range(args.graphs)]
+
+    stub = ControllerStub(topology)
+    stub.start()
+    args.controller_endpoint = stub.endpoint
+    args.storage = 'sqlite-disk'
+    args.shared_tunnels, args.minimal_matches, args.multi_table = False, False, False
+    args.path_weights, args.k_paths, args.ecmp, args.protection = 'hops', 1, False, False
+    args.path_tagging = args.mode
+    config_file, db_path = _prepare_environment(args, generator)
+    config = configparser.RawConfigParser()
+    config.read(os.path.join(BASE_FOLDER, config_file))
+    config.set('vlan', 'available_ids', args.vlan_ids)
+    with open(os.path.join(BASE_FOLDER, config_file), "w") as f:
+        config.write(f)
+    os.chdir(BASE_FOLDER)
+    os.environ["FROG4_SDN_DO_CONF"] = config_file
+
+    from nffg_library.nffg import NF_FG
+    from do_core.user_authentication import UserAuthentication
+    from do_core.do import DO
+
+    user_data = UserAuthentication().authenticateUserFromCredentials('admin', 'admin', 'admin_tenant')
+
+    errors = Counter()
+    deployed = 0
+    start = time.perf_counter()
+    try:
+        for nffg_dict in graphs:
+            nffg = NF_FG()
+            nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+            do = DO(user_data)
+            do.validate_nffg(nffg)
+            try:
+                do.post_nffg(nffg)
+                deployed += 1
+            except Exception as ex:
+                errors[str(ex)] += 1
+        elapsed = time.perf_counter() - start
+        flows = dict(stub.flows)
+    finally:
+        stub.stop()
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    # transit flows, and their tags, on the ingress port of each link
+    link_ends = set((link['dst']['device'], link['dst']['port']) for link in topology.links)
+    per_port = Counter()
+    tags = {}
+    tags_per_switch = Counter()
+    for (device_id, flow_id), body in flows.items():
+        flow = json.loads(body)
+        tag = _tag(flow)
+        if tag is not None:
+            tags_per_switch[(device_id,) + tag] += 1
+        for criterion in flow['selector']['criteria']:
+            if criterion['type'] == 'IN_PORT' and (device_id, str(criterion['port'])) in link_ends:
+                port = (device_id, str(criterion['port']))
+                per_port[port] += 1
+                if tag is not None:
+                    tags.setdefault(port, set()).add(tag)
+    busiest = per_port.most_common(1)[0][0] if len(per_port) > 0 else None
+    return OrderedDict([
+        ('graphs_deployed', deployed),
+        ('graphs_failed', sum(errors.values())),
+        ('errors', OrderedDict(errors.most_common(5))),
+        ('flow_rules_deployed', deployed * args.flow_rules),
+        ('busiest_port', busiest),
+        ('paths_on_busiest_port', per_port[busiest] if busiest is not None else 0),
+        ('tags_on_busiest_port', len(tags.get(busiest, ()))),
+        # only vlans may repeat on a switch (on different ports): MPLS labels must not
+        ('labels_allocated_twice', sum(1 for (device_id, kind, tag), count in tags_per_switch.items()
+                                       if kind == 'mpls' and count > 1)),
+        ('flows', len(flows)),
+        ('deploy_seconds', elapsed)
+    ])
+
+
+def _spawn_worker(args, mode):
+    result_file = os.path.join(BASE_FOLDER, RUN_FOLDER, mode + ".path_tagging.json")
+    os.makedirs(os.path.dirname(result_file), exist_ok=True)
+    command = [sys.executable, "-m", "benchmark.path_tagging", "--worker", result_file, "--mode", mode,
+               "--topology", args.topology, "--size", str(args.size), "--graphs", str(args.graphs),
+               "--endpoints", str(args.endpoints), "--flow-rules", str(args.flow_rules),
+               "--vlan-ids", args.vlan_ids]
+    subprocess.check_call(command, cwd=BASE_FOLDER, stdout=subprocess.DEVNULL)
+    with open(result_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent paths per port with vlan and MPLS path tagging")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="linear")
+    parser.add_argument("--size", type=int, default=2)
+    parser.add_argument("--graphs", type=int, default=100)
+    parser.add_argument("--endpoints", type=int, default=2)
+    parser.add_argument("--flow-rules", type=int, default=1)
+    parser.add_argument("--vlan-ids", default="100-131", help="vlan ids available in vlan mode")
+    parser.add_argument("--mode", action="append", choices=PATH_TAGGINGS, help="can be repeated (default: all)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        args.mode = args.mode[0]
+        results = _run_worker(args)
+        with open(args.worker, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    report = OrderedDict([
+        ('params', OrderedDict([(k, getattr(args, k)) for k in
+                                ('topology', 'size', 'graphs', 'endpoints', 'flow_rules', 'vlan_ids')])),
+        ('results', OrderedDict((mode, _spawn_worker(args, mode)) for mode in (args.mode or PATH_TAGGINGS)))
+    ])
+    print(json.dumps(report, indent=2))
+    failed = [results for results in report['results'].values() if results['labels_allocated_twice'] > 0]
+    return 0 if len(failed) == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
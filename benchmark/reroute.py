@@ -0,0 +1,152 @@
+"""
+Rerouting after a link failure.
+
+Synthetic graphs are deployed against the local ONOS REST stand-in, then the link
+crossed by most flows is removed from the topology the stand-in reports and the
+rerouter reads it again, as its polling thread would. Reported:
+ - flow rules crossing the link (from the flow path index) and flow rules rerouted;
+ - flows still using the link afterwards (0 expected) and flows on the switches before and after;
+ - seconds spent rerouting and controller calls made, per call type.
+The options selecting how the paths are compiled and chosen are the ones of benchmark.run.
+
+Usage:
+    $ python3 -m benchmark.reroute --topology fat-tree --size 4 --graphs 50 --flow-rules 4
+"""
+
+import argparse
+import configparser
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from benchmark.nffg_generator import NffgGenerator
+from benchmark.topology import TOPOLOGIES, build
+from benchmark.run import BASE_FOLDER, PATH_TAGGINGS, PATH_WEIGHTS, STORAGES, _prepare_environment
+
+
+def _ports_used(device_id, body):
+    flow = json.loads(body)
+    ports = set((device_id, str(instruction['port'])) for instruction in flow['treatment']['instructions']
+                if instruction['type'] == 'OUTPUT')
+    ports.update((device_id, str(criterion['port'])) for criterion in flow['selector']['criteria']
+                 if criterion['type'] == 'IN_PORT')
+    return ports
+
+
+def _flows_per_link(topology, flows):
+    """
+    :return: Counter link index -> flows sending packets on it or receiving packets from it
+    """
+    links = {}
+    for i, link in enumerate(topology.links):
+        links[('out', link['src']['device'], link['src']['port'])] = i
+        links[('in', link['dst']['device'], link['dst']['port'])] = i
+    per_link = Counter()
+    for (device_id, flow_id), body in flows.items():
+        used = set()
+        for port in _ports_used(device_id, body):
+            used.add(links.get(('out',) + port))
+            used.add(links.get(('in',) + port))
+        per_link.update(i for i in used if i is not None)
+    return per_link
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rerouting after a link failure")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="fat-tree")
+    parser.add_argument("--size", type=int, default=4)
+    parser.add_argument("--graphs", type=int, default=20)
+    parser.add_argument("--endpoints", type=int, default=4)
+    parser.add_argument("--flow-rules", type=int, default=4)
+    parser.add_argument("--storage", choices=list(STORAGES), default='sqlite-disk')
+    parser.add_argument("--batch-size", type=int, default=10, help="flow rules rerouted together")
+    parser.add_argument("--shared-tunnels", action="store_true", help="share vlan tunnels between flow rules")
+    parser.add_argument("--minimal-matches", action="store_true", help="transit flows match only port and vlan")
+    parser.add_argument("--multi-table", action="store_true", help="compile the paths in a two tables pipeline")
+    parser.add_argument("--path-weights", choices=PATH_WEIGHTS, default="hops", help="weights of the links")
+    parser.add_argument("--k-paths", type=int, default=1, help="lightest paths compared")
+    parser.add_argument("--ecmp", action="store_true", help="spread flow rules over equal cost paths")
+    parser.add_argument("--protection", action="store_true", help="protect flow rules with backup paths")
+    parser.add_argument("--path-tagging", choices=PATH_TAGGINGS, default="vlan", help="header tagging the paths")
+    args = parser.parse_args()
+
+    from benchmark.controller_stub import ControllerStub
+
+    topology = build(args.topology, args.size)
+    generator = NffgGenerator(topology, endpoints=args.endpoints, flow_rules=args.flow_rules)
+    graphs = [generator.generate() for _ in range(args.graphs)]
+
+    stub = ControllerStub(topology)
+    stub.start()
+    args.controller_endpoint = stub.endpoint
+    config_file, db_path = _prepare_environment(args, generator)
+    config = configparser.RawConfigParser()
+    config.read(os.path.join(BASE_FOLDER, config_file))
+    config.set('rerouting', 'batch_size', str(args.batch_size))
+    with open(os.path.join(BASE_FOLDER, config_file), "w") as f:
+        config.write(f)
+    os.chdir(BASE_FOLDER)
+    os.environ["FROG4_SDN_DO_CONF"] = config_file
+
+    from nffg_library.nffg import NF_FG
+    from do_core.user_authentication import UserAuthentication
+    from do_core.do import DO
+    from do_core.rerouter import Rerouter
+    from do_core.sql.graph_session import GraphSession
+
+    user_data = UserAuthentication().authenticateUserFromCredentials('admin', 'admin', 'admin_tenant')
+
+    try:
+        for nffg_dict in graphs:
+            nffg = NF_FG()
+            nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+            do = DO(user_data)
+            do.validate_nffg(nffg)
+            do.post_nffg(nffg)
+        Rerouter().poll()
+        flows_before = len(stub.flows)
+
+        # the busiest link goes down, in both directions
+        per_link = _flows_per_link(topology, dict(stub.flows))
+        failed = topology.links[per_link.most_common(1)[0][0]] if len(per_link) > 0 else topology.links[0]
+        ends = [(failed['src']['device'], failed['src']['port']), (failed['dst']['device'], failed['dst']['port'])]
+        affected = GraphSession().getFlowPathIndex().flowrules(ends)
+        topology.links = [link for link in topology.links
+                          if (link['src']['device'], link['src']['port']) not in ends]
+
+        stub.reset_counters()
+        start = time.perf_counter()
+        rerouted = Rerouter().poll()
+        elapsed = time.perf_counter() - start
+        calls = stub.snapshot_counters()
+        flows = dict(stub.flows)
+    finally:
+        stub.stop()
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    report = OrderedDict([
+        ('params', OrderedDict([(k, getattr(args, k)) for k in
+                                ('topology', 'size', 'graphs', 'endpoints', 'flow_rules', 'batch_size',
+                                 'shared_tunnels', 'minimal_matches', 'multi_table', 'path_weights', 'k_paths',
+                                 'ecmp', 'protection', 'path_tagging')])),
+        ('failed_link', ends),
+        ('affected_flowrules', sum(len(ids) for ids in affected.values())),
+        ('affected_graphs', len(affected)),
+        ('rerouted_flowrules', rerouted),
+        ('flows_on_failed_link', sum(1 for (device_id, flow_id), body in flows.items()
+                                     if len(_ports_used(device_id, body) & set(ends)) > 0)),
+        ('flows_before', flows_before),
+        ('flows_after', len(flows)),
+        ('reroute_seconds', elapsed),
+        ('controller_calls', OrderedDict(sorted(calls.items())))
+    ])
+    print(json.dumps(report, indent=2))
+    return 0 if report['flows_on_failed_link'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
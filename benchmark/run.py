@@ -0,0 +1,360 @@
+"""
+End-to-end benchmark of NF-FG deployment.
+
+For every selected storage backend a worker process is started with its own
+configuration file, SQLite database and domain description. The worker
+drives DO.post_nffg / get_nffg / put_nffg / delete_nffg on synthetic graphs
+against a local stand-in of the ONOS REST API (benchmark/controller_stub.py)
+and reports, for each operation:
+ - latency percentiles (p50, p95, p99), mean and max, in milliseconds;
+ - controller REST calls, per call type;
+ - database queries.
+
+Results are printed (or written with --output) as JSON, so that runs can be
+compared with --baseline.
+
+Usage:
+    $ python3 -m benchmark.run --topology fat-tree --size 4 --graphs 50 --output bench.json
+    $ python3 -m benchmark.run --topology jolnet --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import configparser
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from benchmark.nffg_generator import NffgGenerator
+from benchmark.topology import TOPOLOGIES, build
+
+BASE_FOLDER = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+RUN_FOLDER = "benchmark/.run"
+DEFAULT_CONFIG = "config/default-config.ini"
+OPERATIONS = ['post', 'get', 'put', 'delete']
+# 'path_weights' options (the stand-in controller has no port statistics: with them every link weighs 1)
+PATH_WEIGHTS = ['hops', 'reserved_flows', 'port_statistics']
+# 'path_tagging' options
+PATH_TAGGINGS = ['vlan', 'mpls']
+
+# storage name -> (folder holding the SQLite file (None: repository root, i.e. disk), storage profile)
+# 'server-standin' drives the SQLite file through the pooled profile meant for a database server
+STORAGES = OrderedDict([
+    ('sqlite-disk', (None, 'sqlite')),
+    ('sqlite-tmpfs', ('/dev/shm', 'sqlite')),
+    ('sqlite-wal', (None, 'sqlite-wal')),
+    ('server-standin', (None, 'server'))
+])
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """
+    :param samples: list of {'latency_ms', 'controller_calls', 'db_queries'}
+    """
+    latencies = [s['latency_ms'] for s in samples]
+    controller_calls = Counter()
+    for s in samples:
+        controller_calls.update(s['controller_calls'])
+    n = len(samples)
+    return OrderedDict([
+        ('count', n),
+        ('latency_ms', OrderedDict([
+            ('p50', percentile(latencies, 50)),
+            ('p95', percentile(latencies, 95)),
+            ('p99', percentile(latencies, 99)),
+            ('mean', sum(latencies) / n if n > 0 else None),
+            ('max', max(latencies) if n > 0 else None)
+        ])),
+        ('controller_calls_per_op', OrderedDict(
+            sorted((k, v / n) for k, v in controller_calls.items()))),
+        ('db_queries_per_op', sum(s['db_queries'] for s in samples) / n if n > 0 else None)
+    ])
+
+
+# [ worker side ]
+
+def _prepare_environment(args, generator):
+    """
+    Write configuration file, domain description and database used by the worker.
+    Returns the configuration file path, relative to the repository root.
+    """
+    run_folder = os.path.join(RUN_FOLDER, args.storage)
+    os.makedirs(os.path.join(BASE_FOLDER, run_folder), exist_ok=True)
+
+    description_file = os.path.join(run_folder, "description.json")
+    with open(os.path.join(BASE_FOLDER, description_file), "w") as f:
+        f.write(generator.get_domain_description_json())
+
+    # the configuration always places the SQLite file in the repository root
+    db_file = "benchmark_" + args.storage + ".sqlite3"
+    db_path = os.path.join(BASE_FOLDER, db_file)
+    if os.path.lexists(db_path):
+        os.remove(db_path)
+    storage_folder, storage_profile = STORAGES[args.storage]
+    if storage_folder is not None:
+        target = os.path.join(storage_folder, "frog4_" + db_file)
+        if os.path.exists(target):
+            os.remove(target)
+        os.symlink(target, db_path)
+    conn = sqlite3.connect(db_path)
+    with open(os.path.join(BASE_FOLDER, "config/db.dump.sql")) as dump:
+        conn.executescript(dump.read())
+    conn.close()
+
+    config = configparser.RawConfigParser()
+    config.read(os.path.join(BASE_FOLDER, DEFAULT_CONFIG))
+    config.set('domain_orchestrator', 'detached_mode', 'false')
+    config.set('physical_ports', 'gre_bridge_id', generator.topology.gre_bridge_id)
+    config.set('log', 'file', os.path.join(run_folder, "benchmark.log"))
+    config.set('database', 'connection', "sqlite:///" + db_file)
+    config.set('database', 'storage_profile', storage_profile)
+    config.set('network_controller', 'controller_name', 'ONOS')
+    config.set('onos', 'onos_endpoint', args.controller_endpoint)
+    config.set('ovsdb', 'ovsdb_support', 'false')
+    config.set('messaging', 'dd_activate', 'false')
+    config.set('nf_configuration', 'initial_configuration', 'false')
+    config.set('domain_description', 'domain_description_file', description_file)
+    config.set('domain_description', 'domain_description_dynamic_file',
+               os.path.join(run_folder, "description_run.json"))
+    config.set('domain_description', 'discover_capabilities', 'false')
+    config.set('other_options', 'console_print', 'false')
+    config.set('other_options', 'use_interfaces_names', 'false')
+    config.set('other_options', 'jolnet', 'false')
+    config.set('vlan', 'shared_tunnels', 'true' if args.shared_tunnels else 'false')
+    config.set('vlan', 'minimal_transit_matches', 'true' if args.minimal_matches else 'false')
+    config.set('network_controller', 'multi_table_pipeline', 'true' if args.multi_table else 'false')
+    config.set('traffic_engineering', 'path_weights', args.path_weights)
+    config.set('traffic_engineering', 'k_paths', str(args.k_paths))
+    config.set('traffic_engineering', 'ecmp', 'true' if args.ecmp else 'false')
+    config.set('traffic_engineering', 'protection', 'true' if args.protection else 'false')
+    config.set('network_controller', 'path_tagging', args.path_tagging)
+
+    config_file = os.path.join(run_folder, "config.ini")
+    with open(os.path.join(BASE_FOLDER, config_file), "w") as f:
+        config.write(f)
+    return config_file, db_path
+
+
+def _run_worker(args):
+    from benchmark.controller_stub import ControllerStub
+
+    topology = build(args.topology, args.size)
+    generator = NffgGenerator(topology, endpoints=args.endpoints, flow_rules=args.flow_rules,
+                              vlan_endpoints=args.vlan_endpoints, gre_endpoints=args.gre_endpoints,
+                              detached_vnfs=args.vnfs)
+    background = [generator.generate() for _ in range(args.background)]
+    graphs = [generator.generate() for _ in range(args.graphs)]
+
+    stub = ControllerStub(topology)
+    stub.start()
+    args.controller_endpoint = stub.endpoint
+    config_file, db_path = _prepare_environment(args, generator)
+
+    # The configuration is a singleton: it must point to the generated file
+    # before any do_core module is imported.
+    os.chdir(BASE_FOLDER)
+    os.environ["FROG4_SDN_DO_CONF"] = config_file
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from nffg_library.nffg import NF_FG
+    from nffg_library.validator import ValidateNF_FG
+    from do_core.user_authentication import UserAuthentication
+    from do_core.do import DO
+
+    db_queries = [0]
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        db_queries[0] += 1
+    event.listen(Engine, "before_cursor_execute", count_query)
+
+    user_data = UserAuthentication().authenticateUserFromCredentials('admin', 'admin', 'admin_tenant')
+
+    def parse(nffg_dict):
+        ValidateNF_FG().validate(nffg_dict)
+        nffg = NF_FG()
+        nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+        return nffg
+
+    def post(nffg_dict):
+        nffg = parse(nffg_dict)
+        do = DO(user_data)
+        do.validate_nffg(nffg)
+        return json.loads(do.post_nffg(nffg))["nffg-uuid"]
+
+    def put(nffg_dict, nffg_id):
+        nffg = parse(nffg_dict)
+        do = DO(user_data)
+        do.validate_nffg(nffg)
+        do.put_nffg(nffg, nffg_id)
+
+    def measure(samples, operation, *op_args):
+        stub.reset_counters()
+        db_queries[0] = 0
+        start = time.perf_counter()
+        result = operation(*op_args)
+        elapsed = (time.perf_counter() - start) * 1000
+        samples.append({
+            'latency_ms': elapsed,
+            'controller_calls': stub.snapshot_counters(),
+            'db_queries': db_queries[0]
+        })
+        return result
+
+    for nffg_dict in background:
+        post(nffg_dict)
+
+    results = OrderedDict()
+    all_samples = {operation: [] for operation in OPERATIONS}
+    try:
+        for nffg_dict in graphs:
+            nffg_id = measure(all_samples['post'], post, nffg_dict)
+            measure(all_samples['get'], lambda graph_id: DO(user_data).get_nffg_json(graph_id), nffg_id)
+            measure(all_samples['put'], put, NffgGenerator.update(nffg_dict), nffg_id)
+            measure(all_samples['delete'], lambda graph_id: DO(user_data).delete_nffg(graph_id), nffg_id)
+    finally:
+        stub.stop()
+        if os.path.islink(db_path):
+            os.remove(os.path.realpath(db_path))
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    for operation in OPERATIONS:
+        results[operation] = summarize(all_samples[operation])
+    return results
+
+
+# [ driver side ]
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_FOLDER,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _spawn_worker(args, storage):
+    result_file = os.path.join(BASE_FOLDER, RUN_FOLDER, storage + ".result.json")
+    os.makedirs(os.path.dirname(result_file), exist_ok=True)
+    command = [sys.executable, "-m", "benchmark.run", "--worker", result_file, "--storage", storage,
+               "--topology", args.topology, "--size", str(args.size), "--graphs", str(args.graphs),
+               "--background", str(args.background), "--endpoints", str(args.endpoints),
+               "--flow-rules", str(args.flow_rules), "--vlan-endpoints", str(args.vlan_endpoints),
+               "--gre-endpoints", str(args.gre_endpoints), "--vnfs", str(args.vnfs),
+               "--path-weights", args.path_weights, "--k-paths", str(args.k_paths), "--path-tagging", args.path_tagging]
+    if args.shared_tunnels:
+        command.append("--shared-tunnels")
+    if args.minimal_matches:
+        command.append("--minimal-matches")
+    if args.multi_table:
+        command.append("--multi-table")
+    if args.ecmp:
+        command.append("--ecmp")
+    if args.protection:
+        command.append("--protection")
+    subprocess.check_call(command, cwd=BASE_FOLDER, stdout=subprocess.DEVNULL)
+    with open(result_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of regressions: p95 latency or controller/DB work per operation
+    growing more than 'tolerance' (relative) with respect to the baseline.
+    """
+    regressions = []
+    for storage, operations in results.items():
+        for operation, current in operations.items():
+            previous = baseline.get('results', {}).get(storage, {}).get(operation)
+            if previous is None:
+                continue
+            checks = [('latency_ms.p95', current['latency_ms']['p95'], previous['latency_ms']['p95']),
+                      ('db_queries_per_op', current['db_queries_per_op'], previous['db_queries_per_op']),
+                      ('controller_calls', sum(current['controller_calls_per_op'].values()),
+                       sum(previous['controller_calls_per_op'].values()))]
+            for metric, now, before in checks:
+                if now is not None and before is not None and now > before * (1 + tolerance):
+                    regressions.append("%s/%s %s: %.2f -> %.2f" % (storage, operation, metric, before, now))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the SDN Domain Orchestrator")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="linear")
+    parser.add_argument("--size", type=int, default=4,
+                        help="switches (linear), arity (fat-tree) or sites (jolnet)")
+    parser.add_argument("--graphs", type=int, default=20, help="graphs deployed, read, updated and deleted")
+    parser.add_argument("--background", type=int, default=0, help="graphs kept deployed during the run")
+    parser.add_argument("--endpoints", type=int, default=4)
+    parser.add_argument("--flow-rules", type=int, default=8)
+    parser.add_argument("--vlan-endpoints", type=int, default=0)
+    parser.add_argument("--gre-endpoints", type=int, default=0)
+    parser.add_argument("--vnfs", type=int, default=0, help="detached VNFs per graph")
+    parser.add_argument("--storage", action="append", choices=list(STORAGES),
+                        help="storage backend, can be repeated (default: all)")
+    parser.add_argument("--shared-tunnels", action="store_true", help="share vlan tunnels between flow rules")
+    parser.add_argument("--minimal-matches", action="store_true", help="transit flows match only port and vlan")
+    parser.add_argument("--multi-table", action="store_true", help="compile the paths in a two tables pipeline")
+    parser.add_argument("--path-weights", choices=PATH_WEIGHTS, default="hops", help="weights of the links")
+    parser.add_argument("--k-paths", type=int, default=1, help="lightest paths compared")
+    parser.add_argument("--ecmp", action="store_true", help="spread flow rules over equal cost paths")
+    parser.add_argument("--protection", action="store_true", help="protect flow rules with backup paths")
+    parser.add_argument("--path-tagging", choices=PATH_TAGGINGS, default="vlan", help="header tagging the paths")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        args.storage = args.storage[0]
+        results = _run_worker(args)
+        with open(args.worker, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    storages = args.storage or list(STORAGES)
+    report = OrderedDict([
+        ('meta', OrderedDict([('revision', _git_revision()), ('timestamp', int(time.time()))])),
+        ('params', OrderedDict([(k, getattr(args, k)) for k in
+                                ('topology', 'size', 'graphs', 'background', 'endpoints',
+                                 'flow_rules', 'vlan_endpoints', 'gre_endpoints', 'vnfs', 'shared_tunnels',
+                                 'minimal_matches', 'multi_table', 'path_weights', 'k_paths', 'ecmp', 'protection',
+                                 'path_tagging')])),
+        ('results', OrderedDict((storage, _spawn_worker(args, storage)) for storage in storages))
+    ])
+
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(report['results'], json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
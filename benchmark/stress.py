@@ -0,0 +1,181 @@
+"""
+Concurrency stress check of graph deployment.
+
+Hundreds of synthetic graphs are deployed at the same time by a pool of
+threads (the same way the background workers do in asynchronous mode),
+against the local ONOS REST stand-in. Since graphs generated with the same
+parameters use the same flow rule ids and the same L3 matches, they compete
+for flow names and for internal vlan ids on every shared transit port.
+
+At the end the database is checked for:
+ - flow names assigned twice on the same switch;
+ - vlan ids assigned twice on the same switch port for the same match;
+ - MPLS labels assigned twice on the same switch ('--path-tagging mpls');
+ - flow rules stored without being on the (emulated) switch, and vice versa.
+Then other graphs are posted in asynchronous mode and deleted at once, while their
+deployment jobs are still queued ('--async-deletes'): the jobs must find the graphs
+deleted, so no flow rule may be left to an ended session, nor an ended session be
+marked as deployed.
+
+Usage:
+    $ python3 -m benchmark.stress --topology fat-tree --size 4 --graphs 300 --threads 16
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.nffg_generator import NffgGenerator
+from benchmark.topology import TOPOLOGIES, build
+from benchmark.run import BASE_FOLDER, PATH_TAGGINGS, PATH_WEIGHTS, STORAGES, _prepare_environment
+
+DUPLICATED_FLOW_NAMES = """
+    SELECT switch_id, internal_id, COUNT(*) FROM flow_rule
+    WHERE type = 'external'
+    GROUP BY switch_id, internal_id HAVING COUNT(*) > 1
+"""
+
+DUPLICATED_VLANS = """
+    SELECT f.switch_id, m.port_in, m.vlan_id, COUNT(*) FROM flow_rule f JOIN "match" m ON m.flow_rule_id = f.id
+    WHERE f.type = 'external' AND m.vlan_id IS NOT NULL
+    GROUP BY f.switch_id, m.port_in, m.vlan_id, m.ether_type, m.source_mac, m.dest_mac, m.source_ip, m.dest_ip,
+             m.tos_bits, m.source_port, m.dest_port, m.protocol
+    HAVING COUNT(*) > 1
+"""
+
+DUPLICATED_MPLS_LABELS = """
+    SELECT switch_id, mpls_label, COUNT(*) FROM flow_rule
+    WHERE type = 'external' AND mpls_label IS NOT NULL
+    GROUP BY switch_id, mpls_label HAVING COUNT(*) > 1
+"""
+
+EXTERNAL_FLOWS = "SELECT COUNT(*) FROM flow_rule WHERE type = 'external'"
+
+FLOWS_OF_ENDED_SESSIONS = """
+    SELECT COUNT(*) FROM flow_rule f JOIN graph_session s ON s.session_id = f.session_id
+    WHERE s.ended IS NOT NULL
+"""
+
+ENDED_SESSIONS_COMPLETE = "SELECT COUNT(*) FROM graph_session WHERE ended IS NOT NULL AND status = 'complete'"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent deployment stress check")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="fat-tree")
+    parser.add_argument("--size", type=int, default=4)
+    parser.add_argument("--graphs", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--async-deletes", type=int, default=20,
+                        help="graphs deleted right after their asynchronous POST")
+    parser.add_argument("--endpoints", type=int, default=2)
+    parser.add_argument("--flow-rules", type=int, default=2)
+    parser.add_argument("--storage", choices=list(STORAGES), default='sqlite-disk')
+    parser.add_argument("--shared-tunnels", action="store_true", help="share vlan tunnels between flow rules")
+    parser.add_argument("--minimal-matches", action="store_true", help="transit flows match only port and vlan")
+    parser.add_argument("--multi-table", action="store_true", help="compile the paths in a two tables pipeline")
+    parser.add_argument("--path-weights", choices=PATH_WEIGHTS, default="hops", help="weights of the links")
+    parser.add_argument("--k-paths", type=int, default=1, help="lightest paths compared")
+    parser.add_argument("--ecmp", action="store_true", help="spread flow rules over equal cost paths")
+    parser.add_argument("--protection", action="store_true", help="protect flow rules with backup paths")
+    parser.add_argument("--path-tagging", choices=PATH_TAGGINGS, default="vlan", help="header tagging the paths")
+    args = parser.parse_args()
+
+    from benchmark.controller_stub import ControllerStub
+
+    topology = build(args.topology, args.size)
+    generator = NffgGenerator(topology, endpoints=args.endpoints, flow_rules=args.flow_rules)
+    graphs = [generator.generate() for _ in range(args.graphs)]
+    async_graphs = [generator.generate() for _ in range(args.async_deletes)]
+
+    stub = ControllerStub(topology)
+    stub.start()
+    args.controller_endpoint = stub.endpoint
+    config_file, db_path = _prepare_environment(args, generator)
+    os.chdir(BASE_FOLDER)
+    os.environ["FROG4_SDN_DO_CONF"] = config_file
+
+    from nffg_library.nffg import NF_FG
+    from do_core.user_authentication import UserAuthentication
+    from do_core.do import DO
+    from do_core.deployment_jobs import DeploymentJobs
+
+    user_data = UserAuthentication().authenticateUserFromCredentials('admin', 'admin', 'admin_tenant')
+
+    def deploy(nffg_dict):
+        nffg = NF_FG()
+        nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+        do = DO(user_data)
+        do.validate_nffg(nffg)
+        return do.post_nffg(nffg)
+
+    def deploy_and_delete(nffg_dict):
+        nffg = NF_FG()
+        nffg.parseDict(json.loads(json.dumps(nffg_dict)))
+        do = DO(user_data)
+        do.validate_nffg(nffg)
+        graph_id = json.loads(do.post_nffg(nffg, asynchronous=True))['nffg-uuid']
+        DO(user_data).delete_nffg(graph_id)
+
+    start = time.perf_counter()
+    errors = []
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = [pool.submit(deploy, nffg_dict) for nffg_dict in graphs]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                errors.append(repr(ex))
+    elapsed = time.perf_counter() - start
+
+    async_errors = []
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = [pool.submit(deploy_and_delete, nffg_dict) for nffg_dict in async_graphs]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                async_errors.append(repr(ex))
+    while DeploymentJobs().pending() > 0:
+        time.sleep(0.1)
+    stub.stop()
+
+    conn = sqlite3.connect(db_path)
+    duplicated_flow_names = conn.execute(DUPLICATED_FLOW_NAMES).fetchall()
+    duplicated_vlans = conn.execute(DUPLICATED_VLANS).fetchall()
+    duplicated_mpls_labels = conn.execute(DUPLICATED_MPLS_LABELS).fetchall()
+    stored_flows = conn.execute(EXTERNAL_FLOWS).fetchone()[0]
+    flows_of_ended_sessions = conn.execute(FLOWS_OF_ENDED_SESSIONS).fetchone()[0]
+    ended_sessions_complete = conn.execute(ENDED_SESSIONS_COMPLETE).fetchone()[0]
+    conn.close()
+
+    report = {
+        'graphs': args.graphs,
+        'threads': args.threads,
+        'seconds': elapsed,
+        'failed_deployments': len(errors),
+        'errors': sorted(set(errors))[:10],
+        'duplicated_flow_names': duplicated_flow_names,
+        'duplicated_vlans': duplicated_vlans,
+        'duplicated_mpls_labels': duplicated_mpls_labels,
+        'stored_external_flows': stored_flows,
+        'flows_on_switches': len(stub.flows),
+        'async_deletes': args.async_deletes,
+        'failed_async_deletes': len(async_errors),
+        'async_errors': sorted(set(async_errors))[:10],
+        'flows_of_ended_sessions': flows_of_ended_sessions,
+        'ended_sessions_complete': ended_sessions_complete
+    }
+    print(json.dumps(report, indent=2))
+
+    ok = len(errors) == 0 and len(duplicated_flow_names) == 0 and len(duplicated_vlans) == 0 \
+        and len(duplicated_mpls_labels) == 0 and stored_flows == len(stub.flows) \
+        and len(async_errors) == 0 and flows_of_ended_sessions == 0 and ended_sessions_complete == 0
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Synthetic switch topologies used by the benchmark.
+
+Every topology exposes the same information the orchestrator reads from
+the controller (devices, ports and bidirectional links) plus the list of
+edge switches where the NF-FG generator can attach endpoints.
+"""
+
+EDGE_PORT_BASE = 100
+
+
+class SyntheticTopology(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.switches = []      # device ids, in creation order
+        self.links = []         # {'src': {'device', 'port'}, 'dst': {'device', 'port'}}, one per direction
+        self.edge_switches = []
+        self.__next_link_port = {}
+        self.__next_edge_port = {}
+
+    def add_switch(self, edge=False):
+        switch_id = "of:%016x" % (len(self.switches) + 1)
+        self.switches.append(switch_id)
+        self.__next_link_port[switch_id] = 1
+        self.__next_edge_port[switch_id] = EDGE_PORT_BASE
+        if edge:
+            self.edge_switches.append(switch_id)
+        return switch_id
+
+    def add_link(self, switch_a, switch_b):
+        port_a = self.__next_link_port[switch_a]
+        port_b = self.__next_link_port[switch_b]
+        self.__next_link_port[switch_a] += 1
+        self.__next_link_port[switch_b] += 1
+        self.links.append({'src': {'device': switch_a, 'port': str(port_a)},
+                           'dst': {'device': switch_b, 'port': str(port_b)}})
+        self.links.append({'src': {'device': switch_b, 'port': str(port_b)},
+                           'dst': {'device': switch_a, 'port': str(port_a)}})
+
+    def new_edge_port(self, switch_id):
+        """
+        Reserve a new access port on the given switch.
+        Edge ports never overlap with link ports.
+        """
+        port = self.__next_edge_port[switch_id]
+        self.__next_edge_port[switch_id] += 1
+        return str(port)
+
+    def get_ports(self, switch_id):
+        ports = [str(p) for p in range(1, self.__next_link_port[switch_id])]
+        ports += [str(p) for p in range(EDGE_PORT_BASE, self.__next_edge_port[switch_id])]
+        return ports
+
+    @property
+    def gre_bridge_id(self):
+        return self.switches[0]
+
+
+def linear(switches=4):
+    """
+    s1 - s2 - ... - sN, endpoints on every switch.
+    """
+    topology = SyntheticTopology("linear")
+    previous = None
+    for _ in range(max(1, switches)):
+        switch_id = topology.add_switch(edge=True)
+        if previous is not None:
+            topology.add_link(previous, switch_id)
+        previous = switch_id
+    return topology
+
+
+def fat_tree(k=4):
+    """
+    Classic k-ary fat-tree: (k/2)^2 core switches and k pods,
+    each with k/2 aggregation and k/2 edge switches. Endpoints on edge switches.
+    """
+    if k < 2 or k % 2 != 0:
+        raise ValueError("fat-tree arity must be an even number >= 2")
+    half = k // 2
+    topology = SyntheticTopology("fat-tree")
+    cores = [topology.add_switch() for _ in range(half * half)]
+    for _ in range(k):
+        aggregations = [topology.add_switch() for _ in range(half)]
+        edges = [topology.add_switch(edge=True) for _ in range(half)]
+        for a, aggregation in enumerate(aggregations):
+            for core in cores[a * half:(a + 1) * half]:
+                topology.add_link(aggregation, core)
+            for edge in edges:
+                topology.add_link(edge, aggregation)
+    return topology
+
+
+def jolnet(sites=6):
+    """
+    JOLNET-like geography: a ring of core switches, one per site,
+    each one serving a single access switch where endpoints are attached.
+    """
+    sites = max(3, sites)
+    topology = SyntheticTopology("jolnet")
+    cores = [topology.add_switch() for _ in range(sites)]
+    for i in range(sites):
+        topology.add_link(cores[i], cores[(i + 1) % sites])
+    for core in cores:
+        access = topology.add_switch(edge=True)
+        topology.add_link(access, core)
+    return topology
+
+
+TOPOLOGIES = {
+    'linear': linear,
+    'fat-tree': fat_tree,
+    'jolnet': jolnet
+}
+
+
+def build(name, size):
+    """
+    :param name: one of TOPOLOGIES
+    :param size: switches for 'linear', arity for 'fat-tree', sites for 'jolnet'
+    :rtype: SyntheticTopology
+    """
+    return TOPOLOGIES[name](size)
@@ -93,6 +93,9 @@ CREATE TABLE 'graph_session' (
   "last_update" datetime DEFAULT NULL,
   "error" datetime DEFAULT NULL,
   "ended" datetime DEFAULT NULL, 'description'  varchar(256) DEFAULT NULL ,
+  "graph_hash" varchar(64) DEFAULT NULL,
+  "idempotency_key" varchar(256) DEFAULT NULL,
+  "snapshot" blob DEFAULT NULL,
   PRIMARY KEY ("session_id")
 );
 CREATE TABLE 'flow_rule' (
@@ -106,6 +109,9 @@ CREATE TABLE 'flow_rule' (
   "status" varchar(64) DEFAULT NULL,
   "creation_date" datetime NOT NULL,
   "last_update" datetime DEFAULT NULL, 'description'  varchar(128) DEFAULT NULL ,
+  "tunnel_id" int(64) DEFAULT NULL,
+  "table_id" int(64) DEFAULT NULL,
+  "mpls_label" int(64) DEFAULT NULL,
   PRIMARY KEY ("id")
 );
 CREATE TABLE 'vlan' ( 
@@ -134,3 +140,20 @@ CREATE TABLE 'vnf_port' (
   "name" varchar(64),
   PRIMARY KEY ("id")
 );
+CREATE TABLE 'vlan_tunnel' (
+  "id" int(64) NOT NULL,
+  "tunnel_key" varchar(64) NOT NULL,
+  "vlan_in" int(64) DEFAULT NULL,
+  "ref_count" int(64) NOT NULL,
+  "creation_date" datetime NOT NULL,
+  PRIMARY KEY ("id")
+);
+CREATE TABLE 'flow_group' (
+  "id" int(64) NOT NULL,
+  "session_id" varchar(64) NOT NULL,
+  "graph_flow_rule_id" varchar(64) DEFAULT NULL,
+  "switch_id" varchar(64) NOT NULL,
+  "group_id" int(64) NOT NULL,
+  "creation_date" datetime NOT NULL,
+  PRIMARY KEY ("id")
+);
@@ -0,0 +1,69 @@
+"""
+Notifications of functional capability changes, sent by the controller side application
+"""
+
+import logging
+
+from flask import request
+from flask_restplus import Resource
+
+from do_core.api.api import api
+from do_core.config import Configuration
+from do_core.domain_information_manager import DomainInformationManager
+from do_core.user_authentication import UserAuthentication
+from do_core.exception import wrongRequest, unauthorizedRequest, UserNotFound, TenantNotFound, UserTokenExpired
+
+
+capabilities_ns = api.namespace('capabilities', 'Functional Capabilities Resource')
+
+
+@capabilities_ns.route('/notification', methods=['POST'])
+class CapabilitiesNotificationResource(Resource):
+
+    @capabilities_ns.param("X-Auth-Token", "Authentication token", "header", type="string", required=True)
+    @capabilities_ns.response(202, 'Capabilities will be checked.')
+    @capabilities_ns.response(401, 'Unauthorized.')
+    @capabilities_ns.response(404, 'Notifications not enabled.')
+    @capabilities_ns.response(500, 'Internal Error.')
+    def post(self):
+        """
+        Notify that the functional capabilities changed on the controller
+        """
+        try:
+            UserAuthentication().authenticateUserFromRESTRequest(request)
+
+            if not Configuration().DISCOVER_CAPABILITIES or not Configuration().CAPABILITIES_PUSH:
+                return "Capability notifications are not enabled", 404
+
+            DomainInformationManager().notify_capabilities_changed()
+            return "Accepted", 202
+
+        # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except wrongRequest as err:
+            logging.exception(err)
+            return "Bad Request", 400
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except unauthorizedRequest as err:
+            if request.headers.get("X-Auth-User") is not None:
+                logging.debug("Unauthorized access attempt from user "+request.headers.get("X-Auth-User"))
+            logging.debug(err.message)
+            return "Unauthorized", 401
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except UserTokenExpired as err:
+            logging.exception(err)
+            return err.message, 401
+
+        # No Results
+        except UserNotFound as err:
+            logging.exception(err)
+            return "UserNotFound", 404
+        except TenantNotFound as err:
+            logging.exception(err)
+            return "TenantNotFound", 404
+
+        # Other errors
+        except Exception as err:
+            logging.exception(err)
+            return str(err), 500
@@ -13,6 +13,7 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from do_core.api.api import api
 from do_core.netmanager import NetManager
+from do_core.sql.graph_session import GraphSession
 from do_core.user_authentication import UserAuthentication
 from do_core.exception import wrongRequest, unauthorizedRequest, sessionNotFound, UserNotFound, TenantNotFound, \
     UserTokenExpired
@@ -83,3 +84,50 @@ class NetworkTopologyResource(Resource):
         except Exception as err:
             logging.exception(err)
             return str(err), 500
+
+
+@topology_ns.route('/occupancy', methods=['GET'])
+class FlowTableOccupancyResource(Resource):
+
+    @topology_ns.param("X-Auth-Token", "Authentication token", "header", type="string", required=True)
+    @topology_ns.response(200, 'Occupancy correctly retrieved.')
+    @topology_ns.response(401, 'Unauthorized.')
+    @topology_ns.response(500, 'Internal Error.')
+    def get(self):
+        """
+        Get the flows installed on each switch (per table), with the capacity of the switch and the fraction in use
+        """
+        try:
+            UserAuthentication().authenticateUserFromRESTRequest(request)
+
+            return jsonify(GraphSession().getFlowTableOccupancy().snapshot())
+
+        # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except wrongRequest as err:
+            logging.exception(err)
+            return "Bad Request", 400
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except unauthorizedRequest as err:
+            if request.headers.get("X-Auth-User") is not None:
+                logging.debug("Unauthorized access attempt from user "+request.headers.get("X-Auth-User"))
+            logging.debug(err.message)
+            return "Unauthorized", 401
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except UserTokenExpired as err:
+            logging.exception(err)
+            return err.message, 401
+
+        # No Results
+        except UserNotFound as err:
+            logging.exception(err)
+            return "UserNotFound", 404
+        except TenantNotFound as err:
+            logging.exception(err)
+            return "TenantNotFound", 404
+
+        # Other errors
+        except Exception as err:
+            logging.exception(err)
+            return str(err), 500
@@ -18,10 +18,11 @@ from nffg_library.exception import NF_FGValidationError
 
 from do_core.api.api import api
 from do_core.user_authentication import UserAuthentication
+from do_core.config import Configuration
 from do_core.do import DO
 
 from do_core.exception import wrongRequest, unauthorizedRequest, sessionNotFound, NffgUselessInformations, \
-    UserNotFound, TenantNotFound, UserTokenExpired, GraphError, NoPathBetweenSwitches, NoGraphFound
+    UserNotFound, TenantNotFound, UserTokenExpired, GraphError, NoPathBetweenSwitches, NoGraphFound, IdempotencyConflict
 
 nffg_ns = api.namespace('NF-FG', 'NFFG Resource')
 
@@ -33,11 +34,15 @@ class NFFGResource(Resource):
 
     @nffg_ns.param("X-Auth-Token", "Authentication token", "header", type="string", required=True)
     @nffg_ns.param("nffg", "Graph to be deployed", "body", type="string", required=True)
+    @nffg_ns.param("Idempotency-Key", "Key of the request: a request repeating it returns the graph already created",
+                   "header", type="string", required=False)
     @nffg_ns.response(201, 'Graph correctly deployed.')
+    @nffg_ns.response(202, 'Graph accepted, deployment in progress (asynchronous mode).')
     @nffg_ns.response(400, 'Bad request.')
     @nffg_ns.response(401, 'Unauthorized.')
     @nffg_ns.response(404, 'No result.')
     @nffg_ns.response(406, 'Not acceptable.')
+    @nffg_ns.response(409, 'Idempotency key already used for a different graph.')
     @nffg_ns.response(500, 'Internal Error.')
     def post(self):
         """
@@ -56,7 +61,15 @@ class NFFGResource(Resource):
 
             nc_do = DO(user_data)
             nc_do.validate_nffg(nffg)
-            resp = Response(response=nc_do.post_nffg(nffg), status=201, mimetype="application/json")
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if Configuration().ASYNC_DEPLOYMENT:
+                # the graph is stored, its deployment goes on in background
+                response_uuid = nc_do.post_nffg(nffg, asynchronous=True, idempotency_key=idempotency_key)
+                resp = Response(response=response_uuid, status=202, mimetype="application/json")
+                resp.headers['Location'] = nffg_ns.path + '/status/' + json.loads(response_uuid)['nffg-uuid']
+                return resp
+            resp = Response(response=nc_do.post_nffg(nffg, idempotency_key=idempotency_key), status=201,
+                            mimetype="application/json")
             return resp
 
         # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
@@ -101,6 +114,11 @@ class NFFGResource(Resource):
             logging.exception(err)
             return err.message, 422
 
+        # Repeated request - raised by DO().post_nffg
+        except IdempotencyConflict as err:
+            logging.exception(err)
+            return err.message, 409
+
         # No Results
         except UserNotFound as err:
             logging.exception(err)
@@ -148,8 +166,10 @@ class NFFGResource(Resource):
 
             nc_do = DO(user_data)
             nc_do.validate_nffg(nffg)
-            nc_do.put_nffg(nffg, nffg_id)
+            nc_do.put_nffg(nffg, nffg_id, asynchronous=Configuration().ASYNC_DEPLOYMENT)
             resp = Response(response=None, status=202, mimetype="application/json")
+            if Configuration().ASYNC_DEPLOYMENT:
+                resp.headers['Location'] = nffg_ns.path + '/status/' + nffg_id
             return resp
 
         # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
@@ -294,7 +314,7 @@ class NFFGResource(Resource):
                 # return all NFFGs
                 resp = Response(response=json.dumps(do.get_nffgs()), status=200, mimetype="application/json")
             else:
-                resp = Response(response=do.get_nffg(nffg_id).getJSON(), status=200, mimetype="application/json")
+                resp = Response(response=do.get_nffg_json(nffg_id), status=200, mimetype="application/json")
             return resp
 
         # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
@@ -360,7 +380,7 @@ class NFFGStatusResource(Resource):
             status_json['status'] = status
             status_json['percentage_completed'] = percentage
 
-            if status == 'initialization' or status == 'updating':
+            if status == 'initialization' or status == 'inizialization' or status == 'updating':
                 status_json['status'] = 'in_progress'
 
             return jsonify(status_json)
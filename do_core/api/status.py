@@ -0,0 +1,70 @@
+"""
+Metrics of the internal components of the domain orchestrator
+"""
+
+import logging
+
+from flask import request, jsonify
+from flask_restplus import Resource
+
+from do_core.api.api import api
+from do_core.rerouter import Rerouter
+from do_core.sql.nffg_cache import NffgCache
+from do_core.sql.session_archiver import SessionArchiver
+from do_core.user_authentication import UserAuthentication
+from do_core.exception import wrongRequest, unauthorizedRequest, UserNotFound, TenantNotFound, UserTokenExpired
+
+
+status_ns = api.namespace('status', 'Status Resource')
+
+
+@status_ns.route('/metrics', methods=['GET'])
+class MetricsResource(Resource):
+
+    @status_ns.param("X-Auth-Token", "Authentication token", "header", type="string", required=True)
+    @status_ns.response(200, 'Metrics correctly retrieved.')
+    @status_ns.response(401, 'Unauthorized.')
+    @status_ns.response(500, 'Internal Error.')
+    def get(self):
+        """
+        Get the metrics of the components of the orchestrator (e.g. size and hit rate of the graph cache,
+        progress of the archival of old sessions, flow rules moved off failed links)
+        """
+        try:
+            UserAuthentication().authenticateUserFromRESTRequest(request)
+
+            return jsonify({
+                'nffg_cache': NffgCache().metrics(),
+                'session_archiver': SessionArchiver().metrics(),
+                'rerouter': Rerouter().metrics()
+            })
+
+        # User auth request - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except wrongRequest as err:
+            logging.exception(err)
+            return "Bad Request", 400
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except unauthorizedRequest as err:
+            if request.headers.get("X-Auth-User") is not None:
+                logging.debug("Unauthorized access attempt from user "+request.headers.get("X-Auth-User"))
+            logging.debug(err.message)
+            return "Unauthorized", 401
+
+        # User auth credentials - raised by UserAuthentication().authenticateUserFromRESTRequest
+        except UserTokenExpired as err:
+            logging.exception(err)
+            return err.message, 401
+
+        # No Results
+        except UserNotFound as err:
+            logging.exception(err)
+            return "UserNotFound", 404
+        except TenantNotFound as err:
+            logging.exception(err)
+            return "TenantNotFound", 404
+
+        # Other errors
+        except Exception as err:
+            logging.exception(err)
+            return str(err), 500
@@ -44,6 +44,8 @@ class Configuration(object, metaclass=Singleton):
             self.__ORCHESTRATOR_PORT = config.get('domain_orchestrator', 'port')
             self.__ORCHESTRATOR_IP = config.get('domain_orchestrator', 'ip')
             self.__DETACHED_MODE = config.getboolean('domain_orchestrator', 'detached_mode')
+            self.__ASYNC_DEPLOYMENT = config.getboolean('domain_orchestrator', 'async_deployment')
+            self.__DEPLOYMENT_WORKERS = config.getint('domain_orchestrator', 'deployment_workers')
 
             # [log]
             self.__LOG_FILE = config.get('log', 'file')
@@ -53,6 +55,12 @@ class Configuration(object, metaclass=Singleton):
             # [vlan]
             self.__VLAN_AVAILABLE_IDS = config.get('vlan', 'available_ids')
             self.__ALLOWED_VLANS = self.__set_available_vlan_ids_array(self.__VLAN_AVAILABLE_IDS)
+            self.__SHARED_VLAN_TUNNELS = config.getboolean('vlan', 'shared_tunnels')
+            self.__MINIMAL_TRANSIT_MATCHES = config.getboolean('vlan', 'minimal_transit_matches')
+
+            # [mpls]
+            self.__MPLS_AVAILABLE_LABELS = config.get('mpls', 'available_labels')
+            self.__ALLOWED_MPLS_LABELS = self.__set_available_vlan_ids_array(self.__MPLS_AVAILABLE_LABELS)
 
             # [physical_ports]
             ports_json = config.get('physical_ports', 'ports')
@@ -65,18 +73,62 @@ class Configuration(object, metaclass=Singleton):
 
             # [database]
             self.__DATABASE_CONNECTION = config.get('database', 'connection')
-            db_file = os.path.basename(self.__DATABASE_CONNECTION)
-            self.__DATABASE_CONNECTION = self.__DATABASE_CONNECTION.replace(db_file, str(base_folder)+'/'+db_file)
+            if self.__DATABASE_CONNECTION[:6] == "sqlite":
+                db_file = os.path.basename(self.__DATABASE_CONNECTION)
+                self.__DATABASE_CONNECTION = self.__DATABASE_CONNECTION.replace(db_file, str(base_folder)+'/'+db_file)
             self.__DATABASE_DUMP_FILE = str(base_folder)+'/'+config.get('database', 'database_name')
+            self.__STORAGE_PROFILE = config.get('database', 'storage_profile')
+            self.__SQLITE_BUSY_TIMEOUT = config.getfloat('database', 'sqlite_busy_timeout')
+            self.__POOL_SIZE = config.getint('database', 'pool_size')
+            self.__POOL_MAX_OVERFLOW = config.getint('database', 'pool_max_overflow')
+            self.__NFFG_CACHE_SIZE = config.getint('database', 'nffg_cache_size')
+            self.__ARCHIVE_RETENTION_DAYS = config.getfloat('database', 'archive_retention_days')
+            self.__ARCHIVE_INTERVAL = config.getfloat('database', 'archive_interval')
+            self.__ARCHIVE_FILE = str(base_folder)+'/'+config.get('database', 'archive_file')
+            self.__ARCHIVE_VACUUM = config.getboolean('database', 'archive_vacuum')
 
             # [network_controller]
             self.__CONTROLLER_NAME = config.get('network_controller', 'controller_name')
+            self.__MULTI_TABLE_PIPELINE = config.getboolean('network_controller', 'multi_table_pipeline')
+            self.__PATH_TAGGING = config.get('network_controller', 'path_tagging')
+            if self.__PATH_TAGGING not in ('vlan', 'mpls'):
+                raise ValueError("Unknown path_tagging '" + self.__PATH_TAGGING + "', allowed: vlan, mpls")
+
+            # [flow_tables]
+            self.__FLOW_TABLE_DEFAULT_CAPACITY = config.getint('flow_tables', 'default_capacity')
+            self.__FLOW_TABLE_CAPACITIES = json.loads(config.get('flow_tables', 'capacities'))
+            self.__FLOW_TABLE_THRESHOLD = config.getfloat('flow_tables', 'threshold')
+
+            # [traffic_engineering]
+            self.__PATH_WEIGHTS = config.get('traffic_engineering', 'path_weights')
+            self.__FLOW_WEIGHT = config.getfloat('traffic_engineering', 'flow_weight')
+            self.__LINK_CAPACITY = config.getfloat('traffic_engineering', 'link_capacity')
+            self.__CONGESTION_WEIGHT = config.getfloat('traffic_engineering', 'congestion_weight')
+            self.__STATISTICS_INTERVAL = config.getfloat('traffic_engineering', 'statistics_interval')
+            self.__K_PATHS = config.getint('traffic_engineering', 'k_paths')
+            self.__ECMP = config.getboolean('traffic_engineering', 'ecmp')
+            self.__ECMP_MAX_PATHS = config.getint('traffic_engineering', 'ecmp_max_paths')
+            self.__PROTECTION = config.getboolean('traffic_engineering', 'protection')
+
+            # [rerouting]
+            self.__REROUTING = config.getboolean('rerouting', 'enabled')
+            self.__TOPOLOGY_INTERVAL = config.getfloat('rerouting', 'topology_interval')
+            self.__REROUTE_BATCH_SIZE = config.getint('rerouting', 'batch_size')
 
             # [opendaylight]
             self.__ODL_USERNAME = config.get('opendaylight', 'odl_username')
             self.__ODL_PASSWORD = config.get('opendaylight', 'odl_password')
             self.__ODL_ENDPOINT = config.get('opendaylight', 'odl_endpoint')
             self.__ODL_VERSION = config.get('opendaylight', 'odl_version')
+            if self.__MULTI_TABLE_PIPELINE and self.__CONTROLLER_NAME == "OpenDayLight" \
+                    and self.__ODL_VERSION == "Hydrogen":
+                raise ValueError("multi_table_pipeline needs OpenFlow 1.3: not supported by OpenDayLight Hydrogen")
+            if (self.__ECMP or self.__PROTECTION) and self.__CONTROLLER_NAME == "OpenDayLight" \
+                    and self.__ODL_VERSION == "Hydrogen":
+                raise ValueError("ecmp and protection need OpenFlow 1.3 groups: not supported by OpenDayLight Hydrogen")
+            if self.__PATH_TAGGING == 'mpls' and self.__CONTROLLER_NAME == "OpenDayLight" \
+                    and self.__ODL_VERSION == "Hydrogen":
+                raise ValueError("mpls path_tagging needs OpenFlow 1.3: not supported by OpenDayLight Hydrogen")
 
             # [onos]
             self.__ONOS_USERNAME = config.get('onos', 'onos_username')
@@ -100,15 +152,24 @@ class Configuration(object, metaclass=Singleton):
             self.__DD_BROKER_ADDRESS = config.get('messaging', 'dd_broker_address')
             self.__DD_TENANT_NAME = config.get('messaging', 'dd_tenant_name')
             self.__DD_TENANT_KEY = config.get('messaging', 'dd_tenant_key')
+            self.__DD_PUBLISH_DELAY = config.getfloat('messaging', 'dd_publish_delay')
+            self.__DD_PUBLISH_DELTAS = config.getboolean('messaging', 'dd_publish_deltas')
+            self.__DD_FULL_SNAPSHOT_INTERVAL = config.getfloat('messaging', 'dd_full_snapshot_interval')
 
             # [domain_description]
             self.__DOMAIN_DESCRIPTION_TOPIC = config.get('domain_description', 'domain_description_topic')
+            self.__DOMAIN_DESCRIPTION_DELTA_TOPIC = config.get('domain_description', 'domain_description_delta_topic')
             self.__DOMAIN_DESCRIPTION_FILE = str(base_folder)+"/"+config.get('domain_description',
                                                                              'domain_description_file')
             self.__DOMAIN_DESCRIPTION_DYNAMIC_FILE = str(base_folder)+'/'+config.get('domain_description',
                                                                                      'domain_description_dynamic_file')
             self.__CAPABILITIES_APP_NAME = config.get('domain_description', 'capabilities_app_name')
             self.__DISCOVER_CAPABILITIES = config.getboolean('domain_description', 'discover_capabilities')
+            self.__CAPABILITIES_POLL_INTERVAL = config.getfloat('domain_description', 'capabilities_poll_interval')
+            self.__CAPABILITIES_POLL_MAX_INTERVAL = config.getfloat('domain_description',
+                                                                    'capabilities_poll_max_interval')
+            self.__CAPABILITIES_PUSH = config.getboolean('domain_description', 'capabilities_push')
+            self.__DESCRIPTION_WRITE_DELAY = config.getfloat('domain_description', 'description_write_delay')
 
             # [other_options]
             self.__OO_CONSOLE_PRINT = config.getboolean('other_options', 'console_print')
@@ -192,6 +253,14 @@ class Configuration(object, metaclass=Singleton):
     def DETACHED_MODE(self):
         return self.__DETACHED_MODE
 
+    @property
+    def ASYNC_DEPLOYMENT(self):
+        return self.__ASYNC_DEPLOYMENT
+
+    @property
+    def DEPLOYMENT_WORKERS(self):
+        return self.__DEPLOYMENT_WORKERS
+
     @property
     def VLAN_AVAILABLE_IDS(self):
         return self.__VLAN_AVAILABLE_IDS
@@ -200,6 +269,22 @@ class Configuration(object, metaclass=Singleton):
     def ALLOWED_VLANS(self):
         return self.__ALLOWED_VLANS
 
+    @property
+    def SHARED_VLAN_TUNNELS(self):
+        return self.__SHARED_VLAN_TUNNELS
+
+    @property
+    def MINIMAL_TRANSIT_MATCHES(self):
+        return self.__MINIMAL_TRANSIT_MATCHES
+
+    @property
+    def MPLS_AVAILABLE_LABELS(self):
+        return self.__MPLS_AVAILABLE_LABELS
+
+    @property
+    def ALLOWED_MPLS_LABELS(self):
+        return self.__ALLOWED_MPLS_LABELS
+
     @property
     def PORTS(self):
         return self.__PORTS
@@ -228,10 +313,114 @@ class Configuration(object, metaclass=Singleton):
     def DATABASE_DUMP_FILE(self):
         return self.__DATABASE_DUMP_FILE
 
+    @property
+    def STORAGE_PROFILE(self):
+        return self.__STORAGE_PROFILE
+
+    @property
+    def SQLITE_BUSY_TIMEOUT(self):
+        return self.__SQLITE_BUSY_TIMEOUT
+
+    @property
+    def POOL_SIZE(self):
+        return self.__POOL_SIZE
+
+    @property
+    def POOL_MAX_OVERFLOW(self):
+        return self.__POOL_MAX_OVERFLOW
+
+    @property
+    def NFFG_CACHE_SIZE(self):
+        return self.__NFFG_CACHE_SIZE
+
+    @property
+    def ARCHIVE_RETENTION_DAYS(self):
+        return self.__ARCHIVE_RETENTION_DAYS
+
+    @property
+    def ARCHIVE_INTERVAL(self):
+        return self.__ARCHIVE_INTERVAL
+
+    @property
+    def ARCHIVE_FILE(self):
+        return self.__ARCHIVE_FILE
+
+    @property
+    def ARCHIVE_VACUUM(self):
+        return self.__ARCHIVE_VACUUM
+
     @property
     def CONTROLLER_NAME(self):
         return self.__CONTROLLER_NAME
 
+    @property
+    def MULTI_TABLE_PIPELINE(self):
+        return self.__MULTI_TABLE_PIPELINE
+
+    @property
+    def PATH_TAGGING(self):
+        return self.__PATH_TAGGING
+
+    @property
+    def FLOW_TABLE_DEFAULT_CAPACITY(self):
+        return self.__FLOW_TABLE_DEFAULT_CAPACITY
+
+    @property
+    def FLOW_TABLE_CAPACITIES(self):
+        return self.__FLOW_TABLE_CAPACITIES
+
+    @property
+    def FLOW_TABLE_THRESHOLD(self):
+        return self.__FLOW_TABLE_THRESHOLD
+
+    @property
+    def PATH_WEIGHTS(self):
+        return self.__PATH_WEIGHTS
+
+    @property
+    def FLOW_WEIGHT(self):
+        return self.__FLOW_WEIGHT
+
+    @property
+    def LINK_CAPACITY(self):
+        return self.__LINK_CAPACITY
+
+    @property
+    def CONGESTION_WEIGHT(self):
+        return self.__CONGESTION_WEIGHT
+
+    @property
+    def STATISTICS_INTERVAL(self):
+        return self.__STATISTICS_INTERVAL
+
+    @property
+    def K_PATHS(self):
+        return self.__K_PATHS
+
+    @property
+    def ECMP(self):
+        return self.__ECMP
+
+    @property
+    def ECMP_MAX_PATHS(self):
+        return self.__ECMP_MAX_PATHS
+
+    @property
+    def PROTECTION(self):
+        return self.__PROTECTION
+
+    @property
+    def REROUTING(self):
+        return self.__REROUTING
+
+    @property
+    def TOPOLOGY_INTERVAL(self):
+        return self.__TOPOLOGY_INTERVAL
+
+    @property
+    def REROUTE_BATCH_SIZE(self):
+        return self.__REROUTE_BATCH_SIZE
+
     @property
     def ODL_USERNAME(self):
         return self.__ODL_USERNAME
@@ -300,6 +489,18 @@ class Configuration(object, metaclass=Singleton):
     def DD_TENANT_KEY(self):
         return self.__DD_TENANT_KEY
 
+    @property
+    def DD_PUBLISH_DELAY(self):
+        return self.__DD_PUBLISH_DELAY
+
+    @property
+    def DD_PUBLISH_DELTAS(self):
+        return self.__DD_PUBLISH_DELTAS
+
+    @property
+    def DD_FULL_SNAPSHOT_INTERVAL(self):
+        return self.__DD_FULL_SNAPSHOT_INTERVAL
+
     @property
     def INITIAL_CONFIGURATION(self):
         return self.__INITIAL_CONFIGURATION
@@ -312,6 +513,10 @@ class Configuration(object, metaclass=Singleton):
     def DOMAIN_DESCRIPTION_TOPIC(self):
         return self.__DOMAIN_DESCRIPTION_TOPIC
 
+    @property
+    def DOMAIN_DESCRIPTION_DELTA_TOPIC(self):
+        return self.__DOMAIN_DESCRIPTION_DELTA_TOPIC
+
     @property
     def DOMAIN_DESCRIPTION_FILE(self):
         return self.__DOMAIN_DESCRIPTION_FILE
@@ -328,6 +533,22 @@ class Configuration(object, metaclass=Singleton):
     def DISCOVER_CAPABILITIES(self):
         return self.__DISCOVER_CAPABILITIES
 
+    @property
+    def CAPABILITIES_POLL_INTERVAL(self):
+        return self.__CAPABILITIES_POLL_INTERVAL
+
+    @property
+    def CAPABILITIES_POLL_MAX_INTERVAL(self):
+        return self.__CAPABILITIES_POLL_MAX_INTERVAL
+
+    @property
+    def CAPABILITIES_PUSH(self):
+        return self.__CAPABILITIES_PUSH
+
+    @property
+    def DESCRIPTION_WRITE_DELAY(self):
+        return self.__DESCRIPTION_WRITE_DELAY
+
     @property
     def OO_CONSOLE_PRINT(self):
         return self.__OO_CONSOLE_PRINT
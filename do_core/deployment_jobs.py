@@ -0,0 +1,55 @@
+"""
+Background execution of graph deployments (asynchronous mode).
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from do_core.config import Configuration, Singleton
+from do_core.resource_locks import ResourceLocks
+
+
+class DeploymentJobs(object, metaclass=Singleton):
+    """
+    Pool of workers running deployment jobs.
+    Jobs on the same graph are serialized by the graph lock (see ResourceLocks),
+    which is also taken by synchronous operations on the graph.
+    """
+
+    def __init__(self):
+        self.__executor = ThreadPoolExecutor(max_workers=Configuration().DEPLOYMENT_WORKERS)
+        self.__lock = threading.Lock()
+        self.__pending = 0      # jobs queued or running
+
+    def submit(self, graph_id, job, *args):
+        """
+        Queue a job working on the given graph.
+        Errors are only logged: the job itself is in charge of marking the session as failed.
+        :param graph_id: id of the graph the job works on
+        :param job: callable
+        :return: concurrent.futures.Future
+        """
+        def run():
+            try:
+                with ResourceLocks().graph(graph_id):
+                    try:
+                        job(*args)
+                    except Exception as ex:
+                        logging.error("Deployment job on graph " + str(graph_id) + " failed")
+                        logging.exception(ex)
+            finally:
+                with self.__lock:
+                    self.__pending -= 1
+
+        logging.debug("Queued deployment job on graph " + str(graph_id))
+        with self.__lock:
+            self.__pending += 1
+        return self.__executor.submit(run)
+
+    def pending(self):
+        """
+        :return: number of jobs queued or running
+        """
+        with self.__lock:
+            return self.__pending
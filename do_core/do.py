@@ -8,30 +8,40 @@
 from __future__ import division
 import logging
 import copy
+import hashlib
 import json
 import uuid
 import time
+from collections import OrderedDict
 
 
 from do_core.config_manager import ConfigManager
-from domain_information_library.domain_info import DomainInfo
-from nffg_library.nffg import FlowRule as NffgFlowrule, Action as NffgAction, VNF
+from nffg_library.nffg import FlowRule as NffgFlowrule, Action as NffgAction, Match as NffgMatch, VNF
 
 from do_core.config import Configuration
-from do_core.sql.graph_session import GraphSession
+from do_core.sql.graph_session import GraphSession, TUNNEL_SESSION_PREFIX
+from do_core.sql.match_overlap_index import MatchTrie, match_key
 from do_core.resource_description import ResourceDescription
 from do_core.netmanager import NetManager
 from do_core.domain_information_manager import Messaging
+from do_core.deployment_jobs import DeploymentJobs
+from do_core.resource_locks import ResourceLocks
+from do_core.flow_name_allocator import FlowNameAllocator
+from do_core.mpls_label_allocator import MplsLabelAllocator
+from do_core.traffic_engineering import TrafficEngineering
 from do_core.exception import sessionNotFound, GraphError, NffgUselessInformations, MessagingError, \
-    NoPathBetweenSwitches, NoGraphFound
+    NoPathBetweenSwitches, NoGraphFound, IdempotencyConflict
 from requests.exceptions import HTTPError
 
+OFP_MAX_PRIORITY = 65535    # highest priority of an OpenFlow flow
+
 
 class DO(object):
     def __init__(self, user_data):
 
         self.__session_id = None
         self.__print_enabled = Configuration().OO_CONSOLE_PRINT
+        self.__rerouting = None     # flowrule being rerouted: its ingress port and the classifiers held back
 
         self.nffg = None
         self.user_data = user_data
@@ -48,12 +58,45 @@ class DO(object):
         if self.__print_enabled:
             print(msg)
 
-    def post_nffg(self, nffg):
+    def post_nffg(self, nffg, asynchronous=False, idempotency_key=None):
         """
         Manage the request of NF-FG instantiation.
+        In asynchronous mode the graph is just stored here (status 'initialization')
+        and its deployment is queued to the background workers.
+        A request repeating the idempotency key of a previous one returns the graph created by that one.
         """
         logging.debug("POST NF-FG: POST from user " + self.user_data.username + " on tenant " + self.user_data.tenant)
 
+        graph_hash = self.nffg_fingerprint(nffg)
+        if idempotency_key is not None:
+            # concurrent requests with the same key: only the first one stores a new graph
+            with ResourceLocks().idempotency_key(self.user_data.user_id, idempotency_key):
+                session = GraphSession().getUserGraphSessionByIdempotencyKey(self.user_data.user_id, idempotency_key)
+                if session is not None:
+                    if session.graph_hash != graph_hash:
+                        raise IdempotencyConflict("POST NF-FG: idempotency key '" + idempotency_key +
+                                                  "' already used for a different graph")
+                    logging.info("POST NF-FG: graph " + session.graph_id + " already created by this request")
+                    return json.dumps({"nffg-uuid": session.graph_id})
+                self.__storeNewNffg(nffg, graph_hash, idempotency_key)
+        else:
+            self.__storeNewNffg(nffg, graph_hash, None)
+
+        if asynchronous:
+            DeploymentJobs().submit(nffg.id, self.__deploy_nffg, nffg)
+        else:
+            with ResourceLocks().graph(nffg.id):
+                self.__deploy_nffg(nffg)
+
+        # returns the graph id
+        response_uuid = dict()
+        response_uuid["nffg-uuid"] = GraphSession().get_nffg_id_by_session(self.__session_id).graph_id
+        return json.dumps(response_uuid)
+
+    def __storeNewNffg(self, nffg, graph_hash, idempotency_key):
+        """
+        Store a new graph, with a new id, in a new session (status 'initialization').
+        """
         # Instantiate a new NF-FG
         try:
             # choose new id for the graph
@@ -65,8 +108,22 @@ class DO(object):
                     break
 
             logging.info("POST NF-FG: instantiating a new nffg: " + nffg.getJSON(True))
-            self.__session_id = GraphSession().addNFFG(nffg, self.user_data.user_id)
+            self.__session_id = GraphSession().addNFFG(nffg, self.user_data.user_id, graph_hash, idempotency_key)
             logging.info("Session created")
+        except Exception as ex:
+            logging.error(ex)
+            self.__NFFG_NC_deleteGraph()
+            GraphSession().updateError(self.__session_id)
+            raise ex
+
+    def __deploy_nffg(self, nffg):
+        """
+        Deploy a graph already stored in the current session (call it holding the lock of the graph).
+        """
+        if self.__isSessionClosed():
+            logging.info("POST NF-FG: session " + self.__session_id + " closed before its deployment, skipped")
+            return
+        try:
             # Build the Profile Graph
             self.NetManager.ProfileGraph_BuildFromNFFG(nffg)
             self.NetManager.user = self.user_data.username
@@ -102,14 +159,12 @@ class DO(object):
             self.__NFFG_NC_deleteGraph()
             GraphSession().updateError(self.__session_id)
             raise ex
-        # returns the graph id
-        response_uuid = dict()
-        response_uuid["nffg-uuid"] = GraphSession().get_nffg_id_by_session(self.__session_id).graph_id
-        return json.dumps(response_uuid)
 
-    def put_nffg(self, new_nffg, nffg_id):
+    def put_nffg(self, new_nffg, nffg_id, asynchronous=False):
         """
         Update NF-FG.
+        In asynchronous mode the update is queued to the background workers,
+        which mark the session as 'updating' once they hold the lock of the graph.
         """
         logging.debug("Put NF-FG: put from user " + self.user_data.username + " on tenant " + self.user_data.tenant)
         new_nffg.id = str(nffg_id)
@@ -126,6 +181,33 @@ class DO(object):
         self.__session_id = session.session_id
         logging.debug("Update NF-FG: already instantiated, trying to update it")
 
+        graph_hash = self.nffg_fingerprint(new_nffg)
+        if asynchronous:
+            DeploymentJobs().submit(new_nffg.id, self.__update_nffg, new_nffg, graph_hash)
+        else:
+            with ResourceLocks().graph(new_nffg.id):
+                self.__update_nffg(new_nffg, graph_hash)
+
+        # returns the graph id
+        #response_uuid = dict()
+        #response_uuid["nffg-uuid"] = nffg_id
+        #return json.dumps(response_uuid)
+        return nffg_id
+
+    def __update_nffg(self, new_nffg, graph_hash):
+        """
+        Apply the updated graph to the current session.
+        :param graph_hash: fingerprint of the updated graph
+        (call it holding the lock of the graph)
+        """
+        if self.__isSessionClosed():
+            logging.info("Put NF-FG: session " + self.__session_id + " closed before its update, skipped")
+            return
+        # read under the lock: a previous job on the graph may have just changed them
+        session = GraphSession().get_nffg_id_by_session(self.__session_id)
+        if session.status == 'complete' and session.graph_hash == graph_hash:
+            logging.info("Update NF-FG: graph " + new_nffg.id + " not changed, nothing to do")
+            return
         try:
             logging.debug(
                 "Update NF-FG: updating session " + self.__session_id + " from user " + self.user_data.username +
@@ -161,7 +243,7 @@ class DO(object):
             self.__NC_ApplicationsInstantiation()
             logging.debug("Applications activated!")
 
-            GraphSession().updateStatus(self.__session_id, 'complete')
+            GraphSession().updateStatus(self.__session_id, 'complete', graph_hash=graph_hash)
 
             logging.info("Put NF-FG: session " + self.__session_id + " correctly updated!")
 
@@ -180,12 +262,6 @@ class DO(object):
             GraphSession().updateError(self.__session_id)
             raise ex
 
-        # returns the graph id
-        #response_uuid = dict()
-        #response_uuid["nffg-uuid"] = nffg_id
-        #return json.dumps(response_uuid)
-        return nffg_id
-
     def delete_nffg(self, nffg_id):
 
         session = GraphSession().getActiveUserGraphSession(self.user_data.user_id, nffg_id, error_aware=False)
@@ -193,6 +269,11 @@ class DO(object):
             raise sessionNotFound("Delete NF-FG: session not found for graph " + str(nffg_id))
         self.__session_id = session.session_id
 
+        # wait for any deployment job still working on this graph
+        with ResourceLocks().graph(nffg_id):
+            self.__delete_nffg()
+
+    def __delete_nffg(self):
         try:
             instantiated_nffg = GraphSession().getNFFG(self.__session_id)
             logging.debug("Delete NF-FG: [session=" + str(
@@ -213,6 +294,62 @@ class DO(object):
             logging.error("Delete NF-FG: ", ex)
             raise ex
 
+    def reroute_flowrules(self, session_id, graph_flow_rule_ids):
+        """
+        Move flow rules of a deployed graph onto new paths (e.g. their links went down), leaving
+        the rest of the graph alone. Flow rules are moved in batches of REROUTE_BATCH_SIZE:
+        the flows of the new paths are installed first, then the classifiers on the ingress
+        endpoints are replaced and finally the flows of the old paths are removed.
+        :return: number of flow rules rerouted
+        """
+        graph_id = GraphSession().get_nffg_id_by_session(session_id).graph_id
+        rerouted = 0
+        with ResourceLocks().graph(graph_id):
+            self.__session_id = session_id
+            if self.__isSessionClosed():
+                return 0
+            self.NetManager.ProfileGraph_BuildFromNFFG(GraphSession().getNFFG(session_id))
+            flowrules = [flowrule for flowrule in self.NetManager.ProfileGraph.get_ep_flowrules()
+                         if flowrule.id in graph_flow_rule_ids]
+            batch_size = max(Configuration().REROUTE_BATCH_SIZE, 1)
+            for i in range(0, len(flowrules), batch_size):
+                rerouted += self.__NC_RerouteFlowrules(flowrules[i:i + batch_size])
+
+            ResourceDescription().updateAll()
+            ResourceDescription().saveFile()
+        logging.info("Reroute: " + str(rerouted) + " flow rules of the session " + session_id + " rerouted")
+        return rerouted
+
+    def __isSessionClosed(self):
+        """
+        The graph may have been deleted, or may have failed, while a job on it waited for its lock
+        (e.g. a DELETE received after an asynchronous POST): nothing has to be installed for it any more.
+        """
+        session = GraphSession().get_nffg_id_by_session(self.__session_id)
+        return session.ended is not None or session.error is not None
+
+    @staticmethod
+    def nffg_fingerprint(nffg):
+        """
+        Canonical hash of a graph, the same for graphs with the same content
+        whatever their id and the order of their end-points, VNFs and flow rules.
+        :type nffg: nffg_library.nffg.NF_FG
+        :return: sha256 hex digest
+        """
+        def canonical(element):
+            if isinstance(element, dict):
+                return {key: canonical(value) for key, value in element.items()}
+            if isinstance(element, list):
+                items = [canonical(item) for item in element]
+                if all(isinstance(item, dict) and 'id' in item for item in items):
+                    items.sort(key=lambda item: str(item['id']))
+                return items
+            return element
+
+        forwarding_graph = canonical(nffg.getDict()['forwarding-graph'])
+        forwarding_graph.pop('id', None)
+        return hashlib.sha256(json.dumps(forwarding_graph, sort_keys=True).encode('utf-8')).hexdigest()
+
     def get_nffg(self, nffg_id):
         session = GraphSession().getActiveUserGraphSession(self.user_data.user_id, nffg_id, error_aware=True)
         if session is None:
@@ -222,17 +359,27 @@ class DO(object):
         logging.debug("Getting session: " + str(self.__session_id))
         return GraphSession().getNFFG(self.__session_id)
 
+    def get_nffg_json(self, nffg_id):
+        session = GraphSession().getActiveUserGraphSession(self.user_data.user_id, nffg_id, error_aware=True)
+        if session is None:
+            raise sessionNotFound("Get NF-FG: session not found, for graph " + str(nffg_id))
+
+        self.__session_id = session.session_id
+        logging.debug("Getting session: " + str(self.__session_id))
+        return GraphSession().getNFFG_JSON(self.__session_id)
+
     @staticmethod
     def get_nffgs():
 
         logging.debug("Getting all graphs")
         nffgs = {'NF-FG': []}
-        if len(GraphSession().getAllNFFG()) == 0:
+        graphs = GraphSession().getAllNFFG_JSON()
+        if len(graphs) == 0:
             raise sessionNotFound("No active Graph")
-        for graph in GraphSession().getAllNFFG():
+        for graph_id, graph_json in graphs:
             nffg = {}
-            nffg['nffg-uuid'] =  graph["graph_id"]
-            nffg['forwarding-graph'] = (graph["graphDict"].getDict())["forwarding-graph"]
+            nffg['nffg-uuid'] = graph_id
+            nffg['forwarding-graph'] = json.loads(graph_json)["forwarding-graph"]
             nffgs['NF-FG'].append(nffg)
         return nffgs
 
@@ -244,7 +391,9 @@ class DO(object):
         self.__session_id = session.session_id
         percentage = 0
 
-        if session.status != 'error':
+        if session.status == 'complete':
+            percentage = 100
+        elif session.status != 'error':
             percentage = GraphSession().getFlowruleProgressionPercentage(self.__session_id, nffg_id)
 
         logging.debug("Status NF-FG: graph status: " + str(session.status) + " " + str(percentage) + "%")
@@ -279,12 +428,8 @@ class DO(object):
         domain), else raise an error.
         '''
         # VNFs inspections
-        domain_info = DomainInfo.get_from_file(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE)
-        available_functions = []
-        for functional_capability in domain_info.capabilities.functional_capabilities:
-            available_functions.append(functional_capability.type.lower())
         for vnf in nffg.vnfs:
-            if vnf.functional_capability.lower() not in available_functions:
+            if ResourceDescription().getApplicationName(vnf.functional_capability, ignore_case=True) is None:
                 raise_useless_info("The VNF '" + vnf.name + "'with FC'" + vnf.functional_capability +
                                    "' cannot be implemented on this domain")
 
@@ -333,7 +478,8 @@ class DO(object):
             #                         "! Valid vlan ids: "+vids_list)
 
             # Add the endpoint
-            eps['endpoint:' + ep.id] = {"sid": ep.node_id, "pid": ep.interface}
+            eps['endpoint:' + ep.id] = {"sid": ep.node_id, "pid": ep.interface,
+                                        "vid": ep.vlan_id if ep.type == "vlan" else None}
 
         # FLOW RULEs inspection
         for flowrule in nffg.flow_rules:
@@ -385,6 +531,25 @@ class DO(object):
                     vids_list = str(Configuration().VLAN_AVAILABLE_IDS)
                     raise GraphError("Vlan ID " + str(a.set_vlan_id) + " not allowed! Valid vlan ids: " + vids_list)
 
+        # Overlapping flow rules: flow rules with the same priority on the same ingress endpoint must not
+        # match the same packets, the switch would choose one of them arbitrarily.
+        # (flow rules of other graphs are checked when the flows are installed)
+        classifiers = {}
+        for flowrule in nffg.flow_rules:
+            if flowrule.match is None or flowrule.match.port_in not in eps:
+                continue
+            ep = eps[flowrule.match.port_in]
+            match = copy.copy(flowrule.match)
+            if ep['vid'] is not None:
+                match.vlan_id = ep['vid']
+            key = match_key(match)
+            trie = classifiers.setdefault((ep['sid'], ep['pid'], flowrule.priority), MatchTrie())
+            overlapping = trie.overlaps(key)
+            if len(overlapping) > 0:
+                raise GraphError("Flowrule " + str(flowrule.id) + " overlaps the flowrule " +
+                                 str(sorted(overlapping)[0]) + " (same ingress endpoint and priority)")
+            trie.add(key, flowrule.id)
+
         logging.info("Validation completed.")
 
     '''
@@ -399,32 +564,67 @@ class DO(object):
         Delete all endpoints, and related resources.
         Delete all flowrules from database and from the network controller.
         Deactivate all applications implementing graph vnf
+        Resources are read, released and deleted all together, not one by one.
         """
 
-        # TODO the graph is deleted only from the DB, not from the NC
+        resources = GraphSession().getSessionResources(self.__session_id)
 
-        # Endpoints
-        endpoints = GraphSession().getEndpointsBySessionID(self.__session_id)
-        if endpoints is not None:
-            for ep in endpoints:
-                self.__deleteEndpointByID(ep.id)
+        # Gre tunnels
+        for port in resources['gre_ports']:
+            self.__print("[Remove Gre] device:'"+Configuration().GRE_BRIDGE+"' port:'"+port.graph_port_id+"'")
+            logging.debug("[Remove Gre] device:'"+Configuration().GRE_BRIDGE+"' port:'"+port.graph_port_id+"'")
+            if not Configuration().DETACHED_MODE:
+                self.NetManager.delete_gre_tunnel(Configuration().GRE_BRIDGE, port.graph_port_id)
 
-        # Flowrules (maybe will never enter)
-        flowrules = GraphSession().getFlowrules(self.__session_id)
-        if flowrules is not None:
-            for fr in flowrules:
-                self.__deleteFlowRule(fr)
+        # Flowrules: the resource description is updated once, flows are removed per switch
+        ResourceDescription().delete_flowrules([(flow_rule.switch_id, match)
+                                                for flow_rule, match in resources['external_flowrules']])
+        self.__NC_DeleteFlowsPerSwitch([flow_rule for flow_rule, match in resources['external_flowrules']])
+        self.__NC_DeleteGroups(resources['groups'])
 
         # vnfs
-        vnfs = GraphSession().getVnfsBySessionID(self.__session_id)
-        if vnfs is not None:
-            for vnf in vnfs:
-                self.__deleteVnf(vnf)
-                self.__NC_DeactivateApplication(vnf.application_name)
+        for vnf in resources['vnfs']:
+            self.__NC_DeactivateApplication(vnf.application_name)
+
+        # Database
+        GraphSession().deleteSessionResources(self.__session_id)
+
+        # Shared tunnels no longer used by this graph
+        tunnel_users = OrderedDict()
+        for flow_rule, match in resources['external_flowrules']:
+            if flow_rule.tunnel_id is not None:
+                tunnel_users[flow_rule.tunnel_id] = tunnel_users.get(flow_rule.tunnel_id, 0) + 1
+        for tunnel_id, count in tunnel_users.items():
+            self.__NC_ReleaseVlanTunnel(tunnel_id, count)
 
         # End field
         GraphSession().updateEnded(self.__session_id)
 
+    def __NC_DeleteFlowsPerSwitch(self, flow_rules):
+        """
+        Remove external flows from the network controller, with a request per switch.
+        :param flow_rules: FlowRuleModel objects
+        """
+        flows_by_switch = OrderedDict()
+        for flow_rule in flow_rules:
+            if flow_rule.internal_id is not None:
+                flows_by_switch.setdefault((flow_rule.switch_id, flow_rule.table_id or 0), [])\
+                    .append(flow_rule.internal_id)
+        for (switch_id, table_id), flownames in flows_by_switch.items():
+            self.__print("[Remove Flows] count:'" + str(len(flownames)) + "' device:'" + switch_id + "'")
+            logging.debug("[Remove Flows] ids:'" + str(flownames) + "' device:'" + switch_id + "' table:'"
+                          + str(table_id) + "'")
+            if not Configuration().DETACHED_MODE:
+                try:
+                    self.NetManager.deleteFlows(switch_id, flownames, table_id)
+                except Exception as ex:
+                    logging.debug("Exception while deleting external flows in the switch " + switch_id + ".")
+                    raise ex
+                for flowname in flownames:
+                    FlowNameAllocator().release(switch_id, flowname)
+        for flow_rule in flow_rules:
+            MplsLabelAllocator().release(flow_rule.switch_id, flow_rule.mpls_label)
+
     def __NFFG_NC_DeleteAndUpdate(self, updated_nffg):
         """
         Remove all endpoints, flowrules and nf which are marked as 'to_be_deleted'.
@@ -485,10 +685,11 @@ class DO(object):
                 for flow in flows:
                     for action in flow.actions:
                         if action.output is not None:
-                            vnf_port_map[flow.match.port_in.split(':', 2)[2]] = action.output
+                            vnf_port_map[self.NetManager.ProfileGraph.getPortRef(flow.match.port_in)[2]] = action.output
                 # get interface names for endpoints
                 for vnf_port in vnf_port_map:
-                    endpoint = self.NetManager.ProfileGraph.getEndpoint(vnf_port_map[vnf_port].split(':')[1])
+                    endpoint = self.NetManager.ProfileGraph.getEndpoint(
+                        self.NetManager.ProfileGraph.getPortRef(vnf_port_map[vnf_port])[1])
                     if endpoint in updated_endpoints:
                         vnf.status = 'to_be_updated'
                 if vnf.status == 'to_be_updated':
@@ -555,19 +756,13 @@ class DO(object):
             logging.debug("NFFG vnf emulation: " + msg + ". This DO does not process this kind of data.")
             raise NffgUselessInformations("NFFG vnf emulation: " + msg + ". This DO does not process this kind of data.")
 
-        domain_info = DomainInfo.get_from_file(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE)
-
         # [ DETACHED VNFs ]
         for vnf in self.NetManager.ProfileGraph.get_detached_vnfs():
             if vnf.status != 'new':
                 continue
 
             # get the name of the application
-            application_name = ""
-            for capability in domain_info.capabilities.functional_capabilities:
-                if capability.type == vnf.functional_capability.lower():
-                    application_name = capability.name
-                    break
+            application_name = ResourceDescription().getApplicationName(vnf.functional_capability.lower()) or ""
             # we just need to activate the application and to pass as configuration the interfaces
             self.__NC_ProcessDetachedVnf(application_name, vnf)
             logging.debug("Activated application: " + application_name)
@@ -631,14 +826,15 @@ class DO(object):
         for flow in flows:
             for action in flow.actions:
                 if action.output is not None:
-                    vnf_port_map[flow.match.port_in.split(':', 2)[2]] = {
+                    vnf_port_map[self.NetManager.ProfileGraph.getPortRef(flow.match.port_in)[2]] = {
                         'output': action.output,
                         'priority': flow.priority
                     }
 
         # get interface names for endpoints
         for vnf_port in vnf_port_map:
-            endpoint = self.NetManager.ProfileGraph.getEndpoint(vnf_port_map[vnf_port]['output'].split(':')[1])
+            endpoint = self.NetManager.ProfileGraph.getEndpoint(
+                self.NetManager.ProfileGraph.getPortRef(vnf_port_map[vnf_port]['output'])[1])
             priority = vnf_port_map[vnf_port]['priority']
             vnf_port_map[vnf_port] = {
                 'device': endpoint.node_id,
@@ -746,7 +942,23 @@ class DO(object):
 
         # [ 2 ] Endpoints are on different switches...search for a path!
         logging.debug("Endpoint are on different switches, finding a path...")
-        nodes_path = self.NetManager.getShortestPath(in_endpoint.node_id, out_endpoint.node_id)
+        occupancy = GraphSession().getFlowTableOccupancy()
+        link_weight = TrafficEngineering().link_weight()
+
+        # ...or for many paths of the same weight, to spread the packets over them
+        if Configuration().ECMP and not Configuration().JOLNET:
+            paths = [path for path in self.NetManager.getEqualCostPaths(in_endpoint.node_id, out_endpoint.node_id,
+                                                                        Configuration().ECMP_MAX_PATHS, occupancy,
+                                                                        link_weight)
+                     if self.__NC_checkEndpointsOnPath(path, in_endpoint, out_endpoint)]
+            if len(paths) > 1:
+                logging.info("Found " + str(len(paths)) + " equal cost paths between " + in_endpoint.node_id +
+                             " and " + out_endpoint.node_id + ".")
+                self.__NC_LinkEndpointsByGroups(paths, in_endpoint, out_endpoint, flowrule)
+                return
+
+        nodes_path = self.NetManager.getShortestPath(in_endpoint.node_id, out_endpoint.node_id, occupancy,
+                                                     link_weight, Configuration().K_PATHS)
         if nodes_path is not None:
 
             logging.info(
@@ -755,6 +967,15 @@ class DO(object):
             if not self.__NC_checkEndpointsOnPath(nodes_path, in_endpoint, out_endpoint):
                 logging.debug("Invalid link between the endpoints")
                 return
+            if Configuration().PROTECTION and not Configuration().JOLNET:
+                backup_path = self.NetManager.getBackupPath(nodes_path, occupancy, link_weight)
+                if backup_path is not None and self.__NC_checkEndpointsOnPath(backup_path, in_endpoint,
+                                                                               out_endpoint):
+                    self.__NC_LinkEndpointsByProtectedPath(nodes_path, backup_path, in_endpoint, out_endpoint,
+                                                           flowrule)
+                    return
+                logging.warning("No backup path between " + in_endpoint.node_id + " and " + out_endpoint.node_id +
+                                ": flowrule " + flowrule.id + " is not protected")
             self.__NC_LinkEndpointsByVlanID(nodes_path, in_endpoint, out_endpoint, flowrule)
             return
 
@@ -762,6 +983,117 @@ class DO(object):
         logging.debug("Cannot find a link between " + in_endpoint.node_id + " and " + out_endpoint.node_id)
         raise NoPathBetweenSwitches("Cannot find links between " + in_endpoint.node_id + " and " + out_endpoint.node_id)
 
+    def __NC_RerouteFlowrules(self, flowrules):
+        """
+        Make before break: install the new paths of the flowrules, then swap their classifiers
+        and remove the old flows and groups.
+        :return: number of flowrules rerouted
+        """
+        rerouted = []
+        for flowrule in flowrules:
+            old_flowrules = [fr for fr in GraphSession().getFlowrules(self.__session_id, flowrule.id)
+                             if fr.type == 'external']
+            old_groups = GraphSession().getGroups(self.__session_id, flowrule.id)
+            in_endpoint = self.NetManager.ProfileGraph.getEndpoint(self.__getEndpointIdFromString(flowrule.match.port_in))
+            ingress = (in_endpoint.node_id, str(self.NetManager.getPortName(in_endpoint.node_id, in_endpoint.interface)))
+            old_classifiers = [fr for fr in old_flowrules if self.__isClassifier(fr, ingress)]
+
+            self.__rerouting = {'ingress': ingress, 'classifiers': []}
+            try:
+                self.__NC_ProcessFlowrule(in_endpoint, flowrule)
+            except Exception as ex:
+                logging.error("Reroute: cannot move the flow rule " + flowrule.id + ": " + str(ex))
+                self.__NC_DeleteNewFlows(flowrule.id, old_flowrules, old_groups, self.__rerouting['classifiers'])
+                continue
+            finally:
+                classifiers = self.__rerouting['classifiers']
+                self.__rerouting = None
+            rerouted.append((flowrule, classifiers, old_classifiers, old_flowrules, old_groups))
+
+        moved = 0
+        for flowrule, classifiers, old_classifiers, old_flowrules, old_groups in rerouted:
+            if not self.__NC_SwapClassifiers(flowrule, classifiers, old_classifiers, old_flowrules, old_groups):
+                continue
+            moved += 1
+            for fr in old_flowrules:
+                if fr not in old_classifiers:
+                    self.__deleteFlowRule(fr)
+            self.__NC_DeleteGroups(old_groups)
+            for group in old_groups:
+                GraphSession().deleteGroupByID(group.id)
+        return moved
+
+    def __NC_SwapClassifiers(self, flowrule, classifiers, old_classifiers, old_flowrules, old_groups):
+        """
+        Replace the classifiers of a flowrule whose new path is installed, without a window in which
+        none of them forwards its packets: the new classifiers (with the same match of the old ones)
+        are installed at a transient higher priority, taking the traffic over, then the old ones are
+        removed and the new ones installed again at their priority, replacing the transient ones.
+        :return: False if the transient classifiers cannot be installed: the flowrule is left on its old path
+        """
+        transient = []
+        try:
+            for efr, tunnel_id in classifiers:
+                transient_efr = copy.copy(efr)
+                transient_efr.set_priority(self.__transientPriority(efr.get_priority()))
+                transient.append(GraphSession().getFlowruleByID(
+                    self.__Push_externalFlowrule(transient_efr, tunnel_id=tunnel_id)))
+        except Exception as ex:
+            logging.error("Reroute: cannot install the classifiers of the flow rule " + flowrule.id + ": " + str(ex))
+            # the transient classifiers are removed with the new path, releasing their tunnels
+            self.__NC_DeleteNewFlows(flowrule.id, old_flowrules, old_groups, classifiers[len(transient):])
+            return False
+
+        for fr in old_classifiers:
+            self.__deleteFlowRule(fr)
+
+        for (efr, tunnel_id), transient_fr in zip(classifiers, transient):
+            # the transient classifier keeps its own reference to the tunnel until it is removed
+            if tunnel_id is not None:
+                GraphSession().attachVlanTunnel(tunnel_id)
+            try:
+                self.__Push_externalFlowrule(efr, tunnel_id=tunnel_id)
+            except Exception as ex:
+                if tunnel_id is not None:
+                    self.__NC_ReleaseVlanTunnel(tunnel_id)
+                logging.warning("Reroute: the flow rule " + flowrule.id + " keeps its classifier on "
+                                + efr.get_switch_id() + " at priority " + str(transient_fr.priority) + ": " + str(ex))
+                continue
+            self.__deleteFlowRule(transient_fr)
+        return True
+
+    @staticmethod
+    def __transientPriority(priority):
+        if int(priority) >= OFP_MAX_PRIORITY:
+            raise GraphError("No priority higher than " + str(priority) + " for a transient classifier")
+        return int(priority) + 1
+
+    @staticmethod
+    def __isClassifier(flow_rule_ref, ingress):
+        # flow_rule_ref is a FlowRuleModel object, ingress the (switch id, port) of the ingress endpoint
+        if flow_rule_ref.switch_id != ingress[0] or (flow_rule_ref.table_id or 0) != 0:
+            return False
+        match = GraphSession().getMatchByFlowruleID(flow_rule_ref.id)
+        return match is not None and str(match.port_in) == ingress[1]
+
+    def __NC_DeleteNewFlows(self, graph_flow_rule_id, old_flowrules, old_groups, classifiers):
+        """
+        Remove what a reroute that failed installed for a flowrule, keeping its old flows and groups.
+        """
+        old_ids = set(fr.id for fr in old_flowrules)
+        for fr in GraphSession().getFlowrules(self.__session_id, graph_flow_rule_id):
+            if fr.type == 'external' and fr.id not in old_ids:
+                self.__deleteFlowRule(fr)
+        for efr, tunnel_id in classifiers:
+            if tunnel_id is not None:
+                self.__NC_ReleaseVlanTunnel(tunnel_id)
+        old_ids = set(group.id for group in old_groups)
+        groups = [group for group in GraphSession().getGroups(self.__session_id, graph_flow_rule_id)
+                  if group.id not in old_ids]
+        self.__NC_DeleteGroups(groups)
+        for group in groups:
+            GraphSession().deleteGroupByID(group.id)
+
     def __NC_CheckFlowruleOnEndpoint(self, in_endpoint, flowrule):
         """
         Check if the flowrule can be installed on the ingress endpoint.
@@ -771,9 +1103,17 @@ class DO(object):
         if GraphSession().isDirectEndpoint(in_endpoint.interface, in_endpoint.node_id):
             raise GraphError("The ingress endpoint " + in_endpoint.id + " is a busy direct endpoint")
 
-        # Flowrule collision
-        qref = GraphSession().getFlowruleOnTheSwitch(in_endpoint.node_id, in_endpoint.interface, flowrule)
-        if qref is not None:
+        # Flowrule collision (a flowrule being rerouted collides with its old classifier)
+        if self.__rerouting is not None:
+            return
+        # flows on the ingress port matching some of the same packets with the same priority:
+        # the classifiers match the port of the interface, flows dropping packets the interface itself
+        overlapping = set()
+        for port_in in set([in_endpoint.interface,
+                            str(self.NetManager.getPortName(in_endpoint.node_id, in_endpoint.interface))]):
+            overlapping.update(GraphSession().getMatchOverlapIndex().overlapping(in_endpoint.node_id, port_in,
+                                                                                 flowrule.priority, flowrule.match))
+        if len(overlapping) > 0:
             raise GraphError(
                 "Flowrule " + flowrule.id + " collides with an another flowrule on the ingress port (ingress endpoint " + in_endpoint.id + ").")
 
@@ -804,14 +1144,27 @@ class DO(object):
         conflicts in the traversed switches.
         """
 
+        # Vlan ids are chosen on the ingress ports of the path and become busy only when the flow rule
+        # of the next hop is stored: these ports are locked until the whole path is installed.
+        ingress_ports = [(epIN.node_id, self.NetManager.getPortName(epIN.node_id, epIN.interface))]
+        for i in range(1, len(path)):
+            ingress_ports.append((path[i], self.NetManager.switchPortIn(path[i], path[i - 1])))
+
+        with ResourceLocks().ports(*ingress_ports):
+            self.__NC_LinkEndpointsOnPath(path, epIN, epOUT, flowrule)
+
+    def __NC_LinkEndpointsOnPath(self, path, epIN, epOUT, flowrule):
+
+        if not Configuration().JOLNET and (Configuration().MULTI_TABLE_PIPELINE or
+                                           ((Configuration().SHARED_VLAN_TUNNELS or
+                                             self.__isMplsTagged(flowrule)) and len(path) > 1)):
+            self.__NC_LinkEndpointsByTunnel(path, epIN, epOUT, flowrule)
+            return
+
         efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority, nffg_flowrule=flowrule)
 
-        base_actions = []
-        action_push_vlan_out = None
-        action_set_vlan_out = None
         # action_original_vlan_out = None
         match_vlan_in = None
-        action_pop_vlan = False
 
         internal_path_vlan_in = None
         # internal_path_vlan_out = None
@@ -822,28 +1175,7 @@ class DO(object):
             # action_original_vlan_out = match_vlan_in
 
         # Clean actions, search for an egress vlan id and pop vlan action
-        for a in flowrule.actions:
-
-            # [PUSH VLAN (ID)] Store the VLAN ID and remove the action
-            if a.push_vlan is not None:
-                action_push_vlan_out = a.push_vlan
-                # action_original_vlan_out = a.push_vlan
-                continue
-
-            # [SET VLAN ID] Store the VLAN ID and remove the action
-            if a.set_vlan_id is not None:
-                action_set_vlan_out = a.set_vlan_id
-                # action_original_vlan_out = a.set_vlan_id
-                continue
-
-            # [POP VLAN] Set the flag and remove the action
-            if a.pop_vlan is not None and a.pop_vlan:
-                action_pop_vlan = True
-                continue
-
-            # Filter non OUTPUT actions
-            if a.output is None:
-                base_actions.append(copy.copy(a))
+        base_actions, action_push_vlan_out, action_set_vlan_out, action_pop_vlan = self.__splitFlowruleActions(flowrule)
 
         ''' Remember to pop vlan header by the last switch.
             If vlan out is not None, a pushvlan/setvlan action is present, and popvlan action is incompatible.
@@ -906,18 +1238,24 @@ class DO(object):
 
             # Check, generate and set vlan ids
             # Gabriele: i didn't understand the utility of the second return value
-            internal_path_vlan_out, set_vlan_out = self.__checkAndSetVlanIDs(next_switch_id, next_switch_port_in,
-                                                                             flowrule.match, internal_path_vlan_in)
+            # (with minimal matches the next switch matches only port and vlan: the vlan must be free on the port)
+            internal_path_vlan_out, set_vlan_out = self.__checkAndSetVlanIDs(
+                next_switch_id, next_switch_port_in,
+                None if Configuration().MINIMAL_TRANSIT_MATCHES else flowrule.match, internal_path_vlan_in)
 
             # [MATCH]
-            base_nffg_match = copy.copy(flowrule.match)
+            if Configuration().MINIMAL_TRANSIT_MATCHES and (pos == 0 or pos == 1):
+                # middle and last switches: the internal vlan already identifies the path
+                base_nffg_match = NffgMatch(vlan_id=internal_path_vlan_in)
+            else:
+                base_nffg_match = copy.copy(flowrule.match)
 
-            # VLAN In
-            if match_vlan_in is not None:
-                base_nffg_match.vlan_id = match_vlan_in
+                # VLAN In
+                if match_vlan_in is not None:
+                    base_nffg_match.vlan_id = match_vlan_in
 
-            if internal_path_vlan_in is not None:
-                base_nffg_match.vlan_id = internal_path_vlan_in
+                if internal_path_vlan_in is not None:
+                    base_nffg_match.vlan_id = internal_path_vlan_in
 
             # [ACTIONS]
 
@@ -982,6 +1320,445 @@ class DO(object):
             efr.append_action(NffgAction(output=port_out))
             self.__Push_externalFlowrule(efr)
 
+    @staticmethod
+    def __splitFlowruleActions(flowrule):
+        """
+        Separate the vlan actions of a flowrule from the others (output actions are dropped).
+        :return: other actions, push vlan id, set vlan id, pop vlan flag
+        """
+        base_actions = []
+        action_push_vlan_out = None
+        action_set_vlan_out = None
+        action_pop_vlan = False
+        for a in flowrule.actions:
+
+            # [PUSH VLAN (ID)] Store the VLAN ID and remove the action
+            if a.push_vlan is not None:
+                action_push_vlan_out = a.push_vlan
+                continue
+
+            # [SET VLAN ID] Store the VLAN ID and remove the action
+            if a.set_vlan_id is not None:
+                action_set_vlan_out = a.set_vlan_id
+                continue
+
+            # [POP VLAN] Set the flag and remove the action
+            if a.pop_vlan is not None and a.pop_vlan:
+                action_pop_vlan = True
+                continue
+
+            # Filter non OUTPUT actions
+            if a.output is None:
+                base_actions.append(copy.copy(a))
+        return base_actions, action_push_vlan_out, action_set_vlan_out, action_pop_vlan
+
+    def __egressActions(self, flowrule, epOUT):
+        """
+        Actions of the last switch of a path tagged with an internal vlan: pop it, apply the actions
+        of the flowrule and output to the egress endpoint.
+        :return: egress actions, pop vlan flag of the flowrule (to apply on the first switch)
+        """
+        base_actions, action_push_vlan_out, action_set_vlan_out, action_pop_vlan = self.__splitFlowruleActions(flowrule)
+        egress_actions = [NffgAction(pop_vlan=True)] + base_actions
+        if action_push_vlan_out:
+            egress_actions.append(NffgAction(push_vlan=True))
+            egress_actions.append(NffgAction(set_vlan_id=action_push_vlan_out))
+        if action_set_vlan_out:
+            egress_actions.append(NffgAction(set_vlan_id=action_set_vlan_out))
+        if epOUT.type == 'vlan':
+            egress_actions.append(NffgAction(push_vlan=True))
+            egress_actions.append(NffgAction(set_vlan_id=epOUT.vlan_id))
+        egress_actions.append(NffgAction(output=self.NetManager.getPortName(epOUT.node_id, epOUT.interface)))
+        return egress_actions, action_pop_vlan
+
+    @staticmethod
+    def __isMplsTagged(flowrule):
+        """
+        Paths are tagged with MPLS labels (path_tagging = mpls) only for the flowrules matching an ether_type:
+        the last switch pops the label setting it back, it cannot be guessed for the other packets (e.g. ARP,
+        IPv6), whose paths are tagged with vlans.
+        """
+        return Configuration().PATH_TAGGING == 'mpls' and flowrule.match.ether_type is not None
+
+    def __NC_LinkEndpointsByTunnel(self, path, epIN, epOUT, flowrule):
+        """
+        Link two endpoints through an internal vlan tunnel, shared with the other flowrules
+        reaching the same egress endpoint along the same path, with the same egress actions.
+        Only the classifier on the first switch belongs to this flowrule: it pushes the vlan
+        of the tunnel, which is set up by its first flowrule and removed with the last one.
+        With the multi table pipeline the classifier is in table 0 and goes to table 1, where
+        the tunnel starts: flowrules entering the path from the same port share its forwarding.
+        With path_tagging = mpls the classifier pushes an MPLS label instead of the vlan; the tunnel
+        is shared only with shared_tunnels (or the multi table pipeline), like the vlan ones.
+        """
+        multi_table = Configuration().MULTI_TABLE_PIPELINE
+        mpls = self.__isMplsTagged(flowrule)
+        ingress_port = self.NetManager.getPortName(epIN.node_id, epIN.interface)
+
+        # [Egress actions] the same for all the flowrules sharing the tunnel
+        egress_actions, action_pop_vlan = self.__egressActions(flowrule, epOUT)
+        # the egress switch pops the label restoring the ethernet type of the packets classified
+        ether_type = flowrule.match.ether_type
+
+        tunnel_key = [path, [a.getDict() for a in egress_actions]]
+        if multi_table:
+            tunnel_key += ['multi-table', ingress_port]
+        if mpls:
+            tunnel_key += ['mpls', str(ether_type)]
+            if not multi_table and not Configuration().SHARED_VLAN_TUNNELS:
+                tunnel_key += [self.__session_id, flowrule.id]
+        tunnel_key = hashlib.sha256(json.dumps(tunnel_key, sort_keys=True).encode('utf-8')).hexdigest()
+
+        # [Tunnel] the ingress ports of the path are locked: no one else is setting it up
+        tunnel = GraphSession().getVlanTunnel(tunnel_key)
+        if tunnel is not None and GraphSession().attachVlanTunnel(tunnel.id):
+            tunnel_id = tunnel.id
+            tunnel_vlan = tunnel.vlan_in
+            logging.debug("[Shared Tunnel] id:'" + str(tunnel_id) + "' vlan:'" + str(tunnel_vlan) + "'")
+        else:
+            tunnel_id, tunnel_vlan = self.__NC_VlanTunnelSetUp(tunnel_key, path, flowrule.priority, egress_actions,
+                                                               ingress_port if multi_table else None,
+                                                               ether_type if mpls else None)
+
+        # [Classifier] on the first switch
+        try:
+            efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority,
+                                                   nffg_flowrule=flowrule)
+            efr.set_flow_name(0)
+            efr.set_switch_id(epIN.node_id)
+            if epIN.type == 'vlan':
+                efr.append_action(NffgAction(pop_vlan=True))
+            if action_pop_vlan:
+                efr.append_action(NffgAction(pop_vlan=True))
+            if mpls:
+                efr.append_push_mpls()
+                efr.append_set_mpls_label(tunnel_vlan)
+            else:
+                efr.append_action(NffgAction(push_vlan=True))
+                efr.append_action(NffgAction(set_vlan_id=tunnel_vlan))
+            if multi_table:
+                efr.set_goto_table(1)
+            else:
+                efr.append_action(NffgAction(output=self.NetManager.switchPortOut(path[0], path[1])))
+            nffg_match = copy.copy(flowrule.match)
+            nffg_match.port_in = ingress_port
+            efr.set_match(nffg_match)
+            self.__Push_externalFlowrule(efr, tunnel_id=tunnel_id)
+        except Exception:
+            self.__NC_ReleaseVlanTunnel(tunnel_id)
+            raise
+
+    def __NC_VlanTunnelSetUp(self, tunnel_key, path, priority, egress_actions, ingress_port=None, ether_type=None):
+        """
+        Push the flows of a new tunnel on all the switches of the path but the first one.
+        Transit flows only match the ingress port and the vlan of the tunnel.
+        With an ingress port (multi table pipeline) the tunnel starts on the first switch, in table 1.
+        With an ether_type (path_tagging = mpls) the tunnel is tagged with MPLS labels free on each switch,
+        swapped where the next switch needs another one: the last switch pops the label, restoring ether_type.
+        :return: the tunnel id and the vlan id (or MPLS label) to push to enter it
+        """
+        mpls = ether_type is not None
+        tunnel_id = GraphSession().addVlanTunnel(tunnel_key)
+        session_id = TUNNEL_SESSION_PREFIX + str(tunnel_id)
+        pending_labels = []     # (switch id, label) reserved for flows not stored yet
+        try:
+            if ingress_port is not None:
+                first = 0
+                port_in = ingress_port
+            else:
+                first = 1
+                port_in = self.NetManager.switchPortIn(path[1], path[0])
+            if mpls:
+                vlan_in = self.__getFreeMplsLabelOnSwitch(path[first])
+                pending_labels.append((path[first], vlan_in))
+            else:
+                vlan_in = self.__getFreeTunnelVlanOnSwitch(path[first], port_in)
+            tunnel_vlan = vlan_in
+            for i in range(first, len(path)):
+                if i < len(path) - 1:
+                    next_port_in = self.NetManager.switchPortIn(path[i + 1], path[i])
+                    if mpls:
+                        vlan_out = self.__getFreeMplsLabelOnSwitch(path[i + 1], vlan_in)
+                        pending_labels.append((path[i + 1], vlan_out))
+                    else:
+                        vlan_out = self.__getFreeTunnelVlanOnSwitch(path[i + 1], next_port_in, vlan_in)
+                    actions = []
+                    if vlan_out != vlan_in and not mpls:
+                        actions.append(NffgAction(set_vlan_id=vlan_out))
+                    actions.append(NffgAction(output=self.NetManager.switchPortOut(path[i], path[i + 1])))
+                else:
+                    next_port_in = None
+                    vlan_out = None
+                    actions = egress_actions
+
+                nffg_match = NffgMatch(port_in=port_in, vlan_id=None if mpls else vlan_in)
+                efr = self.NetManager.externalFlowrule(
+                    flow_id=session_id, priority=priority,
+                    nffg_flowrule=NffgFlowrule(_id=session_id, priority=priority, match=nffg_match))
+                efr.set_flow_name(i)
+                efr.set_switch_id(path[i])
+                if i == 0:
+                    efr.set_table_id(1)
+                if mpls:
+                    efr.set_match_mpls_label(vlan_in)
+                efr.set_match(nffg_match)
+                if mpls:
+                    # the pop of the label replaces the pop of the vlan the egress actions start with
+                    efr.set_actions(None)
+                    if vlan_out is None:
+                        efr.append_pop_mpls(ether_type)
+                        actions = actions[1:]
+                    elif vlan_out != vlan_in:
+                        efr.append_set_mpls_label(vlan_out)
+                    for action in actions:
+                        efr.append_action(action)
+                else:
+                    efr.set_actions(actions)
+                self.__Push_externalFlowrule(efr, session_id=session_id, tunnel_id=tunnel_id)
+                if mpls:
+                    pending_labels.remove((path[i], vlan_in))
+
+                port_in = next_port_in
+                vlan_in = vlan_out
+
+            GraphSession().updateVlanTunnel(tunnel_id, tunnel_vlan)
+        except Exception:
+            for switch_id, label in pending_labels:
+                MplsLabelAllocator().release(switch_id, label)
+            self.__NC_VlanTunnelTearDown(tunnel_id)
+            raise
+
+        self.__print("[New Tunnel] id:'" + str(tunnel_id) + "' vlan:'" + str(tunnel_vlan) + "' path:'" + str(path) + "'")
+        logging.debug("[New Tunnel] id:'" + str(tunnel_id) + "' vlan:'" + str(tunnel_vlan) + "' path:'" + str(path) + "'")
+        return tunnel_id, tunnel_vlan
+
+    def __NC_LinkEndpointsByGroups(self, paths, epIN, epOUT, flowrule):
+        """
+        Link two endpoints over many paths of the same weight: the switches where the paths diverge
+        send the packets to a SELECT group, which picks one of the next hops for each packet.
+        The paths are tagged with the same internal vlan, free on all their ingress ports: only the
+        classifier on the first switch matches the whole match of the flowrule.
+        """
+        next_hops = OrderedDict()
+        previous_hops = OrderedDict()
+        for path in paths:
+            for switch_id, next_switch_id in zip(path, path[1:]):
+                if next_switch_id not in next_hops.setdefault(switch_id, []):
+                    next_hops[switch_id].append(next_switch_id)
+                if switch_id not in previous_hops.setdefault(next_switch_id, []):
+                    previous_hops[next_switch_id].append(switch_id)
+
+        ingress_port = self.NetManager.getPortName(epIN.node_id, epIN.interface)
+        transit_ports = [(switch_id, self.NetManager.switchPortIn(switch_id, previous_switch_id))
+                         for switch_id, hops in previous_hops.items() for previous_switch_id in hops]
+
+        with ResourceLocks().ports((epIN.node_id, ingress_port), *transit_ports):
+            busy_vlan_ids = set()
+            for switch_id, port_in in transit_ports:
+                busy_vlan_ids.update(GraphSession().getBusyVlanInOnThePort(switch_id, port_in))
+            vlan_id = self.__getFirstFreeVlan(busy_vlan_ids)
+            if vlan_id is None:
+                raise GraphError("No free vlan ids on the paths of the flowrule " + flowrule.id)
+            egress_actions, action_pop_vlan = self.__egressActions(flowrule, epOUT)
+
+            # [Groups] before the flows sending packets to them
+            groups = {}
+            for switch_id, hops in next_hops.items():
+                if len(hops) > 1:
+                    groups[switch_id] = self.__NC_CreateGroup(
+                        flowrule.id, switch_id, [self.NetManager.switchPortOut(switch_id, hop) for hop in hops])
+
+            # [Classifier] on the first switch
+            efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority,
+                                                   nffg_flowrule=flowrule)
+            efr.set_flow_name(0)
+            efr.set_switch_id(epIN.node_id)
+            if epIN.type == 'vlan':
+                efr.append_action(NffgAction(pop_vlan=True))
+            if action_pop_vlan:
+                efr.append_action(NffgAction(pop_vlan=True))
+            efr.append_action(NffgAction(push_vlan=True))
+            efr.append_action(NffgAction(set_vlan_id=vlan_id))
+            self.__forwardToNextHops(efr, epIN.node_id, next_hops, groups)
+            nffg_match = copy.copy(flowrule.match)
+            nffg_match.port_in = ingress_port
+            efr.set_match(nffg_match)
+            self.__Push_externalFlowrule(efr)
+
+            # [Transit and egress] a flow for each link entering the switch
+            flow_name = 1
+            for switch_id, port_in in transit_ports:
+                efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority,
+                                                       nffg_flowrule=flowrule)
+                efr.set_flow_name(flow_name)
+                efr.set_switch_id(switch_id)
+                efr.set_match(NffgMatch(port_in=port_in, vlan_id=vlan_id))
+                if switch_id == epOUT.node_id:
+                    efr.set_actions(egress_actions)
+                else:
+                    self.__forwardToNextHops(efr, switch_id, next_hops, groups)
+                self.__Push_externalFlowrule(efr)
+                flow_name += 1
+
+    def __NC_LinkEndpointsByProtectedPath(self, path, backup_path, epIN, epOUT, flowrule):
+        """
+        Link two endpoints along a path protected by a backup path not sharing links with it.
+        Every switch of the path but the last one sends the packets to a FAST_FAILOVER group:
+         - on the first switch the group outputs to the next hop or, if that link is down, to the backup path;
+         - on the others it outputs to the next hop or, if that link is down, back to the previous hop
+           (crankback): the packets go back along the path up to the first switch, which sends them
+           on the backup path.
+        Primary, crankback and backup flows enter different ports and are tagged with the same
+        internal vlan, free on all of them: only the classifier matches the whole match of the flowrule.
+        """
+        ingress_port = self.NetManager.getPortName(epIN.node_id, epIN.interface)
+        last = len(path) - 1
+        primary_ports = [self.NetManager.switchPortIn(path[i], path[i - 1]) for i in range(1, last + 1)]
+        crankback_ports = [self.NetManager.switchPortIn(path[i], path[i + 1]) for i in range(0, last - 1)]
+        backup_ports = [self.NetManager.switchPortIn(backup_path[j], backup_path[j - 1])
+                        for j in range(1, len(backup_path))]
+        tagged_ports = list(zip(path[1:], primary_ports)) + list(zip(path[:last - 1], crankback_ports)) + \
+            list(zip(backup_path[1:], backup_ports))
+
+        with ResourceLocks().ports((epIN.node_id, ingress_port), *tagged_ports):
+            busy_vlan_ids = set()
+            for switch_id, port_in in tagged_ports:
+                busy_vlan_ids.update(GraphSession().getBusyVlanInOnThePort(switch_id, port_in))
+            vlan_id = self.__getFirstFreeVlan(busy_vlan_ids)
+            if vlan_id is None:
+                raise GraphError("No free vlan ids on the paths of the flowrule " + flowrule.id)
+            egress_actions, action_pop_vlan = self.__egressActions(flowrule, epOUT)
+
+            # [Groups] before the flows sending packets to them
+            groups = {}
+            for i in range(0, last):
+                next_port = self.NetManager.switchPortOut(path[i], path[i + 1])
+                if i == 0:
+                    backup_port = self.NetManager.switchPortOut(backup_path[0], backup_path[1])
+                    groups[path[i]] = self.__NC_CreateGroup(flowrule.id, path[i], [next_port, backup_port],
+                                                            failover=True)
+                else:
+                    groups[path[i]] = self.__NC_CreateGroup(flowrule.id, path[i],
+                                                            [next_port, self.NetManager.IN_PORT], failover=True,
+                                                            watch_ports=[next_port, primary_ports[i - 1]])
+
+            # [Classifier] on the first switch
+            efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority,
+                                                   nffg_flowrule=flowrule)
+            efr.set_flow_name(0)
+            efr.set_switch_id(epIN.node_id)
+            if epIN.type == 'vlan':
+                efr.append_action(NffgAction(pop_vlan=True))
+            if action_pop_vlan:
+                efr.append_action(NffgAction(pop_vlan=True))
+            efr.append_action(NffgAction(push_vlan=True))
+            efr.append_action(NffgAction(set_vlan_id=vlan_id))
+            efr.set_group_id(groups[path[0]])
+            nffg_match = copy.copy(flowrule.match)
+            nffg_match.port_in = ingress_port
+            efr.set_match(nffg_match)
+            self.__Push_externalFlowrule(efr)
+
+            # [Primary, crankback and backup flows] (switch, ingress port, actions, group)
+            flows = []
+            for i in range(1, last + 1):
+                if i == last:
+                    flows.append((path[i], primary_ports[i - 1], egress_actions, None))
+                else:
+                    flows.append((path[i], primary_ports[i - 1], [], groups[path[i]]))
+            for i in range(0, last - 1):
+                if i == 0:
+                    output = self.NetManager.switchPortOut(backup_path[0], backup_path[1])
+                else:
+                    output = self.NetManager.switchPortOut(path[i], path[i - 1])
+                flows.append((path[i], crankback_ports[i], [NffgAction(output=output)], None))
+            for j in range(1, len(backup_path)):
+                if j == len(backup_path) - 1:
+                    flows.append((backup_path[j], backup_ports[j - 1], egress_actions, None))
+                else:
+                    output = self.NetManager.switchPortOut(backup_path[j], backup_path[j + 1])
+                    flows.append((backup_path[j], backup_ports[j - 1], [NffgAction(output=output)], None))
+
+            flow_name = 1
+            for switch_id, port_in, actions, group_id in flows:
+                efr = self.NetManager.externalFlowrule(flow_id=flowrule.id, priority=flowrule.priority,
+                                                       nffg_flowrule=flowrule)
+                efr.set_flow_name(flow_name)
+                efr.set_switch_id(switch_id)
+                efr.set_match(NffgMatch(port_in=port_in, vlan_id=vlan_id))
+                efr.set_actions(actions)
+                efr.set_group_id(group_id)
+                self.__Push_externalFlowrule(efr)
+                flow_name += 1
+
+        logging.debug("[Protected Path] flowrule:'" + flowrule.id + "' path:'" + str(path) + "' backup:'"
+                      + str(backup_path) + "'")
+
+    def __forwardToNextHops(self, efr, switch_id, next_hops, groups):
+        if switch_id in groups:
+            efr.set_group_id(groups[switch_id])
+        else:
+            efr.append_action(NffgAction(output=self.NetManager.switchPortOut(switch_id, next_hops[switch_id][0])))
+
+    def __NC_CreateGroup(self, graph_flow_rule_id, switch_id, output_ports, failover=False, watch_ports=None):
+        """
+        Install a SELECT (or FAST_FAILOVER) group on the switch, with a bucket for each output port.
+        :return: the group id, chosen among the ones not used on the switch
+        """
+        with ResourceLocks().switch(switch_id):
+            group_id = GraphSession().getNextGroupID(switch_id)
+            if not Configuration().DETACHED_MODE:
+                self.NetManager.createGroup(switch_id, group_id, output_ports, failover, watch_ports)
+            GraphSession().addGroup(self.__session_id, graph_flow_rule_id, switch_id, group_id)
+        self.__print("[New Group] id:'" + str(group_id) + "' device:'" + switch_id + "' ports:'" + str(output_ports) + "'")
+        logging.debug("[New Group] id:'" + str(group_id) + "' device:'" + switch_id + "' ports:'" + str(output_ports) + "'")
+        return group_id
+
+    def __NC_DeleteGroups(self, groups):
+        """
+        Remove groups from the network controller (after the flows using them).
+        :param groups: GroupModel objects
+        """
+        for group in groups:
+            self.__print("[Remove Group] id:'" + str(group.group_id) + "' device:'" + group.switch_id + "'")
+            logging.debug("[Remove Group] id:'" + str(group.group_id) + "' device:'" + group.switch_id + "'")
+            if Configuration().DETACHED_MODE:
+                continue
+            try:
+                self.NetManager.deleteGroup(group.switch_id, group.group_id)
+            except HTTPError as err:
+                if err.response.status_code != 404:
+                    raise
+                logging.debug("Group " + str(group.group_id) + " does not exist in the switch " + group.switch_id + ".")
+
+    def __NC_ReleaseVlanTunnel(self, tunnel_id, count=1):
+        """
+        A flowrule no longer enters the tunnel: remove it if it was the last one.
+        """
+        if GraphSession().releaseVlanTunnel(tunnel_id, count):
+            self.__NC_VlanTunnelTearDown(tunnel_id)
+
+    def __NC_VlanTunnelTearDown(self, tunnel_id):
+        session_id = TUNNEL_SESSION_PREFIX + str(tunnel_id)
+        self.__NC_DeleteFlowsPerSwitch(GraphSession().getFlowrules(session_id))
+        GraphSession().deleteSessionResources(session_id)
+        GraphSession().deleteVlanTunnel(tunnel_id)
+        self.__print("[Remove Tunnel] id:'" + str(tunnel_id) + "'")
+        logging.debug("[Remove Tunnel] id:'" + str(tunnel_id) + "'")
+
+    def __getFreeTunnelVlanOnSwitch(self, switch_id, port_in, vlan_in=None):
+        free_vlan_id = self.__getFreeVlanOnSwitch(switch_id, port_in, None, vlan_in)
+        if free_vlan_id is None:
+            raise GraphError("No free vlan ids on the switch " + switch_id)
+        return free_vlan_id
+
+    def __getFreeMplsLabelOnSwitch(self, switch_id, label_in=None):
+        # the label is reserved at once: release it if no flow matching it is stored
+        free_label = MplsLabelAllocator().allocate(switch_id, label_in)
+        if free_label is None:
+            raise GraphError("No free mpls labels on the switch " + switch_id)
+        return free_label
+
     def __checkAndSetVlanIDs(self, switch_id, port_in, nffg_match, vlan_in=None):
         """
         Receives the main parameters for a "vlan based" flow rule.
@@ -1009,8 +1786,20 @@ class DO(object):
         return previous_vlan_out, set_previous_vlan_out
 
     def __getFreeVlanOnSwitch(self, switch_id, port_in, nffg_match, vlan_in=None):
-        busy_vlan_ids = GraphSession().getBusyVlanInOnTheSwitch(switch_id, port_in, nffg_match)
+        """
+        Choose a vlan id not matched on the port by flows that may match the same packets.
+        With nffg_match None the flow will match only port and vlan: the vlan id has to be unused by any flow.
+        """
+        # vlan ids of the flows whose match overlaps nffg_match but for the vlan (any flow, with nffg_match None)
+        busy_vlan_ids = GraphSession().getMatchOverlapIndex().overlapping_vlan_ids(switch_id, port_in, nffg_match)
+
+        return self.__getFirstFreeVlan(busy_vlan_ids, vlan_in)
 
+    @staticmethod
+    def __getFirstFreeVlan(busy_vlan_ids, vlan_in=None):
+        """
+        :return: vlan_in if not busy, otherwise the first allowed vlan id not busy (None if all of them are)
+        """
         if vlan_in is not None and vlan_in not in busy_vlan_ids:
             return vlan_in
 
@@ -1034,6 +1823,10 @@ class DO(object):
         if flowrules is not None:
             for fr in flowrules:
                 self.__deleteFlowRule(fr)
+        groups = GraphSession().getGroups(self.__session_id, graph_flow_rule_id)
+        self.__NC_DeleteGroups(groups)
+        for group in groups:
+            GraphSession().deleteGroupByID(group.id)
 
     def __deleteFlowRuleByID(self, flow_rule_id):
         fr = GraphSession().getFlowruleByID(flow_rule_id)
@@ -1058,7 +1851,8 @@ class DO(object):
 
                 # CONTROLLER
                 if not Configuration().DETACHED_MODE:
-                    self.NetManager.deleteFlow(flow_rule_ref.switch_id, flow_rule_ref.internal_id)
+                    self.NetManager.deleteFlow(flow_rule_ref.switch_id, flow_rule_ref.internal_id,
+                                               flow_rule_ref.table_id or 0)
             except HTTPError as err:
                 if err.response.status_code == 404:
                     logging.debug("External flow " + flow_rule_ref.internal_id + " does not exist in the switch "
@@ -1067,7 +1861,11 @@ class DO(object):
                 logging.debug("Exception while deleting external flow " + flow_rule_ref.internal_id + " in the switch "
                               + flow_rule_ref.switch_id + ".")
                 raise ex
+            FlowNameAllocator().release(flow_rule_ref.switch_id, flow_rule_ref.internal_id)
         GraphSession().deleteFlowruleByID(flow_rule_ref.id)
+        MplsLabelAllocator().release(flow_rule_ref.switch_id, flow_rule_ref.mpls_label)
+        if flow_rule_ref.tunnel_id is not None and not flow_rule_ref.session_id.startswith(TUNNEL_SESSION_PREFIX):
+            self.__NC_ReleaseVlanTunnel(flow_rule_ref.tunnel_id)
 
     def __deletePortByID(self, port_id):
         GraphSession().deletePort(port_id, self.__session_id)
@@ -1117,7 +1915,7 @@ class DO(object):
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
     '''
 
-    def __Push_externalFlowrule(self, efr):
+    def __Push_externalFlowrule(self, efr, session_id=None, tunnel_id=None):
         # efr = NetManager.externalFlowrule
         """
         This is the only function that should be used to push an external flow
@@ -1126,36 +1924,54 @@ class DO(object):
         and in GraphSession().addNFFG to store the flow rules written in nffg.json.
         """
 
+        # Classifiers of a flowrule being rerouted replace the old ones once its new path is installed
+        if self.__rerouting is not None and session_id is None and efr.get_table_id() == 0 \
+                and (efr.get_switch_id(), str(efr.getNffgMatch().port_in)) == self.__rerouting['ingress']:
+            self.__rerouting['classifiers'].append((efr, tunnel_id))
+            return None
+
+        # Collision check, flow name and storage must not interleave with other pushes on the same switch
+        with ResourceLocks().switch(efr.get_switch_id()):
+            return self.__Push_externalFlowruleOnLockedSwitch(efr, session_id or self.__session_id, tunnel_id)
+
+    def __Push_externalFlowruleOnLockedSwitch(self, efr, session_id, tunnel_id):
         nffg_match = efr.getNffgMatch()
         nffg_actions = efr.getNffgAction()
-        nffg_flowrule = NffgFlowrule(match=nffg_match, actions=nffg_actions)
 
         '''
-        Check if exists a flowrule with the same match criteria in the same switch (very rare event);
+        Check if exists a flowrule with an overlapping match and the same priority in the same switch;
         If it exists, raise an exception!
-        Similar flow rules are replaced by ovs switch, so one of them disappear!
+        Identical flow rules are replaced by ovs switch, so one of them disappear!
+        Overlapping flow rules are chosen arbitrarily by ovs switch for the packets matching both!
         '''
-        qref = GraphSession().getFlowruleOnTheSwitch(efr.get_switch_id(), nffg_match.port_in, nffg_flowrule)
-        if qref is not None:
+        overlapping = GraphSession().getMatchOverlapIndex().overlapping(
+            efr.get_switch_id(), nffg_match.port_in, efr.get_priority(), nffg_match, efr.get_table_id(),
+            efr.get_mpls_label())
+        if len(overlapping) > 0:
             raise GraphError(
                 "Cannot install the flowrule " + efr.get_flow_name() + ". Collision on switch " + efr.get_switch_id() + " .")
 
         # If the flow name already exists, get new one
-        self.__checkFlowname_externalFlowrule(efr)
+        self.__allocateFlowname_externalFlowrule(efr)
 
         # NC/Switch: Add flow rule
         # sw_flow_name = self.NetManager.createFlow(efr)  # efr.get_flow_name()
         if not Configuration().DETACHED_MODE:
-            sw_flow_name = self.NetManager.createFlow(efr)  # efr.get_flow_name()
+            try:
+                sw_flow_name = self.NetManager.createFlow(efr)  # efr.get_flow_name()
+            except Exception:
+                FlowNameAllocator().release(efr.get_switch_id(), efr.get_flow_name())
+                raise
         else:
             sw_flow_name = "debug"
 
         # DATABASE: Add flow rule
         flow_rule = NffgFlowrule(_id=efr.get_flow_id(), node_id=efr.get_switch_id(), _type='external',
                                  status='complete', priority=efr.get_priority(), internal_id=sw_flow_name)
-        flow_rule_db_id = GraphSession().addFlowrule(self.__session_id, efr.get_switch_id(), flow_rule)
-        GraphSession().dbStoreMatch(nffg_match, flow_rule_db_id, flow_rule_db_id)
-        GraphSession().dbStoreAction(nffg_actions, flow_rule_db_id)
+        flow_rule_db_id = GraphSession().addFlowrule(session_id, efr.get_switch_id(), flow_rule, tunnel_id=tunnel_id,
+                                                     table_id=efr.get_table_id(), mpls_label=efr.get_mpls_label())
+        GraphSession().dbStoreMatch(nffg_match, flow_rule_db_id, flow_rule_db_id, switch_id=efr.get_switch_id())
+        GraphSession().dbStoreAction(nffg_actions, flow_rule_db_id, switch_id=efr.get_switch_id())
 
         # RESOURCE DESCRIPTION
         # ResourceDescription().new_flowrule(flow_rule_db_id)
@@ -1163,28 +1979,14 @@ class DO(object):
         # PRINT
         self.__print("[New Flow] id:'" + efr.get_flow_name() + "' device:'" + efr.get_switch_id() + "'")
         logging.debug("[New Flow] id:'" + efr.get_flow_name() + "' device:'" + efr.get_switch_id() + "'")
+        return flow_rule_db_id
 
-    def __checkFlowname_externalFlowrule(self, efr):
+    def __allocateFlowname_externalFlowrule(self, efr):
         """
-        Check if the flow name already exists on the same switch,
+        Get a flow name not used on the same switch,
         in order to avoid subscribing the existing flowrule in one switch.
+        Names matter only where they identify the flows on the switch (OpenDayLight).
         """
-        if not GraphSession().externalFlowruleExists(efr.get_switch_id(), efr.get_flow_name()):
+        if Configuration().DETACHED_MODE or not self.NetManager.isODL():
             return
-
-        efr.set_flow_name(0)
-        this_efr = self.NetManager.externalFlowrule()
-
-        flow_rules_ref = GraphSession().getExternalFlowrulesByGraphFlowruleID(efr.get_switch_id(), efr.get_flow_id())
-        for fr in flow_rules_ref:
-            if fr.type != 'external' or fr.internal_id is None:
-                continue
-
-            this_efr.set_complete_flow_name(fr.internal_id)
-
-            if this_efr.compare_flow_name(
-                    efr.get_flow_name()) < 2:  # [ ( this_efr.flow_name - prev_efr.flow_name ) < 2 ]
-                efr.set_complete_flow_name(fr.internal_id)
-                continue
-            break
-        efr.inc_flow_name()
+        efr.set_flow_name(FlowNameAllocator().allocate(efr.get_switch_id(), efr.get_flow_id(), efr.get_flow_name()))
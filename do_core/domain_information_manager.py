@@ -4,7 +4,10 @@ import json
 import logging
 
 from doubledecker.clientSafe import ClientSafe
+from domain_information_library.domain_info import FunctionalCapability
 from do_core.config import Configuration
+import threading
+from collections import OrderedDict
 from threading import Thread
 
 from do_core.netmanager import NetManager
@@ -57,6 +60,12 @@ class Messaging(object, metaclass=Singleton):
         self.dd_client = None
         self.working_thread = None
         self.first_start = True
+        self._lock = threading.RLock()
+        self._publish_timer = None
+        self._snapshot_timer = None
+        self._published_digest = None
+        self._published_description = None
+        self._last_snapshot = None
 
     def _cold_start(self):
         message = self.read_domain_description_file()
@@ -70,35 +79,131 @@ class Messaging(object, metaclass=Singleton):
         )
         self.working_thread = Thread(target=self.dd_client.start)
         self.working_thread.start()
+        self._published(message, snapshot=True)
         logging.info("DoubleDecker client started!")
         logging.debug("Publishing domain information: " + message)
 
     def publish_domain_description(self):
-
+        """
+        Publish the domain description once the changes happening within DD_PUBLISH_DELAY seconds are done.
+        """
+        if not Configuration().DD_ACTIVATE:
+            return
+        with self._lock:
+            if self.first_start is True or Configuration().DD_PUBLISH_DELAY <= 0:
+                self._publish()
+            elif self._publish_timer is None:
+                self._publish_timer = threading.Timer(Configuration().DD_PUBLISH_DELAY, self._publish_pending)
+                self._publish_timer.daemon = True
+                self._publish_timer.start()
+
+    def _publish_pending(self, snapshot=False):
         try:
-            if self.first_start is True:
-                self._cold_start()
-                self.first_start = False
-                return
-            message = self.read_domain_description_file()
-            self.dd_client.publish(Configuration().DOMAIN_DESCRIPTION_TOPIC, message)
-            logging.info("Publishing domain information...")
-            logging.debug(json.dumps(json.loads(message)))
-        except ConnectionError:
-            raise MessagingError("DD client not registered") from None
-        except Exception as ex:
-            raise MessagingError(ex) from None
+            self._publish(snapshot)
+        except MessagingError as err:
+            logging.error(err.message)
+
+    def _publish(self, snapshot=False):
+        with self._lock:
+            if self._publish_timer is not None:
+                self._publish_timer.cancel()
+                self._publish_timer = None
+            try:
+                if self.first_start is True:
+                    self._cold_start()
+                    self.first_start = False
+                    return
+                message = self.read_domain_description_file()
+                digest = hashlib.md5(message.encode('utf-8')).hexdigest()
+                if digest == self._published_digest and not snapshot:
+                    logging.debug("Domain information not changed, nothing to publish")
+                    return
+                if not snapshot and Configuration().DD_PUBLISH_DELTAS and \
+                        time.time() - self._last_snapshot < Configuration().DD_FULL_SNAPSHOT_INTERVAL:
+                    delta = self.description_delta(self._published_description, json.loads(message))
+                    delta['base-digest'] = self._published_digest
+                    delta['digest'] = digest
+                    self.dd_client.publish(Configuration().DOMAIN_DESCRIPTION_DELTA_TOPIC, json.dumps(delta))
+                    logging.info("Publishing domain information changes...")
+                    logging.debug(json.dumps(delta))
+                    self._published(message, digest=digest)
+                    return
+                self.dd_client.publish(Configuration().DOMAIN_DESCRIPTION_TOPIC, message)
+                logging.info("Publishing domain information...")
+                logging.debug(json.dumps(json.loads(message)))
+                self._published(message, digest=digest, snapshot=True)
+            except ConnectionError:
+                raise MessagingError("DD client not registered") from None
+            except Exception as ex:
+                raise MessagingError(ex) from None
+
+    def _published(self, message, digest=None, snapshot=False):
+        self._published_digest = digest or hashlib.md5(message.encode('utf-8')).hexdigest()
+        self._published_description = json.loads(message)
+        if snapshot:
+            # a client registering again gets the last full description
+            self.dd_client.message = message
+            self._last_snapshot = time.time()
+            if self._snapshot_timer is not None:
+                self._snapshot_timer.cancel()
+                self._snapshot_timer = None
+        elif self._snapshot_timer is None:
+            # receivers that missed a delta are resynchronized by the next full description
+            wait = max(0, self._last_snapshot + Configuration().DD_FULL_SNAPSHOT_INTERVAL - time.time())
+            self._snapshot_timer = threading.Timer(wait, self._publish_pending, kwargs={'snapshot': True})
+            self._snapshot_timer.daemon = True
+            self._snapshot_timer.start()
+
+    @staticmethod
+    def description_delta(old, new):
+        """
+        Differences between two domain descriptions: the interfaces (with their vlans) added or changed,
+        the names of the removed ones, the capabilities and any other field when changed.
+        :param old: domain description (dict)
+        :param new: domain description (dict)
+        :return: dict
+        """
+        old_info = old['netgroup-domain:informations']
+        new_info = new['netgroup-domain:informations']
+        delta = OrderedDict()
+        for key, value in new_info.items():
+            if key not in ('hardware-informations', 'capabilities') and old_info.get(key) != value:
+                delta[key] = value
+
+        old_capabilities = old_info.get('capabilities', {})
+        for kind, value in new_info.get('capabilities', {}).items():
+            if old_capabilities.get(kind) != value:
+                delta[kind] = value
+
+        old_interfaces = OrderedDict((interface['name'], interface) for interface in Messaging._interfaces(old_info))
+        new_interfaces = OrderedDict((interface['name'], interface) for interface in Messaging._interfaces(new_info))
+        changed = [interface for name, interface in new_interfaces.items() if old_interfaces.get(name) != interface]
+        removed = [name for name in old_interfaces if name not in new_interfaces]
+        if len(changed) > 0:
+            delta['interfaces'] = changed
+        if len(removed) > 0:
+            delta['removed-interfaces'] = removed
+        return {'netgroup-domain:informations-delta': delta}
+
+    @staticmethod
+    def _interfaces(domain_info):
+        return domain_info.get('hardware-informations', {}).get('interfaces', {}).get('interface', [])
 
     @staticmethod
     def read_domain_description_file():
-        description_file = open(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE, "r")
-        return description_file.read()
+        serialized = ResourceDescription().getSerialized()
+        if serialized is not None:
+            return serialized.decode('utf-8')
+        with open(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE, "r") as description_file:
+            return description_file.read()
 
 
-class DomainInformationManager(object):
+class DomainInformationManager(object, metaclass=Singleton):
 
     def __init__(self):
-        self._fc_digest = None
+        self._etag = None
+        self._fc_digests = {}   # application name -> digest of its capability
+        self._notified = threading.Event()
 
     def start(self):
 
@@ -119,10 +224,7 @@ class DomainInformationManager(object):
 
             # get capabilities informations from controller
             resource_description.clear_functional_capabilities()
-            functional_capabilities = NetManager().get_apps_capabilities()
-            self._fc_digest = self._calculate_capabilities_digest(functional_capabilities)
-            for functional_capability in functional_capabilities:
-                resource_description.add_functional_capability(functional_capability)
+            self.fetch_functional_capabilities(publish=False)
 
             # save new file
             resource_description.saveFile()
@@ -132,33 +234,71 @@ class DomainInformationManager(object):
         Messaging().publish_domain_description()
 
         if Configuration().DISCOVER_CAPABILITIES:
-            # periodically check for updates
-            while Messaging().working_thread.isAlive():
-                time.sleep(5)
-                self.fetch_functional_capabilities()
-
-    def fetch_functional_capabilities(self):
-        # get current capabilities from controller
-        functional_capabilities = NetManager().get_apps_capabilities()
-        # check if there are changes
-        new_digest = self._calculate_capabilities_digest(functional_capabilities)
-        if new_digest != self._fc_digest:
+            # check for updates when notified by the controller, or periodically, less and less often
+            # while capabilities do not change
+            interval = Configuration().CAPABILITIES_POLL_INTERVAL
+            if Configuration().CAPABILITIES_PUSH:
+                interval = Configuration().CAPABILITIES_POLL_MAX_INTERVAL
+            while Messaging().working_thread is None or Messaging().working_thread.is_alive():
+                if self._notified.wait(interval):
+                    self._notified.clear()
+                    logging.debug("Functional capabilities changed on the controller")
+                try:
+                    changed = self.fetch_functional_capabilities()
+                except Exception as ex:
+                    logging.error("Cannot get functional capabilities from the controller: " + str(ex))
+                    changed = False
+                if Configuration().CAPABILITIES_PUSH:
+                    continue
+                if changed:
+                    interval = Configuration().CAPABILITIES_POLL_INTERVAL
+                else:
+                    interval = min(interval * 2, Configuration().CAPABILITIES_POLL_MAX_INTERVAL)
+
+    def notify_capabilities_changed(self):
+        """
+        Check the functional capabilities now (called when the controller notifies a change).
+        """
+        self._notified.set()
+
+    def fetch_functional_capabilities(self, publish=True):
+        """
+        Update the domain description with the capabilities of the applications changed on the controller.
+        :return: True if any capability changed
+        """
+        capabilities_array, self._etag = NetManager().get_apps_capabilities_if_changed(self._etag)
+        if capabilities_array is None:
+            return False
+
+        # check which applications changed
+        digests = {}
+        changed = []
+        for capability_dict in capabilities_array:
+            name = capability_dict.get('name')
+            digests[name] = hashlib.md5(json.dumps(capability_dict, sort_keys=True).encode('utf-8')).hexdigest()
+            if self._fc_digests.get(name) != digests[name]:
+                changed.append(capability_dict)
+        removed = [name for name in self._fc_digests if name not in digests]
+        if len(changed) == 0 and len(removed) == 0:
+            return False
+        self._fc_digests = digests
+
+        # update description with new capabilities
+        resource_description = ResourceDescription()
+        for name in removed:
+            logging.info("Functional capability of application '" + str(name) + "' removed")
+            resource_description.remove_functional_capability(name)
+        for capability_dict in changed:
+            logging.info("Functional capability of application '" + str(capability_dict.get('name')) + "' changed")
+            functional_capability = FunctionalCapability()
+            functional_capability.parse_dict(capability_dict)
+            resource_description.remove_functional_capability(functional_capability.name)
+            resource_description.add_functional_capability(functional_capability)
+
+        if publish:
             logging.info("Domain information changed!")
-            self._fc_digest = new_digest
-            # update description with new capabilities
-            ResourceDescription().clear_functional_capabilities()
-            for functional_capability in functional_capabilities:
-                ResourceDescription().add_functional_capability(functional_capability)
             # save new file
-            ResourceDescription().saveFile()
+            resource_description.saveFile()
             # send updated domain informations
             Messaging().publish_domain_description()
-
-    @staticmethod
-    def _calculate_capabilities_digest(functional_capabilities):
-        fc_list = []
-        for fc in functional_capabilities:
-            fc_list.append(fc.get_dict())
-
-        data_md5 = hashlib.md5(json.dumps(fc_list, sort_keys=True).encode('utf-8')).hexdigest()
-        return data_md5
+        return True
@@ -132,4 +132,24 @@ class NoGraphFound(Exception):
     def __init__(self, message):
         self.message = message
         # Call the base class constructor with the parameters it needs
-        super(NoGraphFound, self).__init__(message)
\ No newline at end of file
+        super(NoGraphFound, self).__init__(message)
+
+
+class ResourceLockError(Exception):
+    def __init__(self, message):
+        self.message = message
+        # Call the base class constructor with the parameters it needs
+        super(ResourceLockError, self).__init__(message)
+
+    def get_mess(self):
+        return self.message
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message):
+        self.message = message
+        # Call the base class constructor with the parameters it needs
+        super(IdempotencyConflict, self).__init__(message)
+
+    def get_mess(self):
+        return self.message
@@ -0,0 +1,75 @@
+"""
+Names of the external flow rules pushed on the switches.
+
+A flow rule of the graph is split into many flows, named "<graph flow rule id>_<n>".
+On the same switch a name can be used only once: the names in use are kept in memory,
+read from the database the first time a switch is used.
+"""
+
+import threading
+
+from do_core.config import Singleton
+from do_core.sql.graph_session import GraphSession
+
+
+class FlowNameAllocator(object, metaclass=Singleton):
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__switches = {}    # switch id -> graph flow rule id -> [suffixes in use, next free suffix]
+
+    def allocate(self, switch_id, flow_id, flow_name):
+        """
+        Reserve a name on the switch for a flow of the graph flow rule flow_id.
+        :param flow_name: name wanted, "<flow_id>_<n>"; kept if it is free
+        :return: the suffix n of the name reserved
+        """
+        requested = self.__suffix(str(flow_id), flow_name)
+        with self.__lock:
+            entry = self.__entry(switch_id, str(flow_id))
+            suffix = requested
+            if suffix is None or suffix in entry[0]:
+                suffix = entry[1]
+            entry[0].add(suffix)
+            entry[1] = max(entry[1], suffix + 1)
+            return suffix
+
+    def release(self, switch_id, flow_name):
+        """
+        Free a name of a flow removed from the switch (names not in the form "<id>_<n>" are ignored).
+        """
+        parts = str(flow_name).rsplit("_", 1)
+        if len(parts) < 2 or not parts[1].isdigit():
+            return
+        with self.__lock:
+            flows = self.__switches.get(switch_id)
+            if flows is None or parts[0] not in flows:
+                return
+            entry = flows[parts[0]]
+            entry[0].discard(int(parts[1]))
+            if len(entry[0]) == 0:
+                del flows[parts[0]]
+
+    def reset(self):
+        with self.__lock:
+            self.__switches.clear()
+
+    def __entry(self, switch_id, flow_id):
+        flows = self.__switches.get(switch_id)
+        if flows is None:
+            flows = {}
+            for internal_id in GraphSession().getExternalFlowruleInternalIDs(switch_id):
+                parts = str(internal_id).rsplit("_", 1)
+                if len(parts) == 2 and parts[1].isdigit():
+                    entry = flows.setdefault(parts[0], [set(), 0])
+                    entry[0].add(int(parts[1]))
+                    entry[1] = max(entry[1], int(parts[1]) + 1)
+            self.__switches[switch_id] = flows
+        return flows.setdefault(flow_id, [set(), 0])
+
+    @staticmethod
+    def __suffix(flow_id, flow_name):
+        prefix = flow_id + "_"
+        if flow_name is None or not flow_name.startswith(prefix) or not flow_name[len(prefix):].isdigit():
+            return None
+        return int(flow_name[len(prefix):])
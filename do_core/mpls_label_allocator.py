@@ -0,0 +1,69 @@
+"""
+MPLS labels tagging the paths on the switches (path_tagging = mpls).
+
+Each switch has its own label space: a label matched by a flow of the switch, on any port,
+cannot be matched by another one. The labels in use are kept in memory, read from the
+database the first time a switch is used; a label is reserved as soon as it is chosen,
+before the flow matching it is stored.
+"""
+
+import threading
+
+from do_core.config import Configuration, Singleton
+from do_core.sql.graph_session import GraphSession
+
+
+class MplsLabelAllocator(object, metaclass=Singleton):
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__switches = {}    # switch id -> set of labels in use
+
+    def allocate(self, switch_id, preferred=None):
+        """
+        Reserve a label on the switch.
+        :param preferred: label wanted (e.g. the label of the previous hop, so that it is not swapped); kept if free
+        :return: the label reserved, None if all the allowed labels are in use
+        """
+        with self.__lock:
+            labels = self.__labels(switch_id)
+            if preferred is not None and preferred not in labels and self.__allowed(preferred):
+                labels.add(preferred)
+                return preferred
+            for label_range in Configuration().ALLOWED_MPLS_LABELS:
+                label = label_range[0]
+                while label <= label_range[1]:
+                    if label not in labels:
+                        labels.add(label)
+                        return label
+                    label += 1
+            return None
+
+    def release(self, switch_id, label):
+        """
+        Free the label of a flow removed from the switch (or of a flow never pushed).
+        """
+        if label is None:
+            return
+        with self.__lock:
+            labels = self.__switches.get(switch_id)
+            if labels is not None:
+                labels.discard(int(label))
+
+    def reset(self):
+        with self.__lock:
+            self.__switches.clear()
+
+    def __labels(self, switch_id):
+        labels = self.__switches.get(switch_id)
+        if labels is None:
+            labels = set(GraphSession().getMplsLabels(switch_id))
+            self.__switches[switch_id] = labels
+        return labels
+
+    @staticmethod
+    def __allowed(label):
+        for label_range in Configuration().ALLOWED_MPLS_LABELS:
+            if label_range[0] <= label <= label_range[1]:
+                return True
+        return False
@@ -4,26 +4,33 @@ Created on Nov 10, 2015
 @author: giacomo
 '''
 
+import itertools
 import json
+import logging
 
 import networkx as nx
 import time
 
+from requests.exceptions import HTTPError
+
 from do_core.config import Configuration
 from domain_information_library.domain_info import FunctionalCapability
 from nffg_library.nffg import NF_FG, EndPoint
 
 if Configuration().CONTROLLER_NAME == "OpenDayLight":
-    from do_core.rest_modules.odl import Flow, Match, Action
+    from do_core.rest_modules.odl import Flow, Match, Action, Group
     from do_core.rest_modules.odl import ODL_Rest
     
 elif Configuration().CONTROLLER_NAME == "ONOS":
-    from do_core.rest_modules.onos.objects import Flow, Selector as Match, Treatment as Action
+    from do_core.rest_modules.onos.objects import Flow, Selector as Match, Treatment as Action, Group
     from do_core.rest_modules.onos.rest import ONOS_Rest
         
 
 class NetManager:
 
+    __batch_delete_supported = True  # the controller deletes many flows with a single request
+    IN_PORT = 'IN_PORT'  # output port of a group bucket sending packets back out of their ingress port
+
     def __init__(self):
 
         self.nffg_id = None
@@ -68,16 +75,61 @@ class NetManager:
             self.__nffg_endpoints = {}
             self.__nffg_flowrules = {}
             self.__nffg_vnfs = {}
+
+            # Adjacency index, kept updated by addFlowrule
+            self.__flows_from_node = {}     # port reference (e.g. "vnf:<id>:<port>") -> flow rules matching on it
+            self.__flows_to_node = {}       # port reference -> flow rules sending to it
+            self.__flow_outputs = {}        # flow rule id -> port references it sends to
+            self.__port_refs = {}           # port reference -> (type, id, port id)
     
         def addEndpoint(self, ep):
             self.__nffg_endpoints[ep.id] = ep
         
         def addFlowrule(self, fr):
+            if fr.id in self.__nffg_flowrules:
+                self.__unindexFlowrule(self.__nffg_flowrules[fr.id])
             self.__nffg_flowrules[fr.id] = fr
+            self.__indexFlowrule(fr)
 
         def addVnf(self, vnf):
             self.__nffg_vnfs[vnf.id] = vnf
-        
+
+        def __indexFlowrule(self, fr):
+            outputs = []
+            for action in fr.actions:
+                if action.output is not None and action.output not in outputs:
+                    outputs.append(action.output)
+            self.__flow_outputs[fr.id] = outputs
+            if fr.match is not None and fr.match.port_in is not None:
+                self.__flows_from_node.setdefault(fr.match.port_in, []).append(fr)
+            for output in outputs:
+                self.__flows_to_node.setdefault(output, []).append(fr)
+
+        def __unindexFlowrule(self, fr):
+            if fr.match is not None and fr.match.port_in is not None:
+                self.__flows_from_node[fr.match.port_in].remove(fr)
+            for output in self.__flow_outputs.pop(fr.id):
+                self.__flows_to_node[output].remove(fr)
+
+        def getPortRef(self, port):
+            """
+            Parse a port reference of a flow rule, only the first time it is seen.
+            :param port: "endpoint:<endpoint id>" or "vnf:<vnf id>:<port id>"
+            :return: (type, id, port id), port id is None for endpoints
+            :rtype: tuple
+            """
+            ref = self.__port_refs.get(port)
+            if ref is None:
+                fields = port.split(':', 1)
+                if fields[0] == 'vnf':
+                    fields = port.split(':', 2)
+                ref = (fields[0], fields[1] if len(fields) > 1 else None, fields[2] if len(fields) > 2 else None)
+                self.__port_refs[port] = ref
+            return ref
+
+        def __isVnfPort(self, port):
+            return port is not None and self.getPortRef(port)[0] == 'vnf'
+
         def getEndpoint(self, ep_id):
             """
 
@@ -96,62 +148,33 @@ class NetManager:
         def get_ep_flowrules(self):
             ep_flowrules = []
             for flowrule in self.__nffg_flowrules.values():
-                has_vnf = False
-                if flowrule.match.port_in.split(':')[0] == 'vnf':
-                    has_vnf = True
-                else:
-                    for action in flowrule.actions:
-                        if action.output is not None and action.output.split(':')[0] == 'vnf':
-                            has_vnf = True
-                            break
-                if not has_vnf:
-                    ep_flowrules.append(flowrule)
+                if self.__isVnfPort(flowrule.match.port_in):
+                    continue
+                if any(self.__isVnfPort(output) for output in self.__flow_outputs[flowrule.id]):
+                    continue
+                ep_flowrules.append(flowrule)
             return ep_flowrules
 
         def get_detached_vnfs(self):
-            detached_vnfs = []
-            for vnf in self.__nffg_vnfs.values():
-                is_detached = True
-                for flow_from in self.get_flows_from_vnf(vnf):
-                    if is_detached:
-                        for action in flow_from.actions:
-                            if action.output is not action.output.split(':')[0] == 'vnf':
-                                is_detached = False
-                                break
-                if not is_detached:
-                    break
-                for flow_to in self.get_flows_to_vnf(vnf):
-                    if flow_to.match.port_in.split(':')[0] == 'vnf':
-                        is_detached = False
-                        break
-                if is_detached:
-                    detached_vnfs.append(vnf)
-            return detached_vnfs
+            """
+            Vnfs that have flows just to/from endpoints
+            """
+            return [vnf for vnf in self.__nffg_vnfs.values() if self.is_detached(vnf)]
 
         def get_attached_vnfs(self):
-            attached_vnfs = []
-            for vnf in self.__nffg_vnfs.values():
-                is_attached = False
-                for flow_from in self.get_flows_from_vnf(vnf):
-                    if not is_attached:
-                        for action in flow_from.actions:
-                            if action.output is not action.output.split(':')[0] == 'vnf':
-                                is_attached = True
-                                break
-                if is_attached:
-                    attached_vnfs.append(vnf)
-                    break
-                for flow_to in self.get_flows_to_vnf(vnf):
-                    if flow_to.match.port_in.split(':')[0] == 'vnf':
-                        is_attached = True
-                        break
-                if is_attached:
-                    attached_vnfs.append(vnf)
-            return attached_vnfs
+            """
+            Vnfs that have flows to/from an other vnf
+            """
+            return [vnf for vnf in self.__nffg_vnfs.values() if not self.is_detached(vnf)]
 
         def is_detached(self, vnf):
-            detached_vnfs = self.get_detached_vnfs()
-            return vnf in detached_vnfs
+            for flow_from in self.get_flows_from_vnf(vnf):
+                if any(self.__isVnfPort(output) for output in self.__flow_outputs[flow_from.id]):
+                    return False
+            for flow_to in self.get_flows_to_vnf(vnf):
+                if self.__isVnfPort(flow_to.match.port_in):
+                    return False
+            return True
 
         def get_flows_from_vnf(self, vnf):
             """
@@ -162,36 +185,20 @@ class NetManager:
             """
             flow_rules = []
             for port in vnf.ports:
-                flow_rules = flow_rules + self.__get_flows_from_node("vnf:"+vnf.id+":"+port.id)
+                flow_rules.extend(self.__flows_from_node.get("vnf:"+vnf.id+":"+port.id, []))
             return flow_rules
-            pass
 
         def get_flows_to_vnf(self, vnf):
             flow_rules = []
             for port in vnf.ports:
-                flow_rules = flow_rules + self.__get_flows_to_node("vnf:"+vnf.id+":"+port.id)
-            return flow_rules
-            pass
-
-        def __get_flows_from_node(self, node_id):
-            flow_rules = []
-            for flow_rule in self.__nffg_flowrules.values():
-                if flow_rule.match.port_in == node_id:
-                    flow_rules.append(flow_rule)
-            return flow_rules
-
-        def __get_flows_to_node(self, node_id):
-            flow_rules = []
-            for flow_rule in self.__nffg_flowrules.values():
-                for action in flow_rule.actions:
-                    if action.output is not action.output == node_id:
-                        flow_rules.append(flow_rule)
-                        continue
+                flow_rules.extend(self.__flows_to_node.get("vnf:"+vnf.id+":"+port.id, []))
             return flow_rules
 
     def ProfileGraph_BuildFromNFFG(self, nffg):
         """
         Create a ProfileGraph with the flowrules and endpoints specified in nffg.
+        Flow rules are indexed by source and destination node while they are added,
+        so that the ProfileGraph queries do not need to scan all of them.
         :type nffg: NF_FG
         """
         self.nffg_id = nffg.id
@@ -230,24 +237,72 @@ class NetManager:
 
     def createFlow(self, efr):
         if self.isODL():
-            flowj = Flow("flowrule", efr.get_flow_name(), 0, efr.get_priority(), True, 0, 0, efr.get_actions(), efr.get_match())
+            flowj = Flow("flowrule", efr.get_flow_name(), efr.get_table_id(), efr.get_priority(), True, 0, 0, efr.get_actions(), efr.get_match(), efr.get_goto_table(), efr.get_group_id())
             json_req = flowj.getJSON(self.ct_version, efr.get_switch_id())
-            ODL_Rest(self.ct_version).createFlow(self.ct_endpoint, self.ct_username, self.ct_password, json_req, efr.get_switch_id(), efr.get_flow_name())
+            ODL_Rest(self.ct_version).createFlow(self.ct_endpoint, self.ct_username, self.ct_password, json_req, efr.get_switch_id(), efr.get_flow_name(), efr.get_table_id())
             return efr.get_flow_name()
         
         elif self.isONOS():
-            flowj = Flow(efr.get_switch_id(), efr.get_priority(), True, 0, efr.get_actions(), efr.get_match())
+            flowj = Flow(efr.get_switch_id(), efr.get_priority(), True, 0, efr.get_actions(), efr.get_match(),
+                         efr.get_table_id(), efr.get_goto_table(), efr.get_group_id())
             json_req = flowj.getJSON()
             flow_id, response = ONOS_Rest(self.ct_version).createFlow(self.ct_endpoint, self.ct_username, self.ct_password, json_req, efr.get_switch_id())
             return flow_id
 
-    def deleteFlow(self, switch_id, flowname):
+    def deleteFlow(self, switch_id, flowname, table_id=0):
         if self.isODL():
-            ODL_Rest(self.ct_version).deleteFlow(self.ct_endpoint, self.ct_username, self.ct_password, switch_id, flowname)
+            ODL_Rest(self.ct_version).deleteFlow(self.ct_endpoint, self.ct_username, self.ct_password, switch_id, flowname, table_id)
         
         elif self.isONOS():
             ONOS_Rest(self.ct_version).deleteFlow(self.ct_endpoint, self.ct_username, self.ct_password, switch_id, flowname)
             
+    def deleteFlows(self, switch_id, flownames, table_id=0):
+        """
+        Delete many flows of the same switch (and table), with a single request where the controller supports it.
+        Flows not found on the switch are ignored.
+        """
+        if self.isONOS() and NetManager.__batch_delete_supported:
+            try:
+                ONOS_Rest(self.ct_version).deleteFlows(self.ct_endpoint, self.ct_username, self.ct_password,
+                                                       switch_id, flownames)
+                return
+            except HTTPError as err:
+                if err.response.status_code not in (404, 405):
+                    raise
+                logging.info("Batch deletion of flows not supported by the controller")
+                NetManager.__batch_delete_supported = False
+        for flowname in flownames:
+            try:
+                self.deleteFlow(switch_id, flowname, table_id)
+            except HTTPError as err:
+                if err.response.status_code != 404:
+                    raise
+                logging.debug("External flow " + flowname + " does not exist in the switch " + switch_id + ".")
+
+    def createGroup(self, switch_id, group_id, output_ports, failover=False, watch_ports=None):
+        '''
+        Create a group with a bucket for each output port (OF1.3):
+        SELECT, the switch sends each packet out of one of the ports, or, with failover,
+        FAST_FAILOVER, packets go out of the first port whose watch port is up.
+        The output port IN_PORT sends the packets back where they came from.
+        '''
+        if self.isODL():
+            output_ports = ["INPORT" if port == self.IN_PORT else port for port in output_ports]
+            json_req = Group(group_id, output_ports, "group-ff" if failover else "group-select", watch_ports).getJSON()
+            ODL_Rest(self.ct_version).createGroup(self.ct_endpoint, self.ct_username, self.ct_password, json_req, switch_id, group_id)
+        
+        elif self.isONOS():
+            json_req = Group(switch_id, group_id, output_ports, 'FAILOVER' if failover else 'SELECT', watch_ports).getJSON()
+            ONOS_Rest(self.ct_version).createGroup(self.ct_endpoint, self.ct_username, self.ct_password, json_req, switch_id)
+
+    def deleteGroup(self, switch_id, group_id):
+        if self.isODL():
+            ODL_Rest(self.ct_version).deleteGroup(self.ct_endpoint, self.ct_username, self.ct_password, switch_id, group_id)
+        
+        elif self.isONOS():
+            ONOS_Rest(self.ct_version).deleteGroup(self.ct_endpoint, self.ct_username, self.ct_password, switch_id,
+                                                   Group.appCookie(group_id))
+
     def activate_app(self, app_name):
         if self.isODL():
             # TODO implement ODL application support
@@ -311,6 +366,23 @@ class NetManager:
 
         return functional_capabilities
 
+    def get_apps_capabilities_if_changed(self, etag=None):
+        """
+        Capabilities of the applications, if changed since the response tagged by etag
+        :return: list of capabilities as dictionaries (None if not changed) and the new tag
+        """
+        if self.isODL():
+            # TODO implement ODL application support
+            return [], None
+
+        elif self.isONOS():
+            json_data, etag = ONOS_Rest(self.ct_version).get_applications_capabilities_if_changed(
+                self.ct_endpoint, self.ct_username, self.ct_password, etag
+            )
+            if json_data is None:
+                return None, etag
+            return json.loads(json_data)['functional-capabilities'], etag
+
     def get_app_capability(self, app_name):
 
         functional_capability = FunctionalCapability()
@@ -356,6 +428,35 @@ class NetManager:
 
         return swList
     
+    def getPortStatistics(self):
+        '''
+        Bytes sent out of each port of the switches, as counted by the controller
+        :return: dict (switch id, port id) -> bytes
+        '''
+        statistics = {}
+
+        if self.isODL_Hydrogen():
+            logging.warning("Port statistics are not read from OpenDayLight Hydrogen")
+
+        elif self.isODL():
+            json_data = ODL_Rest(self.ct_version).getNodes(self.ct_endpoint, self.ct_username, self.ct_password)
+            nodes = json.loads(json_data)
+            for node in nodes["nodes"].get("node", []):
+                for connector in node.get("node-connector", []):
+                    counters = connector.get("opendaylight-port-statistics:flow-capable-node-connector-statistics")
+                    if counters is None:
+                        continue
+                    # port ids as in the topology (see getSwitchLinksList)
+                    statistics[(node["id"], connector["id"].split(":")[2])] = int(counters["bytes"]["transmitted"])
+
+        elif self.isONOS():
+            json_data = ONOS_Rest(self.ct_version).getPortStatistics(self.ct_endpoint, self.ct_username, self.ct_password)
+            for device in json.loads(json_data)['statistics']:
+                for port in device['ports']:
+                    statistics[(device['device'], str(port['port']))] = int(port['bytesSent'])
+
+        return statistics
+
     def getDevicesInfo(self):
 
         devices = []
@@ -505,15 +606,109 @@ class NetManager:
     
     
     
-    def getShortestPath(self,source_switch_id,target_switch_id):
-        self.setTopologyGraph()
+    def getShortestPath(self,source_switch_id,target_switch_id,occupancy=None,link_weight=None,k_paths=1):
+        '''
+        occupancy: FlowTableOccupancy of the switches; when given, switches over the threshold
+        of their flow table capacity are avoided and full switches are not crossed.
+        link_weight: function (switch id, output port) -> weight of the link; every link weighs 1 if not given.
+        k_paths: number of lightest paths compared, the one whose heaviest link is the lightest is chosen.
+        '''
+        topology = self.__pathTopology(source_switch_id, target_switch_id, occupancy, link_weight)
+        if k_paths > 1:
+            paths = self.__shortestSimplePaths(topology, source_switch_id, target_switch_id, k_paths)
+            if len(paths) == 0:
+                return None
+            return min(paths, key=lambda path: self.__heaviestLink(topology, path))
         try:
-            path = nx.dijkstra_path(self.topology, source_switch_id, target_switch_id, self.WEIGHT_PROPERTY_NAME)
+            path = nx.dijkstra_path(topology, source_switch_id, target_switch_id, self.WEIGHT_PROPERTY_NAME)
         except nx.NetworkXNoPath:
             path=None
         return path
     
     
+    def getShortestPaths(self,source_switch_id,target_switch_id,k_paths,occupancy=None,link_weight=None):
+        '''
+        Alternative paths between two switches: up to k_paths loopless paths, the lightest first
+        (see getShortestPath for occupancy and link_weight).
+        '''
+        topology = self.__pathTopology(source_switch_id, target_switch_id, occupancy, link_weight)
+        return self.__shortestSimplePaths(topology, source_switch_id, target_switch_id, k_paths)
+    
+    
+    def getEqualCostPaths(self,source_switch_id,target_switch_id,max_paths,occupancy=None,link_weight=None):
+        '''
+        Up to max_paths paths between two switches, all as light as the lightest one
+        (see getShortestPath for occupancy and link_weight).
+        '''
+        topology = self.__pathTopology(source_switch_id, target_switch_id, occupancy, link_weight)
+        try:
+            return list(itertools.islice(nx.all_shortest_paths(topology, source_switch_id, target_switch_id,
+                                                               self.WEIGHT_PROPERTY_NAME), max_paths))
+        except nx.NetworkXNoPath:
+            return []
+    
+    
+    def getBackupPath(self,path,occupancy=None,link_weight=None):
+        '''
+        Lightest path between the ends of the given one not sharing any link with it, None if there is not
+        (see getShortestPath for occupancy and link_weight).
+        '''
+        topology = self.__pathTopology(path[0], path[-1], occupancy, link_weight)
+        if topology is self.topology:
+            topology = topology.copy()
+        for i in range(len(path) - 1):
+            for switch, neighbour in ((path[i], path[i + 1]), (path[i + 1], path[i])):
+                if topology.has_edge(switch, neighbour):
+                    topology.remove_edge(switch, neighbour)
+        try:
+            return nx.dijkstra_path(topology, path[0], path[-1], self.WEIGHT_PROPERTY_NAME)
+        except nx.NetworkXNoPath:
+            return None
+    
+    
+    def __shortestSimplePaths(self, topology, source_switch_id, target_switch_id, k_paths):
+        try:
+            return list(itertools.islice(nx.shortest_simple_paths(topology, source_switch_id, target_switch_id,
+                                                                  self.WEIGHT_PROPERTY_NAME), k_paths))
+        except nx.NetworkXNoPath:
+            return []
+    
+    
+    def __heaviestLink(self, topology, path):
+        return max([topology[path[i]][path[i + 1]][self.WEIGHT_PROPERTY_NAME] for i in range(len(path) - 1)] or [0])
+    
+    
+    def __pathTopology(self, source_switch_id, target_switch_id, occupancy, link_weight):
+        # The cached topology, or a copy of it weighted for this path
+        self.setTopologyGraph()
+        capacities = occupancy is not None and occupancy.has_capacities()
+        if link_weight is None and not capacities:
+            return self.topology
+        topology = self.topology.copy()
+        if link_weight is not None:
+            for switch, neighbour, link in topology.edges(data=True):
+                link[self.WEIGHT_PROPERTY_NAME] = link_weight(switch, link['from_port'])
+        if capacities:
+            self.__avoidFullSwitches(topology, occupancy, source_switch_id, target_switch_id)
+        return topology
+    
+    
+    def __avoidFullSwitches(self, topology, occupancy, source_switch_id, target_switch_id):
+        # Links entering a switch over the threshold weigh more than any path avoiding it
+        penalty = sum(link[self.WEIGHT_PROPERTY_NAME] for switch, neighbour, link in topology.edges(data=True))
+        for switch in list(topology.nodes()):
+            usage = occupancy.usage(switch)
+            if usage is None or usage < Configuration().FLOW_TABLE_THRESHOLD:
+                continue
+            if usage >= 1:
+                if switch not in (source_switch_id, target_switch_id):
+                    topology.remove_node(switch)
+                    continue
+                logging.warning("Flow table of the switch " + switch + " is full")
+            for neighbour in topology.predecessors(switch):
+                topology[neighbour][switch][self.WEIGHT_PROPERTY_NAME] += penalty
+    
+    
     def switchPortIn(self, switch, from_switch):
         # Return the port of "switch" that receives packets from "from_switch"
         if switch is None or from_switch is None:
@@ -577,6 +772,10 @@ class NetManager:
             self.set_flow_id(flow_id)
             self.set_flow_name(flowname_suffix)
             self.__priority = priority
+            self.__table_id = 0
+            self.__goto_table = None
+            self.__group_id = None
+            self.__mpls_label = None
             
             # nffg_match = nffg.Match object
             match = None
@@ -610,6 +809,36 @@ class NetManager:
 
         def set_match(self, nffgmatch):
             self.__match = Match(nffgmatch)
+            if self.__mpls_label is not None:
+                self.__match.setMplsLabelMatch(self.__mpls_label)
+        
+        
+        
+        # MPLS (path_tagging = mpls: the nffg library has no MPLS match and actions)
+
+        def get_mpls_label(self):
+            return self.__mpls_label
+
+        def set_match_mpls_label(self, label):
+            # label matched by the flow, besides the match set with set_match
+            self.__mpls_label = label
+            if self.__match is not None and label is not None:
+                self.__match.setMplsLabelMatch(label)
+
+        def append_push_mpls(self):
+            new_action = Action()
+            new_action.setPushMplsAction()
+            self.__actions.append(new_action)
+
+        def append_set_mpls_label(self, label):
+            new_action = Action()
+            new_action.setMplsLabelAction(label)
+            self.__actions.append(new_action)
+
+        def append_pop_mpls(self, ether_type):
+            new_action = Action()
+            new_action.setPopMplsAction(ether_type)
+            self.__actions.append(new_action)
         
         
         
@@ -644,6 +873,32 @@ class NetManager:
         
         
         
+        # TABLES (multi table pipeline, OF1.3)
+
+        def get_table_id(self):
+            return self.__table_id
+
+        def set_table_id(self, value):
+            self.__table_id = value
+
+        def get_goto_table(self):
+            return self.__goto_table
+
+        def set_goto_table(self, value):
+            self.__goto_table = value
+        
+        
+        
+        # GROUP (packets sent to an OpenFlow group after the actions)
+
+        def get_group_id(self):
+            return self.__group_id
+
+        def set_group_id(self, value):
+            self.__group_id = value
+        
+        
+        
         # FLOW ID
 
         def get_flow_id(self):
@@ -0,0 +1,96 @@
+"""
+Rerouting of the flow rules when links or devices disappear from the topology (option 'enabled'
+of the [rerouting] section of the configuration file): the topology is read every 'topology_interval'
+seconds and only the flow rules crossing what disappeared are moved onto new paths.
+"""
+
+import logging
+import threading
+import time
+
+from do_core.config import Configuration, Singleton
+from do_core.do import DO
+from do_core.netmanager import NetManager
+from do_core.sql.graph_session import GraphSession
+
+
+class Rerouter(object, metaclass=Singleton):
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__links = None     # (switch id, port) ends of the links of the last topology read
+        self.__switches = None
+        self.__metrics = {
+            'reroutes': 0,      # passes over the flow rules crossing what disappeared
+            'failures': 0,      # sessions whose flow rules could not be rerouted
+            'rerouted_flowrules': 0,
+            'last_reroute_seconds': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """
+        Read the topology every TOPOLOGY_INTERVAL seconds (it never returns).
+        """
+        if not Configuration().REROUTING:
+            return
+        while True:
+            try:
+                self.poll()
+            except Exception as ex:
+                logging.exception(ex)
+                with self.__lock:
+                    self.__metrics['last_error'] = str(ex)
+            time.sleep(Configuration().TOPOLOGY_INTERVAL)
+
+    def poll(self):
+        """
+        Read the topology and reroute the flow rules crossing the links and devices no longer in it.
+        :return: number of flow rules rerouted
+        """
+        net_manager = NetManager()
+        net_manager.setTopologyGraph()
+        switches = set(net_manager.topology.nodes())
+        links = set((switch, str(link['from_port'])) for switch, neighbour, link in net_manager.topology.edges(data=True))
+        links.update((neighbour, str(link['to_port'])) for switch, neighbour, link in net_manager.topology.edges(data=True))
+
+        with self.__lock:
+            previous_links, previous_switches = self.__links, self.__switches
+            self.__links, self.__switches = links, switches
+        if previous_links is None:
+            return 0
+        lost_links = previous_links - links
+        lost_switches = previous_switches - switches
+        if len(lost_links) == 0 and len(lost_switches) == 0:
+            return 0
+        logging.warning("Reroute: links " + str(sorted(lost_links)) + " and devices " + str(sorted(lost_switches)) +
+                        " disappeared from the topology")
+        return self.reroute(lost_links, lost_switches)
+
+    def reroute(self, ports=(), switch_ids=()):
+        """
+        Move the flow rules crossing the given links or devices onto new paths; other graphs are left alone.
+        :param ports: (switch id, port) ends of the links
+        :param switch_ids: devices
+        :return: number of flow rules rerouted
+        """
+        start = time.time()
+        rerouted = 0
+        sessions = GraphSession().getFlowPathIndex().flowrules(ports, switch_ids)
+        for session_id, graph_flow_rule_ids in sessions.items():
+            try:
+                rerouted += DO(None).reroute_flowrules(session_id, graph_flow_rule_ids)
+            except Exception as ex:
+                logging.exception(ex)
+                with self.__lock:
+                    self.__metrics['failures'] += 1
+                    self.__metrics['last_error'] = str(ex)
+        with self.__lock:
+            self.__metrics['reroutes'] += 1
+            self.__metrics['rerouted_flowrules'] += rerouted
+            self.__metrics['last_reroute_seconds'] = time.time() - start
+        return rerouted
+
+    def metrics(self):
+        with self.__lock:
+            return dict(self.__metrics)
@@ -1,4 +1,5 @@
-import json, logging
+import atexit, json, logging, os
+import threading
 from collections import OrderedDict
 from do_core.config import Configuration
 from domain_information_library.domain_info import DomainInfo, FunctionalCapability
@@ -21,10 +22,23 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
     __endpoint_name_separator = "/"
     __save = True
     __domain_info = DomainInfo()
+    __lock = threading.RLock()  # graphs are deployed in parallel by different threads
+
+    # Parsed copy of the dynamic description file, shared by all the modules, and its indexes
+    __published_info = None
+    __published_mtime = None
+    __application_by_type = None
+    __application_by_type_lower = None
+
+    # Write-behind of the dynamic description file
+    __serialized = None     # last serialized description (bytes), readers get this one
+    __written = None        # last serialized description written on the file
+    __write_timer = None    # pending write
 
     def __init__(self):
         self.loadFile(Configuration().DOMAIN_DESCRIPTION_FILE)
         self.__filename = Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE
+        atexit.register(self.flush)
         return
 
     def loadFile(self, filename):
@@ -41,28 +55,110 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
         self.__read_endpoints_and_vlans()
 
     def updateAll(self):
-        for endpoint_name in self.__endpoints:
-            if self.__endpoints[endpoint_name]['trunk_vlans'] is not None:
-                __tvlist = self.__endpoints[endpoint_name]['__trunk_vlans']
-                __tvlist.clear()
-                print(str(self.__endpoints))
-                for tv in self.__endpoints[endpoint_name]['trunk_vlans']:
-                    if tv[0]==tv[1]:
-                        __tvlist.append(tv[0])
-                    elif tv[0]<tv[1]:
-                        __tvlist.append(str(tv[0])+".."+str(tv[1]))
+        with self.__lock:
+            for endpoint_name in self.__endpoints:
+                if self.__endpoints[endpoint_name]['trunk_vlans'] is not None:
+                    __tvlist = self.__endpoints[endpoint_name]['__trunk_vlans']
+                    __tvlist.clear()
+                    logging.debug(str(self.__endpoints))
+                    for tv in self.__endpoints[endpoint_name]['trunk_vlans']:
+                        if tv[0]==tv[1]:
+                            __tvlist.append(tv[0])
+                        elif tv[0]<tv[1]:
+                            __tvlist.append(str(tv[0])+".."+str(tv[1]))
 
     def saveFile(self):
         '''
         To print a json file with the original order of keys,
         load the json into a OrderedDict (that stores the original order)
         and we dump the json without sorting the keys (sort_keys=False).
+        The file is written behind: the changes saved within DESCRIPTION_WRITE_DELAY seconds
+        are written all together, replacing the file with a temporary one (atomic for the readers).
         '''
-        if not self.__save:
-            return
-        output_json = json.dumps(self.__dict, sort_keys=False, indent=2)
-        out_file = open(self.__filename, "w")
-        out_file.write(output_json)
+        with self.__lock:
+            if not self.__save:
+                return
+            self.__serialized = json.dumps(self.__dict, sort_keys=False, indent=2).encode('utf-8')
+            self.invalidateDomainInfo()
+            delay = Configuration().DESCRIPTION_WRITE_DELAY
+            if delay <= 0:
+                self.flush()
+            elif self.__write_timer is None:
+                self.__write_timer = threading.Timer(delay, self.flush)
+                self.__write_timer.daemon = True
+                self.__write_timer.start()
+
+    def flush(self):
+        '''
+        Write the pending changes on the dynamic file now.
+        '''
+        with self.__lock:
+            if self.__write_timer is not None:
+                self.__write_timer.cancel()
+                self.__write_timer = None
+            if self.__serialized is None or self.__serialized is self.__written:
+                return
+            temp_filename = self.__filename + ".tmp"
+            try:
+                with open(temp_filename, "wb") as out_file:
+                    out_file.write(self.__serialized)
+                    out_file.flush()
+                    os.fsync(out_file.fileno())
+                os.replace(temp_filename, self.__filename)
+                self.__written = self.__serialized
+            except OSError as ex:
+                logging.error("Cannot write the domain description file '" + self.__filename + "': " + str(ex))
+
+    def getSerialized(self):
+        '''
+        Last saved domain description, same content of the dynamic file once it is written.
+        :return: the json document as bytes, None if the description has never been saved
+        '''
+        with self.__lock:
+            return self.__serialized
+
+    def getDomainInfo(self):
+        '''
+        Parsed domain description, as saved in the dynamic file.
+        It is parsed again only after saveFile() or, until the first save, when the file changes on disk.
+        :rtype: DomainInfo
+        '''
+        with self.__lock:
+            if self.__serialized is not None:
+                mtime = None
+            else:
+                mtime = os.stat(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE).st_mtime_ns
+            if self.__published_info is None or mtime != self.__published_mtime:
+                if self.__serialized is not None:
+                    domain_info = DomainInfo()
+                    domain_info.parse_dict(json.loads(self.__serialized.decode('utf-8')))
+                else:
+                    domain_info = DomainInfo.get_from_file(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE)
+                by_type = {}
+                by_type_lower = {}
+                for functional_capability in domain_info.capabilities.functional_capabilities:
+                    by_type.setdefault(functional_capability.type, functional_capability.name)
+                    by_type_lower.setdefault(functional_capability.type.lower(), functional_capability.name)
+                self.__published_info = domain_info
+                self.__published_mtime = mtime
+                self.__application_by_type = by_type
+                self.__application_by_type_lower = by_type_lower
+            return self.__published_info
+
+    def invalidateDomainInfo(self):
+        with self.__lock:
+            self.__published_info = None
+
+    def getApplicationName(self, capability_type, ignore_case=False):
+        '''
+        Name of the application implementing a functional capability of the given type.
+        :return: the application name, None if the capability is not available
+        '''
+        with self.__lock:
+            self.getDomainInfo()
+            if ignore_case:
+                return self.__application_by_type_lower.get(capability_type.lower())
+            return self.__application_by_type.get(capability_type)
 
     def new_flowrule(self, fr_db_id):
         '''
@@ -70,25 +166,24 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
             1) TRUNK VLAN: remove a busy vlan id from the endpoint 'trunk-vlan' field
             2) DISABLE ENDPOINT: set the endpoint as 'disabled' when has a match that does not specify a vlan_id
         '''
+        with self.__lock:
+            fr = GraphSession().getFlowruleByID(fr_db_id)
+            if fr is None:
+                return
+            match = GraphSession().getMatchByFlowruleID(fr.id)
+            if match is None:
+                return
+            logging.debug("New flow rule on " + str(fr.switch_id) + " port " + str(match.port_in))
+            if self.checkEndpoint(fr.switch_id, match.port_in)==False:
+                return
 
-        fr = GraphSession().getFlowruleByID(fr_db_id)
-        if fr is None:
-            return
-        match = GraphSession().getMatchByFlowruleID(fr.id)
-        if match is None:
-            return
-        print(fr.switch_id)
-        print(match.port_in)
-        if self.checkEndpoint(fr.switch_id, match.port_in)==False:
-            return
-
-        # ( 1 ) REMOVE TRUNK VLAN
-        if match.vlan_id is not None:
-            self.__remove_trunk_vlan(fr.switch_id, match.port_in, match.vlan_id)
+            # ( 1 ) REMOVE TRUNK VLAN
+            if match.vlan_id is not None:
+                self.__remove_trunk_vlan(fr.switch_id, match.port_in, match.vlan_id)
 
-        # ( 2 ) DISABLE ENDPOINT
-        else:
-            self.__disable_endpoint(fr.switch_id, match.port_in)
+            # ( 2 ) DISABLE ENDPOINT
+            else:
+                self.__disable_endpoint(fr.switch_id, match.port_in)
 
     def delete_flowrule(self, fr_db_id):
         '''
@@ -96,24 +191,36 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
             1) TRUNK VLAN: add a free vlan id into the endpoint 'trunk-vlan' field
             2) ENABLE ENDPOINT: set the endpoint as 'enabled'
         '''
+        with self.__lock:
+            fr = GraphSession().getFlowruleByID(fr_db_id)
+            if fr is None:
+                return
+            match = GraphSession().getMatchByFlowruleID(fr.id)
+            if match is None:
+                return
+            self.__release_match(fr.switch_id, match)
 
-        fr = GraphSession().getFlowruleByID(fr_db_id)
-        if fr is None:
-            return
-        match = GraphSession().getMatchByFlowruleID(fr.id)
-        if match is None:
-            return
+    def delete_flowrules(self, flowrules):
+        '''
+        Same as delete_flowrule, for many flowrules already read from the database.
+        :param flowrules: list of (switch id, MatchModel) of the flowrules removed
+        '''
+        with self.__lock:
+            for switch_id, match in flowrules:
+                if match is not None:
+                    self.__release_match(switch_id, match)
 
-        if not self.checkEndpoint(fr.switch_id, match.port_in):
+    def __release_match(self, switch_id, match):
+        if not self.checkEndpoint(switch_id, match.port_in):
             return
 
         # ( 1 ) ADD TRUNK VLAN
         if match.vlan_id is not None:
-            self.__add_trunk_vlan(fr.switch_id, match.port_in, match.vlan_id)
+            self.__add_trunk_vlan(switch_id, match.port_in, match.vlan_id)
 
         # ( 2 ) ENABLE ENDPOINT
         else:
-            self.__enable_endpoint(fr.switch_id, match.port_in)
+            self.__enable_endpoint(switch_id, match.port_in)
 
     def __read_endpoints_and_vlans(self):
 
@@ -267,7 +374,6 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
         self.__domain_info.capabilities.functional_capabilities.append(fc)
         self.__dict = self.__domain_info.get_dict()
 
-    # these three are not used for now, capabilities are always pushed together
     def remove_functional_capability(self, fc_name):
         for fc in self.__domain_info.capabilities.functional_capabilities:
             if fc.name == fc_name:
@@ -275,6 +381,7 @@ class ResourceDescription(object, metaclass=Singleton):  # Singleton Class
                 break
         self.__dict = self.__domain_info.get_dict()
 
+    # these two are not used for now
     def enable_functional_capability(self, fc_name):
         for fc in self.__domain_info.capabilities.functional_capabilities:
             if fc.name == fc_name:
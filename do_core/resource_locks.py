@@ -0,0 +1,98 @@
+"""
+Locks on the shared resources of the domain, so that graphs not sharing
+any resource can be deployed in parallel.
+
+Resources are ranked and a thread can only acquire locks of a rank higher
+than any lock it already holds (locks it already holds can be re-acquired).
+Locks of the same rank are acquired all together, in a fixed order.
+This total order makes the locking deadlock-free:
+ - GRAPH:  a graph session, for its whole deployment, update or deletion
+           (or an idempotency key, while the graph of the first request using it is stored);
+ - PORT:   a switch port, where vlan ids are chosen, while two endpoints are linked;
+ - SWITCH: a switch, where flow names are chosen, while a flow rule is pushed;
+ - TABLE:  a database table, where ids are chosen, while a record is stored.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from do_core.config import Singleton
+from do_core.exception import ResourceLockError
+
+GRAPH = 0
+PORT = 1
+SWITCH = 2
+TABLE = 3
+
+
+class ResourceLocks(object, metaclass=Singleton):
+
+    def __init__(self):
+        self.__guard = threading.Lock()
+        self.__locks = {}   # key -> [RLock, number of threads using it]
+        self.__local = threading.local()
+
+    def graph(self, graph_id):
+        return self.acquire(GRAPH, graph_id)
+
+    def idempotency_key(self, user_id, key):
+        return self.acquire(GRAPH, "idempotency-key/" + str(user_id) + "/" + str(key))
+
+    def ports(self, *ports):
+        """
+        :param ports: (switch_id, port) couples
+        """
+        return self.acquire(PORT, *[str(switch_id) + "/" + str(port) for switch_id, port in ports])
+
+    def switch(self, switch_id):
+        return self.acquire(SWITCH, switch_id)
+
+    def table(self, table_name):
+        return self.acquire(TABLE, table_name)
+
+    @contextmanager
+    def acquire(self, rank, *names):
+        held = self.__held()
+        keys = sorted(set((rank, str(name)) for name in names))
+        new_keys = [key for key in keys if key not in held]
+
+        if len(new_keys) > 0 and len(held) > 0 and max(held)[0] >= rank:
+            raise ResourceLockError("Cannot lock " + str([key[1] for key in new_keys]) + " while holding " +
+                                    str([key[1] for key in held]) + ": locks must be taken in rank order")
+
+        acquired = []
+        try:
+            for key in keys:
+                lock = self.__use(key)
+                lock.acquire()
+                acquired.append(key)
+                held[key] = held.get(key, 0) + 1
+            yield
+        finally:
+            for key in reversed(acquired):
+                held[key] -= 1
+                if held[key] == 0:
+                    del held[key]
+                self.__release(key)
+
+    def __held(self):
+        if not hasattr(self.__local, 'held'):
+            self.__local.held = {}
+        return self.__local.held
+
+    def __use(self, key):
+        with self.__guard:
+            entry = self.__locks.get(key)
+            if entry is None:
+                entry = [threading.RLock(), 0]
+                self.__locks[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def __release(self, key):
+        with self.__guard:
+            entry = self.__locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.__locks[key]
@@ -13,7 +13,7 @@ from do_core.rest_modules.controller_interface import Flow_Interface, Action_Int
 
 class Flow(Flow_Interface):
     def __init__(self, name, flow_id, table_id = 0, priority = 5, installHw = True, 
-                 hard_timeout = 0, idle_timeout = 0, actions = None, match = None):
+                 hard_timeout = 0, idle_timeout = 0, actions = None, match = None, goto_table = None, group_id = None):
         '''
         Constructor for the Flow
         Args:
@@ -35,6 +35,10 @@ class Flow(Flow_Interface):
                 list of Actions for this flow
             match:
                 Match for this flow
+            goto_table:
+                table where the packets continue after the actions (OF1.3, not with Hydrogen)
+            group_id:
+                group the packets are sent to after the actions (OF1.3, not with Hydrogen)
         '''
         self.strict = False
         self.name = name
@@ -47,6 +51,8 @@ class Flow(Flow_Interface):
         
         self.actions = actions or []
         self.match = match
+        self.goto_table = goto_table
+        self.group_id = group_id
     
     
     def getJSON_Hydrogen(self, node):
@@ -139,8 +145,18 @@ class Flow(Flow_Interface):
             j_list_action.append(j_action)
             i = i + 1
         
+        if self.group_id is not None:
+            j_list_action.append({'order': i, 'group-action': {'group-id': self.group_id}})
+        
         j_flow['flow']['instructions']['instruction']['apply-actions']['action'] = j_list_action
         
+        if self.goto_table is not None:
+            j_goto_table = {}
+            j_goto_table['order'] = str(1)
+            j_goto_table['go-to-table'] = {}
+            j_goto_table['go-to-table']['table_id'] = self.goto_table
+            j_flow['flow']['instructions']['instruction'] = [j_flow['flow']['instructions']['instruction'], j_goto_table]
+        
         
         if self.match is not None:
             j_flow['flow']['match'] = {}
@@ -154,7 +170,10 @@ class Flow(Flow_Interface):
                 j_flow['flow']['match']['vlan-match']['vlan-id']['vlan-id-present'] = self.match.vlan_id_present
             if (self.match.eth_match is True):
                 j_flow['flow']['match']['ethernet-match'] = {}
-                if (self.match.ethertype is not None):
+                if (self.match.mpls_label is not None):
+                    j_flow['flow']['match']['ethernet-match']['ethernet-type'] = {}
+                    j_flow['flow']['match']['ethernet-match']['ethernet-type']['type'] = 34887
+                elif (self.match.ethertype is not None):
                     j_flow['flow']['match']['ethernet-match']['ethernet-type'] = {}
                     j_flow['flow']['match']['ethernet-match']['ethernet-type']['type'] = self.match.ethertype
                 '''
@@ -196,6 +215,9 @@ class Flow(Flow_Interface):
                 else:
                     logging.warning('destPort discarded. You have to set also the "protocol" field')
             '''
+            if (self.match.mpls_label is not None):
+                j_flow['flow']['match']['protocol-match-fields'] = {}
+                j_flow['flow']['match']['protocol-match-fields']['mpls-label'] = self.match.mpls_label
         return json.dumps(j_flow)
         
 
@@ -216,6 +238,44 @@ class Flow(Flow_Interface):
 
         return self.getJSON_HeliumLithium()
     
+    
+    
+class Group(object):
+    def __init__(self, group_id, output_ports, group_type = "group-select", watch_ports = None):
+        '''
+        OpenFlow group with a bucket for each output port (OF1.3, not with Hydrogen)
+        Args:
+            group_type:
+                group-select (a bucket for each packet, chosen by the switch)
+                or group-ff (fast failover: the first bucket whose port is up)
+            watch_ports:
+                port watched by each group-ff bucket (default: its output port)
+        '''
+        self.group_id = group_id
+        self.output_ports = output_ports
+        self.group_type = group_type
+        self.watch_ports = watch_ports if watch_ports is not None else output_ports
+    
+    def getJSON(self):
+        j_group = {}
+        j_group['group-id'] = self.group_id
+        j_group['group-type'] = self.group_type
+        j_group['group-name'] = "group_" + str(self.group_id)
+        j_group['buckets'] = {}
+        j_group['buckets']['bucket'] = []
+        i = 0
+        for port, watch_port in zip(self.output_ports, self.watch_ports):
+            j_bucket = {}
+            j_bucket['bucket-id'] = i
+            j_bucket['action'] = [{'order': 0, 'output-action': {'output-node-connector': port}}]
+            if self.group_type == "group-select":
+                j_bucket['weight'] = 1
+            else:
+                j_bucket['watch_port'] = watch_port
+            j_group['buckets']['bucket'].append(j_bucket)
+            i = i + 1
+        return json.dumps({'group': [j_group]})
+    
             
 
 
@@ -235,6 +295,8 @@ class Action(Action_Interface):
         self.max_length = None
         self.vlan_id = None
         self.vlan_id_present = False
+        self.mpls_label = None
+        self.ethernet_type = None
         
         if action is not None:
             #TODO: add remaining actions
@@ -294,6 +356,24 @@ class Action(Action_Interface):
     def setPopVlanAction(self):
         self.action_type="pop-vlan-action"
         self.priority = 2
+
+
+    def setPushMplsAction(self):
+        self.action_type = "push-mpls-action"
+        self.ethernet_type = 34887  # 0x8847, MPLS unicast
+        self.priority = 2
+
+
+    def setMplsLabelAction(self, label):
+        self.action_type = "mpls-label"
+        self.mpls_label = label
+        self.priority = 8
+
+
+    def setPopMplsAction(self, ether_type):
+        self.action_type = "pop-mpls-action"
+        self.ethernet_type = int(str(ether_type), 0)  # ethernet type of the packet carried
+        self.priority = 2
     
     '''
     def setEthernetAddressAction(self, _type, address):
@@ -413,6 +493,16 @@ class Action(Action_Interface):
             j_action['set-field']['vlan-match']['vlan-id'] = {}
             j_action['set-field']['vlan-match']['vlan-id']['vlan-id'] = self.vlan_id
             j_action['set-field']['vlan-match']['vlan-id']['vlan-id-present'] = self.vlan_id_present
+        elif self.action_type == "push-mpls-action":
+            j_action['push-mpls-action'] = {}
+            j_action['push-mpls-action']['ethernet-type'] = self.ethernet_type
+        elif self.action_type == "mpls-label":
+            j_action['set-field'] = {}
+            j_action['set-field']['protocol-match-fields'] = {}
+            j_action['set-field']['protocol-match-fields']['mpls-label'] = self.mpls_label
+        elif self.action_type == "pop-mpls-action":
+            j_action['pop-mpls-action'] = {}
+            j_action['pop-mpls-action']['ethernet-type'] = self.ethernet_type
         
         '''
         elif self.action_type == "set-dl-src-action":
@@ -467,6 +557,7 @@ class Match(Match_Interface):
         self.ethertype = None
         self.eth_source = None
         self.eth_dest = None
+        self.mpls_label = None
         
         '''
         self.ip_protocol = None
@@ -511,6 +602,11 @@ class Match(Match_Interface):
         self.eth_match = True
         self.eth_dest = eth_dest
     
+    def setMplsLabelMatch(self, label):
+        # the ethernet type of a labelled packet is MPLS, whatever the ethernet type matched on the ingress switch
+        self.eth_match = True
+        self.mpls_label = label
+    
     @property
     def InputPort(self):
         return self.input_port
@@ -519,6 +615,10 @@ class Match(Match_Interface):
     def VlanID(self):
         return self.vlan_id
     
+    @property
+    def MplsLabel(self):
+        return self.mpls_label
+    
     @property
     def EtherSource(self):
         return self.eth_source
@@ -29,7 +29,13 @@ class ODL_Rest(object):
             self.odl_topology_path = "/restconf/operational/network-topology:network-topology/"
             self.odl_flows_path = "/restconf/config/opendaylight-inventory:nodes"
             self.odl_node="/node"
-            self.odl_flow="/table/0/flow/"
+            self.odl_flow="/table/%d/flow/"
+    
+    
+    def __flowPath(self, table_id):
+        if self.version == "Hydrogen":
+            return self.odl_flow
+        return self.odl_flow % int(table_id)
     
     
     def __logging_debug(self, response, url, jsonFlow=None):
@@ -87,7 +93,7 @@ class ODL_Rest(object):
     
     
     
-    def createFlow(self, odl_endpoint, odl_user, odl_pass, jsonFlow, switch_id, flow_id):
+    def createFlow(self, odl_endpoint, odl_user, odl_pass, jsonFlow, switch_id, flow_id, table_id=0):
         '''
         Create a flow on the switch selected (Currently using OF1.0)
         Args:
@@ -97,11 +103,13 @@ class ODL_Rest(object):
                 OpenDaylight id of the switch (example: openflow:1234567890)
             flow_id:
                 OpenFlow id of the flow
+            table_id:
+                table of the flow (only table 0 with Hydrogen)
         Exceptions:
             raise the requests.HTTPError exception connected to the REST call in case of HTTP error
         '''
         headers = {'Accept': 'application/json', 'Content-type':'application/json'}
-        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+str(switch_id)+self.odl_flow+str(flow_id)
+        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+str(switch_id)+self.__flowPath(table_id)+str(flow_id)
         response = requests.put(url,jsonFlow,headers=headers, auth=(odl_user, odl_pass))
         
         self.__logging_debug(response, url, jsonFlow)
@@ -110,7 +118,7 @@ class ODL_Rest(object):
     
     
     
-    def deleteFlow(self, odl_endpoint, odl_user, odl_pass, switch_id, flow_id):
+    def deleteFlow(self, odl_endpoint, odl_user, odl_pass, switch_id, flow_id, table_id=0):
         '''
         Delete a flow
         Args:
@@ -118,11 +126,57 @@ class ODL_Rest(object):
                 OpenDaylight id of the switch (example: openflow:1234567890)
             flow_id:
                 OpenFlow id of the flow
+            table_id:
+                table of the flow (only table 0 with Hydrogen)
+        Exceptions:
+            raise the requests.HTTPError exception connected to the REST call in case of HTTP error
+        '''
+        headers = {'Accept': 'application/json', 'Content-type':'application/json'}
+        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+switch_id+self.__flowPath(table_id)+str(flow_id)
+        response = requests.delete(url,headers=headers, auth=(odl_user, odl_pass))
+        
+        self.__logging_debug(response, url)
+        response.raise_for_status()
+        return response.text
+
+    
+    
+    def createGroup(self, odl_endpoint, odl_user, odl_pass, jsonGroup, switch_id, group_id):
+        '''
+        Create a group on the switch selected (OF1.3, not supported by Hydrogen)
+        Args:
+            jsonGroup:
+                JSON structure which describes the group (type and buckets)
+            switch_id:
+                OpenDaylight id of the switch (example: openflow:1234567890)
+            group_id:
+                OpenFlow id of the group
+        Exceptions:
+            raise the requests.HTTPError exception connected to the REST call in case of HTTP error
+        '''
+        headers = {'Accept': 'application/json', 'Content-type':'application/json'}
+        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+str(switch_id)+"/group/"+str(group_id)
+        response = requests.put(url,jsonGroup,headers=headers, auth=(odl_user, odl_pass))
+        
+        self.__logging_debug(response, url, jsonGroup)
+        response.raise_for_status()
+        return response.text
+    
+    
+    
+    def deleteGroup(self, odl_endpoint, odl_user, odl_pass, switch_id, group_id):
+        '''
+        Delete a group
+        Args:
+            switch_id:
+                OpenDaylight id of the switch (example: openflow:1234567890)
+            group_id:
+                OpenFlow id of the group
         Exceptions:
             raise the requests.HTTPError exception connected to the REST call in case of HTTP error
         '''
         headers = {'Accept': 'application/json', 'Content-type':'application/json'}
-        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+switch_id+self.odl_flow+str(flow_id)
+        url = odl_endpoint+self.odl_flows_path+self.odl_node+"/"+str(switch_id)+"/group/"+str(group_id)
         response = requests.delete(url,headers=headers, auth=(odl_user, odl_pass))
         
         self.__logging_debug(response, url)
@@ -15,12 +15,16 @@ from do_core.rest_modules.controller_interface.objects import Flow_Interface, Ac
 
 
 class Flow(Flow_Interface):
-    def __init__(self, deviceId, priority=100, isPermanent=True, timeout=0, treatments=None, selector=None):
+    def __init__(self, deviceId, priority=100, isPermanent=True, timeout=0, treatments=None, selector=None,
+                 tableId=0, gotoTable=None, groupId=None):
         
         self.deviceId = deviceId
         self.priority = priority
         self.isPermanent = isPermanent
         self.timeout = timeout
+        self.tableId = tableId
+        self.gotoTable = gotoTable
+        self.groupId = groupId
         
         self.treatments = treatments or []
         self.selector = selector
@@ -35,6 +39,8 @@ class Flow(Flow_Interface):
         j_flow['priority'] = self.priority
         j_flow['isPermanent'] = self.isPermanent
         j_flow['timeout'] = self.timeout
+        if self.tableId != 0:
+            j_flow['tableId'] = self.tableId
         
         j_flow['treatment'] = {}
         j_flow['selector'] = {}
@@ -52,11 +58,54 @@ class Flow(Flow_Interface):
             j_treatments.append(j_treatment)
             i = i + 1
         
+        if self.groupId is not None:
+            j_treatments.append({'type': 'GROUP', 'groupId': self.groupId, 'order': i})
+            i = i + 1
+        if self.gotoTable is not None:
+            j_treatments.append({'type': 'TABLE', 'tableId': self.gotoTable, 'order': i})
+        
         j_flow['treatment']['instructions'] = j_treatments
         
         return json.dumps(j_flow)
 
 
+class Group(object):
+    def __init__(self, deviceId, groupId, outputPorts, groupType='SELECT', watchPorts=None):
+        '''
+        OpenFlow group with a bucket for each output port
+        Args:
+            groupId:
+                id of the group on the device, also used as application cookie (to delete it)
+            groupType:
+                SELECT (a bucket for each packet, chosen by the switch) or FAILOVER (the first bucket whose port is up)
+            watchPorts:
+                port watched by each FAILOVER bucket (default: its output port)
+        '''
+        self.deviceId = deviceId
+        self.groupId = groupId
+        self.outputPorts = outputPorts
+        self.groupType = groupType
+        self.watchPorts = watchPorts if watchPorts is not None else outputPorts
+
+    @staticmethod
+    def appCookie(groupId):
+        return hex(int(groupId))
+
+    def getJSON(self):
+        j_group = {}
+        j_group['type'] = self.groupType
+        j_group['deviceId'] = self.deviceId
+        j_group['groupId'] = self.groupId
+        j_group['appCookie'] = self.appCookie(self.groupId)
+        j_group['buckets'] = []
+        for port, watch_port in zip(self.outputPorts, self.watchPorts):
+            j_bucket = {'treatment': {'instructions': [{'type': 'OUTPUT', 'port': port}]}}
+            if self.groupType == 'FAILOVER':
+                j_bucket['watchPort'] = watch_port
+            j_group['buckets'].append(j_bucket)
+        return json.dumps(j_group)
+
+
 
 
 class Treatment(Action_Interface):
@@ -76,6 +125,7 @@ class Treatment(Action_Interface):
         self.port = None
         self.output_port = None
         self.vlanId = None
+        self.mplsLabel = None
         
         if action is not None:
             #TODO: add remaining actions
@@ -165,6 +215,40 @@ class Treatment(Action_Interface):
         self.json_instr['subtype'] = self.subtype
     
     
+    def setPushMplsAction(self):
+        self.type = 'L2MODIFICATION'
+        self.subtype = 'MPLS_PUSH'
+        self.priority = 2
+        
+        self.json_instr = {}
+        self.json_instr['type'] = self.type
+        self.json_instr['subtype'] = self.subtype
+        self.json_instr['ethernetType'] = 34887     # 0x8847, MPLS unicast
+        
+        
+    def setMplsLabelAction(self, label):
+        self.type = 'L2MODIFICATION'
+        self.subtype = 'MPLS_LABEL'
+        self.mplsLabel = label
+        self.priority = 8
+        
+        self.json_instr = {}
+        self.json_instr['type'] = self.type
+        self.json_instr['subtype'] = self.subtype
+        self.json_instr['label'] = self.mplsLabel
+        
+        
+    def setPopMplsAction(self, ether_type):
+        self.type = 'L2MODIFICATION'
+        self.subtype = 'MPLS_POP'
+        self.priority = 2
+        
+        self.json_instr = {}
+        self.json_instr['type'] = self.type
+        self.json_instr['subtype'] = self.subtype
+        self.json_instr['ethernetType'] = int(str(ether_type), 0)    # ethernet type of the packet carried
+    
+    
     def is_push_vlan_action(self):
         return self.subtype == "VLAN_PUSH"
     
@@ -262,6 +346,7 @@ class Selector(Match_Interface):
         self.port_in = None
         self.vlan_id = None
         self.eth_type = None        
+        self.mpls_label = None
         
         if match is not None:
             #TODO: add remaining match
@@ -303,6 +388,19 @@ class Selector(Match_Interface):
         self.json_criteria['EthType']['type'] = self.type
         self.json_criteria['EthType']['ethType'] = self.eth_type
         
+        
+    def setMplsLabelMatch(self, label):
+        # the ethernet type of a labelled packet is MPLS, whatever the ethernet type matched on the ingress switch
+        self.type = 'MPLS_LABEL'
+        self.mpls_label = label
+        
+        self.json_criteria['EthType'] = {}
+        self.json_criteria['EthType']['type'] = 'ETH_TYPE'
+        self.json_criteria['EthType']['ethType'] = '0x8847'
+        self.json_criteria['MplsLabel'] = {}
+        self.json_criteria['MplsLabel']['type'] = self.type
+        self.json_criteria['MplsLabel']['label'] = self.mpls_label
+        
     
     @property
     def InputPort(self):
@@ -312,6 +410,10 @@ class Selector(Match_Interface):
     def VlanID(self):
         return self.vlan_id
     
+    @property
+    def MplsLabel(self):
+        return self.mpls_label
+    
     
     def getNffgMatch(self, nffg_flowrule):
         
@@ -5,6 +5,7 @@ Created on 2/feb/2016
 @author: gabrielecastellano
 """
 
+import json
 import logging
 
 import requests
@@ -22,6 +23,8 @@ class ONOS_Rest(RestInterface):
         self.rest_devices_url = '/onos/v1/devices'
         self.rest_links_url = '/onos/v1/links'
         self.rest_flows_url = '/onos/v1/flows'  # /onos/v1/flows/{DeviceId}
+        self.rest_port_statistics_url = '/onos/v1/statistics/ports'
+        self.rest_groups_url = '/onos/v1/groups'  # /onos/v1/groups/{DeviceId}
         self.rest_apps_url = '/onos/v1/applications'
         self.rest_network_config_url = '/onos/v1/network/configuration'
         self.apps_capabilities_url = '/onos/apps-capabilities/capability'
@@ -64,6 +67,16 @@ class ONOS_Rest(RestInterface):
         response.raise_for_status()
         return response.text
 
+    def getPortStatistics(self, onos_endpoint, onos_user, onos_pass):
+        headers = {'Accept': 'application/json'}
+        url = onos_endpoint+self.rest_port_statistics_url
+
+        response = requests.get(url, headers=headers, auth=(onos_user, onos_pass))
+
+        self.__logging_debug(response, url)
+        response.raise_for_status()
+        return response.text
+
     def createFlow(self, onos_endpoint, onos_user, onos_pass, jsonFlow, switch_id):
         '''
         Create a flow on the switch selected (Currently using OF1.0)
@@ -107,6 +120,64 @@ class ONOS_Rest(RestInterface):
         response.raise_for_status()
         return response.text
 
+    def deleteFlows(self, onos_endpoint, onos_user, onos_pass, switch_id, flow_ids):
+        '''
+        Delete a batch of flows with a single request
+        Args:
+            switch_id:
+                ONOS id of the switch (example: of:1234567890)
+            flow_ids:
+                OpenFlow ids of the flows
+        Exceptions:
+            raise the requests.HTTPError exception connected to the REST call in case of HTTP error
+        '''
+        headers = {'Accept': 'application/json', 'Content-type': 'application/json'}
+        url = onos_endpoint+self.rest_flows_url
+        body = json.dumps({'flows': [{'deviceId': str(switch_id), 'flowId': str(flow_id)} for flow_id in flow_ids]})
+        response = requests.delete(url, data=body, headers=headers, auth=(onos_user, onos_pass))
+
+        self.__logging_debug(response, url, body)
+        response.raise_for_status()
+        return response.text
+
+    def createGroup(self, onos_endpoint, onos_user, onos_pass, jsonGroup, switch_id):
+        '''
+        Create a group on the switch selected
+        Args:
+            jsonGroup:
+                JSON structure which describes the group (type, buckets, application cookie)
+            switch_id:
+                ONOS id of the switch (example: of:1234567890)
+        Exceptions:
+            raise the requests.HTTPError exception connected to the REST call in case of HTTP error
+        '''
+        headers = {'Accept': 'application/json', 'Content-type': 'application/json'}
+        url = onos_endpoint+self.rest_groups_url+"/"+str(switch_id)
+        response = requests.post(url, jsonGroup, headers=headers, auth=(onos_user, onos_pass))
+
+        self.__logging_debug(response, url, jsonGroup)
+        response.raise_for_status()
+        return response.text
+
+    def deleteGroup(self, onos_endpoint, onos_user, onos_pass, switch_id, app_cookie):
+        '''
+        Delete a group
+        Args:
+            switch_id:
+                ONOS id of the switch (example: of:1234567890)
+            app_cookie:
+                application cookie given to the group when it was created
+        Exceptions:
+            raise the requests.HTTPError exception connected to the REST call in case of HTTP error
+        '''
+        headers = {'Accept': 'application/json'}
+        url = onos_endpoint+self.rest_groups_url+"/"+str(switch_id)+"/"+str(app_cookie)
+        response = requests.delete(url, headers=headers, auth=(onos_user, onos_pass))
+
+        self.__logging_debug(response, url)
+        response.raise_for_status()
+        return response.text
+
     def activateApp(self, onos_endpoint, onos_user, onos_pass, app_name):
         """
         Activate an application on top of the controller
@@ -175,6 +246,29 @@ class ONOS_Rest(RestInterface):
         response.raise_for_status()
         return response.text
 
+    def get_applications_capabilities_if_changed(self, onos_endpoint, onos_user, onos_pass, etag=None):
+        """
+        Return the whole set of applications capabilities, if changed since the response tagged by etag
+        (conditional request, ignored by the application if not supported)
+        :param onos_endpoint: controller REST API address
+        :param onos_user: controller user
+        :param onos_pass: controller password for user
+        :param etag: tag of the last response received, if any
+        :return: the response body (None if not changed) and its tag
+        """
+        headers = {'Accept': 'application/json'}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        url = onos_endpoint+self.apps_capabilities_url
+
+        response = requests.get(url, headers=headers, auth=(onos_user, onos_pass))
+
+        self.__logging_debug(response, url)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.text, response.headers.get('ETag')
+
     def get_application_capability(self, onos_endpoint, onos_user, onos_pass, app_name):
         """
         Return the capability of a specific application if any
@@ -0,0 +1,42 @@
+"""
+Flow rules of the graphs traversing each link and device of the network.
+The index is built from the external flows stored for the compiled paths, when it is needed
+(see GraphSession().getFlowPathIndex()), so it always reflects the graphs deployed.
+"""
+
+from collections import OrderedDict
+
+
+class FlowPathIndex(object):
+
+    def __init__(self):
+        self.__ports = {}       # (switch id, port) -> set of (session id, graph flow rule id)
+        self.__switches = {}    # switch id -> set of (session id, graph flow rule id)
+
+    def add(self, switch_id, ports, session_id, graph_flow_rule_id):
+        """
+        Index a flow of a graph flow rule.
+        :param ports: ports of the switch used by the flow (ingress and output ports, None are ignored)
+        """
+        flowrule = (session_id, graph_flow_rule_id)
+        self.__switches.setdefault(switch_id, set()).add(flowrule)
+        for port in ports:
+            if port is not None:
+                self.__ports.setdefault((switch_id, str(port)), set()).add(flowrule)
+
+    def flowrules(self, ports=(), switch_ids=()):
+        """
+        Graph flow rules traversing any of the links or devices given.
+        :param ports: (switch id, port) couples, ends of the links
+        :param switch_ids: devices
+        :return: OrderedDict session id -> list of graph flow rule ids
+        """
+        flowrules = set()
+        for switch_id, port in ports:
+            flowrules.update(self.__ports.get((switch_id, str(port)), ()))
+        for switch_id in switch_ids:
+            flowrules.update(self.__switches.get(switch_id, ()))
+        sessions = OrderedDict()
+        for session_id, graph_flow_rule_id in sorted(flowrules):
+            sessions.setdefault(session_id, []).append(graph_flow_rule_id)
+        return sessions
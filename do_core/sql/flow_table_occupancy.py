@@ -0,0 +1,102 @@
+"""
+Occupancy of the flow tables of the switches: external flows installed, per switch and per table.
+Counters are kept in memory and updated by GraphSession every time external flows are stored or deleted.
+"""
+
+import threading
+
+from do_core.config import Configuration, Singleton
+
+
+class FlowTableOccupancy(object, metaclass=Singleton):
+    """
+    Counters are read from the database once (see load()), before any flow is stored or deleted:
+    use GraphSession().getFlowTableOccupancy() to get them.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__switches = {}    # switch id -> table id -> flows
+        self.__loaded = False
+
+    def load(self, loader):
+        """
+        Read the counters, if not done yet.
+        :param loader: function returning (switch id, table id, flows) for each table in use
+        :return: self
+        """
+        with self.__lock:
+            if not self.__loaded:
+                self.__switches.clear()
+                for switch_id, table_id, flows in loader():
+                    self.__switches.setdefault(switch_id, {})[table_id] = flows
+                self.__loaded = True
+        return self
+
+    def add(self, switch_id, table_id, flows=1):
+        with self.__lock:
+            tables = self.__switches.setdefault(switch_id, {})
+            tables[table_id] = tables.get(table_id, 0) + flows
+
+    def remove(self, switch_id, table_id, flows=1):
+        with self.__lock:
+            tables = self.__switches.get(switch_id)
+            if tables is None or table_id not in tables:
+                return
+            tables[table_id] = max(tables[table_id] - flows, 0)
+            if tables[table_id] == 0:
+                del tables[table_id]
+            if len(tables) == 0:
+                del self.__switches[switch_id]
+
+    def reset(self):
+        with self.__lock:
+            self.__switches.clear()
+
+    def flows(self, switch_id):
+        with self.__lock:
+            return sum(self.__switches.get(switch_id, {}).values())
+
+    def usage(self, switch_id):
+        """
+        :return: fraction of the capacity of the switch in use, None if the switch has no capacity limit
+        """
+        capacity = self.capacity(switch_id)
+        if capacity is None:
+            return None
+        return self.flows(switch_id) / capacity
+
+    def has_capacities(self):
+        return Configuration().FLOW_TABLE_DEFAULT_CAPACITY > 0 or \
+            any(capacity > 0 for capacity in Configuration().FLOW_TABLE_CAPACITIES.values())
+
+    @staticmethod
+    def capacity(switch_id):
+        """
+        :return: flows the switch can hold, None if not limited
+        """
+        capacity = Configuration().FLOW_TABLE_CAPACITIES.get(switch_id, Configuration().FLOW_TABLE_DEFAULT_CAPACITY)
+        if capacity <= 0:
+            return None
+        return capacity
+
+    def snapshot(self):
+        """
+        :return: dict switch id -> flows, flows per table, capacity and fraction in use,
+                 for the switches holding flows or with a capacity of their own
+        """
+        with self.__lock:
+            switches = {switch_id: dict(tables) for switch_id, tables in self.__switches.items()}
+        for switch_id in Configuration().FLOW_TABLE_CAPACITIES:
+            switches.setdefault(switch_id, {})
+        occupancy = {}
+        for switch_id, tables in switches.items():
+            flows = sum(tables.values())
+            capacity = self.capacity(switch_id)
+            occupancy[switch_id] = {
+                'flows': flows,
+                'tables': {str(table_id): count for table_id, count in sorted(tables.items())},
+                'capacity': capacity,
+                'usage': flows / capacity if capacity is not None else None
+            }
+        return occupancy
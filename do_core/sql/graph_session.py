@@ -6,16 +6,22 @@ Created on Jun 20, 2015
 @author: gabrielecastellano
 """
 
-import datetime, logging, uuid
+import datetime, json, logging, uuid, zlib
+from collections import OrderedDict
 
 from do_core.config import Configuration
-from domain_information_library.domain_info import DomainInfo
 from nffg_library.nffg import NF_FG, EndPoint, FlowRule, Match, Action, VNF, Port
 
-from sqlalchemy import Column, VARCHAR, Boolean, Integer, DateTime, Text, asc, desc, func
+from sqlalchemy import Column, VARCHAR, Boolean, Integer, DateTime, Text, LargeBinary, asc, desc, func, or_, and_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.exc import NoResultFound
 from do_core.sql.sql_server import get_session
+from do_core.sql.nffg_cache import NffgCache
+from do_core.sql.flow_table_occupancy import FlowTableOccupancy
+from do_core.sql.port_load import PortLoad
+from do_core.sql.match_overlap_index import MatchOverlapIndex, MATCH_FIELDS
+from do_core.sql.flow_path_index import FlowPathIndex
+from do_core.resource_locks import ResourceLocks
 from do_core.exception import GraphError
 
 Base = declarative_base()
@@ -24,7 +30,8 @@ Base = declarative_base()
 class GraphSessionModel(Base):
     __tablename__ = 'graph_session'
     attributes = ['session_id', 'user_id', 'graph_id', 'graph_name', 'status',
-                  'started_at', 'last_update', 'error', 'ended', 'description']
+                  'started_at', 'last_update', 'error', 'ended', 'description', 'graph_hash', 'idempotency_key',
+                  'snapshot']
     session_id = Column(VARCHAR(64), primary_key=True)
     user_id = Column(VARCHAR(64))
     graph_id = Column(Text)     # id in the json [see "forwarding-graph" section]
@@ -35,6 +42,9 @@ class GraphSessionModel(Base):
     error = Column(DateTime)
     ended = Column(DateTime)
     description = Column(VARCHAR(256))
+    graph_hash = Column(VARCHAR(64))            # fingerprint of the graph deployed (see DO.nffg_fingerprint)
+    idempotency_key = Column(VARCHAR(256))      # key sent by the client with the creation request, if any
+    snapshot = Column(LargeBinary)              # compressed json of the graph, stored when it gets 'complete'
 
 
 class PortModel(Base):
@@ -82,7 +92,8 @@ class EndpointResourceModel(Base):
 class FlowRuleModel(Base):
     __tablename__ = 'flow_rule'
     attributes = ['id', 'graph_flow_rule_id', 'internal_id', 'session_id', 
-                  'switch_id', 'type', 'priority','status', 'creation_date','last_update','description']
+                  'switch_id', 'type', 'priority','status', 'creation_date','last_update','description', 'tunnel_id',
+                  'table_id', 'mpls_label']
     id = Column(Integer, primary_key=True)
     graph_flow_rule_id = Column(VARCHAR(64)) # id in the json [see "flow-rules" section]
     internal_id = Column(VARCHAR(64)) # auto-generated id, for the same graph_flow_rule_id
@@ -95,6 +106,9 @@ class FlowRuleModel(Base):
     creation_date = Column(DateTime)
     last_update = Column(DateTime, default=func.now())
     description = Column(VARCHAR(128))
+    tunnel_id = Column(Integer)     # = VlanTunnelModel.id, for the flows of a shared tunnel and the flows entering it
+    table_id = Column(Integer)      # OpenFlow table of the flow (NULL = table 0)
+    mpls_label = Column(Integer)    # MPLS label matched by the flow (path_tagging = mpls)
     
 
 class MatchModel(Base):
@@ -181,9 +195,47 @@ class VnfPortModel(Base):
     name = Column(VARCHAR(64))
 
 
+class VlanTunnelModel(Base):
+    '''
+        Internal vlan tunnel shared by the flowrules linking the same endpoints along the same path.
+        Its flows are stored as flowrules of the pseudo session TUNNEL_SESSION_PREFIX+id;
+        ref_count is the number of flowrules entering it (the tunnel is removed when it drops to 0).
+    '''
+    __tablename__ = 'vlan_tunnel'
+    attributes = ['id', 'tunnel_key', 'vlan_in', 'ref_count', 'creation_date']
+    id = Column(Integer, primary_key=True)
+    tunnel_key = Column(VARCHAR(64))    # fingerprint of path, egress endpoint and egress actions
+    vlan_in = Column(Integer)           # vlan id pushed by the flowrules entering the tunnel
+    ref_count = Column(Integer)
+    creation_date = Column(DateTime)
+
+
+class GroupModel(Base):
+    '''
+        OpenFlow group installed on a switch for a flowrule of a session (e.g. the select group
+        spreading its packets over equal cost paths); group_id is unique on the switch.
+    '''
+    __tablename__ = 'flow_group'
+    attributes = ['id', 'session_id', 'graph_flow_rule_id', 'switch_id', 'group_id', 'creation_date']
+    id = Column(Integer, primary_key=True)
+    session_id = Column(VARCHAR(64))
+    graph_flow_rule_id = Column(VARCHAR(64))
+    switch_id = Column(VARCHAR(64))
+    group_id = Column(Integer)
+    creation_date = Column(DateTime)
+
+
 # ------------------------------------------
 
 
+# flows of the tunnel with id X are stored in the session TUNNEL_SESSION_PREFIX+X
+TUNNEL_SESSION_PREFIX = 'vlan-tunnel-'
+
+# tables holding records of a session
+SESSION_MODELS = [GraphSessionModel, EndpointModel, EndpointResourceModel, PortModel, FlowRuleModel, MatchModel,
+                  ActionModel, VlanModel, VnfModel, VnfPortModel, GroupModel]
+
+
 class GraphSession(object):
     def __init__(self):
         pass
@@ -204,6 +256,77 @@ class GraphSession(object):
         return session_ref
     
     
+    def getUserGraphSessionByIdempotencyKey(self, user_id, idempotency_key):
+        session = get_session()
+        return session.query(GraphSessionModel).filter_by(user_id=user_id).filter_by(idempotency_key=idempotency_key)\
+            .filter_by(ended=None).filter_by(error=None).first()
+
+    def getEndedSessionIDs(self, before, limit):
+        '''
+        Sessions of graphs deleted, or failed, before the given time.
+        '''
+        session = get_session()
+        rows = session.query(GraphSessionModel.session_id).filter(
+            or_(GraphSessionModel.ended < before, GraphSessionModel.error < before)).limit(limit).all()
+        return [row.session_id for row in rows]
+
+    def getSessionsRecords(self, session_ids):
+        '''
+        All the records of the given sessions, in every table.
+        :return: session id -> table name -> list of records (column name -> value)
+        '''
+        session = get_session()
+
+        def as_dict(record):
+            return OrderedDict((column.name, getattr(record, column.key)) for column in record.__table__.columns)
+
+        records = OrderedDict((session_id, OrderedDict((model.__tablename__, []) for model in SESSION_MODELS))
+                              for session_id in session_ids)
+        session_of_endpoint = {}
+        session_of_flow_rule = {}
+        session_of_vnf = {}
+        for model in (GraphSessionModel, EndpointModel, PortModel, FlowRuleModel, VnfModel, GroupModel):
+            for record in session.query(model).filter(model.session_id.in_(session_ids)).all():
+                records[record.session_id][model.__tablename__].append(as_dict(record))
+                if model is EndpointModel:
+                    session_of_endpoint[record.id] = record.session_id
+                elif model is FlowRuleModel:
+                    session_of_flow_rule[record.id] = record.session_id
+                elif model is VnfModel:
+                    session_of_vnf[record.id] = record.session_id
+        for model, column, owners in ((EndpointResourceModel, 'endpoint_id', session_of_endpoint),
+                                      (MatchModel, 'flow_rule_id', session_of_flow_rule),
+                                      (ActionModel, 'flow_rule_id', session_of_flow_rule),
+                                      (VlanModel, 'flow_rule_id', session_of_flow_rule),
+                                      (VnfPortModel, 'vnf_id', session_of_vnf)):
+            if len(owners) == 0:
+                continue
+            for record in session.query(model).filter(getattr(model, column).in_(list(owners))).all():
+                records[owners[getattr(record, column)]][model.__tablename__].append(as_dict(record))
+        return records
+
+    def getSessionResources(self, session_id):
+        '''
+        Everything to release when the graph of a session is deleted, read all together.
+        :return: dict with the ports of the 'gre-tunnel' endpoints ('gre_ports'), the external flowrules
+                 with their match ('external_flowrules', list of (FlowRuleModel, MatchModel)), the vnfs ('vnfs')
+                 and the groups ('groups')
+        '''
+        session = get_session()
+        gre_ports = session.query(PortModel)\
+            .join(EndpointResourceModel, and_(EndpointResourceModel.resource_id == PortModel.id,
+                                              EndpointResourceModel.resource_type == 'port'))\
+            .join(EndpointModel, EndpointModel.id == EndpointResourceModel.endpoint_id)\
+            .filter(EndpointModel.session_id == session_id)\
+            .filter(EndpointModel.type == 'gre-tunnel').all()
+        external_flowrules = session.query(FlowRuleModel, MatchModel)\
+            .outerjoin(MatchModel, MatchModel.flow_rule_id == FlowRuleModel.id)\
+            .filter(FlowRuleModel.session_id == session_id)\
+            .filter(FlowRuleModel.type == 'external').all()
+        vnfs = session.query(VnfModel).filter_by(session_id=session_id).all()
+        groups = session.query(GroupModel).filter_by(session_id=session_id).all()
+        return {'gre_ports': gre_ports, 'external_flowrules': external_flowrules, 'vnfs': vnfs, 'groups': groups}
+
     def getAllExternalFlowrules(self):
         session = get_session()
         return session.query(FlowRuleModel).filter_by(type = 'external').all()
@@ -304,16 +427,9 @@ class GraphSession(object):
         Check if it is already exists: if yes, repeat the computation. 
         '''
         session = get_session()
-        rows = session.query(GraphSessionModel.session_id).all()
-        
         while True:
             session_id = uuid.uuid4().hex
-            found = False
-            for row in rows:
-                if(row.session_id == session_id):
-                    found = True
-                    break
-            if found==False:
+            if session.query(GraphSessionModel.session_id).filter_by(session_id=session_id).first() is None:
                 return session_id
     
     
@@ -394,65 +510,137 @@ class GraphSession(object):
             return False
     
     
+    def getExternalFlowruleInternalIDs(self, switch_id):
+        session = get_session()
+        rows = session.query(FlowRuleModel.internal_id).filter_by(switch_id=switch_id).filter_by(type='external')\
+            .filter(FlowRuleModel.internal_id.isnot(None)).all()
+        return [row.internal_id for row in rows]
+
+    def getFlowTableOccupancy(self):
+        '''
+        :return: the FlowTableOccupancy counters, read from the database the first time
+        '''
+        return FlowTableOccupancy().load(self.__countExternalFlowrules)
+
+    def __countExternalFlowrules(self, session_ids=None):
+        # (switch id, table id, flows) for each table holding external flowrules [of the given sessions]
+        session = get_session()
+        table_id = func.coalesce(FlowRuleModel.table_id, 0)
+        query = session.query(FlowRuleModel.switch_id, table_id, func.count(FlowRuleModel.id))\
+            .filter(FlowRuleModel.type == 'external').filter(FlowRuleModel.switch_id.isnot(None))
+        if session_ids is not None:
+            query = query.filter(FlowRuleModel.session_id.in_(session_ids))
+        return query.group_by(FlowRuleModel.switch_id, table_id).all()
+
+    def getPortLoad(self):
+        '''
+        :return: the PortLoad counters (external flows per output port), read from the database the first time
+        '''
+        return PortLoad().load(self.__countExternalFlowruleOutputs)
+
+    def __countExternalFlowruleOutputs(self, session_ids=None, flow_rule_id=None):
+        # (switch id, output port, flows) for each port used by external flowrules [of the given sessions / flowrule]
+        session = get_session()
+        query = session.query(FlowRuleModel.switch_id, ActionModel.output_to_port, func.count(FlowRuleModel.id))\
+            .join(ActionModel, ActionModel.flow_rule_id == FlowRuleModel.id)\
+            .filter(FlowRuleModel.type == 'external').filter(FlowRuleModel.switch_id.isnot(None))\
+            .filter(ActionModel.output_to_port.isnot(None))
+        if session_ids is not None:
+            query = query.filter(FlowRuleModel.session_id.in_(session_ids))
+        if flow_rule_id is not None:
+            query = query.filter(FlowRuleModel.id == flow_rule_id)
+        return query.group_by(FlowRuleModel.switch_id, ActionModel.output_to_port).all()
+
+    def getMatchOverlapIndex(self):
+        '''
+        :return: the MatchOverlapIndex of the external flows (matches per ingress port), read from the database
+                 the first time
+        '''
+        return MatchOverlapIndex().load(self.__getExternalFlowruleMatches)
+
+    def __getExternalFlowruleMatches(self):
+        # external flowrules with their ingress port, table, priority, MPLS label and match fields
+        session = get_session()
+        match_fields = [getattr(MatchModel, field) for field in MATCH_FIELDS if field != 'mpls_label']
+        return session.query(FlowRuleModel.id, FlowRuleModel.switch_id, FlowRuleModel.table_id,
+                             FlowRuleModel.priority, FlowRuleModel.mpls_label, MatchModel.port_in, *match_fields)\
+            .join(MatchModel, MatchModel.flow_rule_id == FlowRuleModel.id)\
+            .filter(FlowRuleModel.type == 'external').filter(FlowRuleModel.switch_id.isnot(None))\
+            .filter(MatchModel.port_in.isnot(None)).all()
+
+    def getFlowPathIndex(self):
+        '''
+        :return: a FlowPathIndex of the graph flowrules whose external flows use each port and switch;
+                 flows of a shared tunnel are indexed for all the flowrules entering it
+        '''
+        session = get_session()
+        tunnel_users = {}
+        rows = session.query(FlowRuleModel.tunnel_id, FlowRuleModel.session_id, FlowRuleModel.graph_flow_rule_id)\
+            .filter(FlowRuleModel.type == 'external').filter(FlowRuleModel.tunnel_id.isnot(None))\
+            .filter(~FlowRuleModel.session_id.startswith(TUNNEL_SESSION_PREFIX)).distinct().all()
+        for tunnel_id, session_id, graph_flow_rule_id in rows:
+            tunnel_users.setdefault(tunnel_id, []).append((session_id, graph_flow_rule_id))
+
+        index = FlowPathIndex()
+        rows = session.query(FlowRuleModel.session_id, FlowRuleModel.graph_flow_rule_id, FlowRuleModel.tunnel_id,
+                             FlowRuleModel.switch_id, MatchModel.port_in, ActionModel.output_to_port)\
+            .outerjoin(MatchModel, MatchModel.flow_rule_id == FlowRuleModel.id)\
+            .outerjoin(ActionModel, ActionModel.flow_rule_id == FlowRuleModel.id)\
+            .filter(FlowRuleModel.type == 'external').filter(FlowRuleModel.switch_id.isnot(None)).all()
+        for session_id, graph_flow_rule_id, tunnel_id, switch_id, port_in, output_to_port in rows:
+            if session_id.startswith(TUNNEL_SESSION_PREFIX):
+                users = tunnel_users.get(tunnel_id, [])
+            else:
+                users = [(session_id, graph_flow_rule_id)]
+            for user_session_id, user_graph_flow_rule_id in users:
+                index.add(switch_id, (port_in, output_to_port), user_session_id, user_graph_flow_rule_id)
+        return index
+
     def getExternalFlowrulesByGraphFlowruleID(self, switch_id, graph_flow_rule_id):
         #return all flowrules with a graph_flow_rule_id, ordered by "internal_id" (asc) 
         session = get_session()
         flow_rules_ref = session.query(FlowRuleModel).filter_by(graph_flow_rule_id=graph_flow_rule_id).filter_by(switch_id=switch_id).filter_by(type='external').order_by(asc(FlowRuleModel.internal_id)).all()
         return flow_rules_ref
 
-    def getFlowruleOnTheSwitch(self, switch_id, port_in, nffg_fr):
+    def getBusyVlanInOnThePort(self, switch_id, port_in):
+        # vlan ids matched on the port, whatever the rest of the match
         session = get_session()
-        qref = session.query(FlowRuleModel, MatchModel).\
+        rows = session.query(MatchModel.vlan_id).\
             filter(FlowRuleModel.id == MatchModel.flow_rule_id).\
-            filter(FlowRuleModel.priority == nffg_fr.priority).\
             filter(FlowRuleModel.switch_id == switch_id).\
             filter(MatchModel.port_in == port_in).\
-            filter(MatchModel.vlan_id == nffg_fr.match.vlan_id).\
-            filter(MatchModel.vlan_priority == nffg_fr.match.vlan_priority).\
-            filter(MatchModel.ether_type == nffg_fr.match.ether_type).\
-            filter(MatchModel.source_mac == nffg_fr.match.source_mac).\
-            filter(MatchModel.dest_mac == nffg_fr.match.dest_mac).\
-            filter(MatchModel.source_ip == nffg_fr.match.source_ip).\
-            filter(MatchModel.dest_ip == nffg_fr.match.dest_ip).\
-            filter(MatchModel.tos_bits == nffg_fr.match.tos_bits).\
-            filter(MatchModel.source_port == nffg_fr.match.source_port).\
-            filter(MatchModel.dest_port == nffg_fr.match.dest_port).\
-            filter(MatchModel.protocol == nffg_fr.match.protocol).\
+            filter(MatchModel.vlan_id.isnot(None)).\
             all()
-        if len(qref)>0:
-            return qref
-        return None
+        return [int(row.vlan_id) for row in rows]
 
-    def getFlowruleMatchesOnTheSwitch(self, switch_id, port_in, nffg_match):
+    def getMplsLabels(self, switch_id):
+        # MPLS labels matched on the switch, on any port
         session = get_session()
-        qref = session.query(FlowRuleModel, MatchModel).\
-            filter(FlowRuleModel.id == MatchModel.flow_rule_id).\
+        rows = session.query(FlowRuleModel.mpls_label).\
             filter(FlowRuleModel.switch_id == switch_id).\
-            filter(MatchModel.port_in == port_in).\
-            filter(MatchModel.ether_type == nffg_match.ether_type).\
-            filter(MatchModel.source_mac == nffg_match.source_mac).\
-            filter(MatchModel.dest_mac == nffg_match.dest_mac).\
-            filter(MatchModel.source_ip == nffg_match.source_ip).\
-            filter(MatchModel.dest_ip == nffg_match.dest_ip).\
-            filter(MatchModel.tos_bits == nffg_match.tos_bits).\
-            filter(MatchModel.source_port == nffg_match.source_port).\
-            filter(MatchModel.dest_port == nffg_match.dest_port).\
-            filter(MatchModel.protocol == nffg_match.protocol).\
+            filter(FlowRuleModel.mpls_label.isnot(None)).\
             all()
-        if len(qref)>0:
-            return qref
-        return None
+        return [int(row.mpls_label) for row in rows]
 
-    def getBusyVlanInOnTheSwitch(self, switch_id, port_in, nffg_match):
-        qref = self.getFlowruleMatchesOnTheSwitch(switch_id, port_in, nffg_match)
-        
-        # Collect the ingress VLAN IDs
-        busy_vlan_ids = []
-        if qref is not None:
-            for fr in qref:
-                if fr.MatchModel.vlan_id is not None:
-                    busy_vlan_ids.append(int(fr.MatchModel.vlan_id))
-        return busy_vlan_ids
+    def getGroups(self, session_id, graph_flow_rule_id=None):
+        session = get_session()
+        query = session.query(GroupModel).filter_by(session_id=session_id)
+        if graph_flow_rule_id is not None:
+            query = query.filter_by(graph_flow_rule_id=graph_flow_rule_id)
+        return query.all()
+
+    def getNextGroupID(self, switch_id):
+        '''
+        First group id not used on the switch (call it holding the lock of the switch).
+        '''
+        session = get_session()
+        max_id = session.query(func.max(GroupModel.group_id).label("max_id")).filter_by(switch_id=switch_id).one().max_id
+        return 1 if max_id is None else int(max_id) + 1
+
+    def getVlanTunnel(self, tunnel_key):
+        session = get_session()
+        return session.query(VlanTunnelModel).filter_by(tunnel_key=tunnel_key)\
+            .filter(VlanTunnelModel.ref_count > 0).first()
 
     def getPortById(self, port_id):
         session = get_session()
@@ -483,7 +671,7 @@ class GraphSession(object):
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
     '''
     
-    def addFlowrule(self, session_id, switch_id, flow_rule, nffg=None):   
+    def addFlowrule(self, session_id, switch_id, flow_rule, nffg=None, tunnel_id=None, table_id=None, mpls_label=None):
 
         # build flowrule type
         if flow_rule.type != 'external':
@@ -504,7 +692,8 @@ class GraphSession(object):
             flow_rule.type = flowrule_type
 
         # FlowRule
-        flow_rule_db_id = self.dbStoreFlowrule(session_id, flow_rule, None, switch_id)
+        flow_rule_db_id = self.dbStoreFlowrule(session_id, flow_rule, None, switch_id, tunnel_id=tunnel_id,
+                                               table_id=table_id, mpls_label=mpls_label)
         
         # Match
         if nffg is not None and flow_rule.match is not None:
@@ -546,16 +735,64 @@ class GraphSession(object):
 
     def addVlanTracking(self, flow_rule_id, switch_id, vlan_in, port_in, vlan_out, port_out):
         session = get_session()
+        with ResourceLocks().table(VlanModel.__tablename__):
+            max_id = session.query(func.max(VlanModel.id).label("max_id")).one().max_id
+            if max_id  is None:
+                max_id = 0
+            else:
+                max_id = int(max_id)+1
         
-        max_id = session.query(func.max(VlanModel.id).label("max_id")).one().max_id
-        if max_id  is None:
-            max_id = 0
-        else:
-            max_id = int(max_id)+1
-        
-        with session.begin():    
-            vlan_ref = VlanModel(id=max_id, flow_rule_id=flow_rule_id, switch_id=switch_id, vlan_in=vlan_in, port_in=port_in, vlan_out=vlan_out, port_out=port_out)
-            session.add(vlan_ref) 
+            with session.begin():    
+                vlan_ref = VlanModel(id=max_id, flow_rule_id=flow_rule_id, switch_id=switch_id, vlan_in=vlan_in, port_in=port_in, vlan_out=vlan_out, port_out=port_out)
+                session.add(vlan_ref) 
+
+    def addVlanTunnel(self, tunnel_key):
+        '''
+        Store a new tunnel, not usable (ref_count 0) until it is completed by updateVlanTunnel.
+        :return: the tunnel id
+        '''
+        session = get_session()
+        with ResourceLocks().table(VlanTunnelModel.__tablename__):
+            tunnel_id = session.query(func.max(VlanTunnelModel.id).label("max_id")).one().max_id
+            tunnel_id = 0 if tunnel_id is None else int(tunnel_id) + 1
+            with session.begin():
+                session.add(VlanTunnelModel(id=tunnel_id, tunnel_key=tunnel_key, vlan_in=None, ref_count=0,
+                                            creation_date=datetime.datetime.now()))
+        return tunnel_id
+
+    def addGroup(self, session_id, graph_flow_rule_id, switch_id, group_id):
+        session = get_session()
+        with ResourceLocks().table(GroupModel.__tablename__):
+            max_id = session.query(func.max(GroupModel.id).label("max_id")).one().max_id
+            max_id = 0 if max_id is None else int(max_id) + 1
+            with session.begin():
+                session.add(GroupModel(id=max_id, session_id=session_id, graph_flow_rule_id=graph_flow_rule_id,
+                                       switch_id=switch_id, group_id=group_id, creation_date=datetime.datetime.now()))
+        return max_id
+
+    def attachVlanTunnel(self, tunnel_id):
+        '''
+        Count a new flowrule entering the tunnel.
+        :return: False if the tunnel is being removed
+        '''
+        session = get_session()
+        with session.begin():
+            updated = session.query(VlanTunnelModel).filter_by(id=tunnel_id).filter(VlanTunnelModel.ref_count > 0)\
+                .update({'ref_count': VlanTunnelModel.ref_count + 1}, synchronize_session=False)
+        return updated > 0
+
+    def releaseVlanTunnel(self, tunnel_id, count=1):
+        '''
+        Count flowrules no longer entering the tunnel.
+        :return: True if the tunnel is no longer used (it is deleted, its flows have to be removed)
+        '''
+        session = get_session()
+        with session.begin():
+            session.query(VlanTunnelModel).filter_by(id=tunnel_id)\
+                .update({'ref_count': VlanTunnelModel.ref_count - count}, synchronize_session=False)
+            unused = session.query(VlanTunnelModel).filter_by(id=tunnel_id)\
+                .filter(VlanTunnelModel.ref_count <= 0).delete(synchronize_session=False)
+        return unused > 0
 
     def addVnf(self, session_id, switch_id, vnf, nffg=None, application_name=None):
 
@@ -575,22 +812,50 @@ class GraphSession(object):
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
     '''
     
+    def updateVlanTunnel(self, tunnel_id, vlan_in):
+        # the tunnel is complete, and used by the flowrule that created it
+        session = get_session()
+        with session.begin():
+            session.query(VlanTunnelModel).filter_by(id=tunnel_id)\
+                .update({'vlan_in': vlan_in, 'ref_count': 1}, synchronize_session=False)
+
     def updateEnded(self, session_id):
+        NffgCache().evict(session_id)
         session = get_session() 
         with session.begin():       
             session.query(GraphSessionModel).filter_by(session_id=session_id).update({"ended":datetime.datetime.now(),"status":"deleted"}, synchronize_session = False)
 
 
     def updateError(self, session_id):
+        NffgCache().evict(session_id)
         session = get_session()
         with session.begin():
-            session.query(GraphSessionModel).filter_by(session_id=session_id).update({"error":datetime.datetime.now(),"status":"error"}, synchronize_session = False)
-
-
-    def updateStatus(self, session_id, status, error=False):
+            session.query(GraphSessionModel).filter_by(session_id=session_id).update({"error":datetime.datetime.now(),"status":"error", "snapshot":None}, synchronize_session = False)
+        NffgCache().evict(session_id)
+
+
+    def updateStatus(self, session_id, status, error=False, graph_hash=None):
+        values = {"last_update":datetime.datetime.now(), 'status':status}
+        if graph_hash is not None:
+            values['graph_hash'] = graph_hash
+        NffgCache().evict(session_id)
+        if status == 'complete':
+            # the graph does not change any more: keep it ready to be returned
+            generation = NffgCache().generation()
+            nffg = self.__rebuildNFFG(session_id)[0]
+            nffg_json = self.serializeNFFG(nffg)
+            values['snapshot'] = zlib.compress(nffg_json.encode('utf-8'))
+        else:
+            # the graph is changing (or failed): the snapshot and the cache would return the previous one
+            values['snapshot'] = None
         session = get_session()
         with session.begin():
-            session.query(GraphSessionModel).filter_by(session_id=session_id).update({"last_update":datetime.datetime.now(), 'status':status})
+            session.query(GraphSessionModel).filter_by(session_id=session_id).update(values)
+        if status == 'complete':
+            NffgCache().put(session_id, nffg, generation, nffg_json)
+        else:
+            # a read may have cached the graph again before the status changed
+            NffgCache().evict(session_id)
 
 
     '''
@@ -600,6 +865,10 @@ class GraphSession(object):
     '''
     
     def cleanAll(self):
+        NffgCache().clear()
+        FlowTableOccupancy().reset()
+        PortLoad().reset()
+        MatchOverlapIndex().reset()
         session = get_session()
         session.query(ActionModel).delete()
         session.query(EndpointModel).delete()
@@ -612,8 +881,73 @@ class GraphSession(object):
         session.query(GraphSessionModel).delete()
         session.query(VnfModel).delete()
         session.query(VnfPortModel).delete()
+        session.query(VlanTunnelModel).delete()
+        session.query(GroupModel).delete()
     
     
+    def deleteSessions(self, session_ids):
+        '''
+        Delete the given sessions from every table, all together.
+        :return: number of records deleted
+        '''
+        return self.__deleteSessionsRecords(session_ids, SESSION_MODELS)
+
+    def deleteSessionResources(self, session_id):
+        '''
+        Delete endpoints, ports, flowrules and vnfs of a session, all together (the session itself is kept).
+        :return: number of records deleted
+        '''
+        return self.__deleteSessionsRecords([session_id], [model for model in SESSION_MODELS
+                                                           if model is not GraphSessionModel])
+
+    def __deleteSessionsRecords(self, session_ids, models):
+        deleted = 0
+        occupancy = self.getFlowTableOccupancy()
+        port_load = self.getPortLoad()
+        overlap_index = self.getMatchOverlapIndex()
+        external_flowrules = []
+        external_outputs = []
+        flow_rule_db_ids = []
+        session = get_session()
+        if FlowRuleModel in models:
+            external_flowrules = self.__countExternalFlowrules(session_ids)
+            external_outputs = self.__countExternalFlowruleOutputs(session_ids)
+            flow_rule_db_ids = [row.id for row in session.query(FlowRuleModel.id)
+                                .filter(FlowRuleModel.session_id.in_(session_ids)).all()]
+        with session.begin():
+            endpoint_ids = session.query(EndpointModel.id).filter(EndpointModel.session_id.in_(session_ids))
+            flow_rule_ids = session.query(FlowRuleModel.id).filter(FlowRuleModel.session_id.in_(session_ids))
+            vnf_ids = session.query(VnfModel.id).filter(VnfModel.session_id.in_(session_ids))
+            # records referring to the session through its endpoints, flowrules and vnfs go first
+            for model, column, ids in ((EndpointResourceModel, 'endpoint_id', endpoint_ids),
+                                       (MatchModel, 'flow_rule_id', flow_rule_ids),
+                                       (ActionModel, 'flow_rule_id', flow_rule_ids),
+                                       (VlanModel, 'flow_rule_id', flow_rule_ids),
+                                       (VnfPortModel, 'vnf_id', vnf_ids)):
+                if model in models:
+                    deleted += session.query(model).filter(getattr(model, column).in_(ids))\
+                        .delete(synchronize_session=False)
+            for model in (EndpointModel, PortModel, FlowRuleModel, VnfModel, GroupModel, GraphSessionModel):
+                if model in models:
+                    deleted += session.query(model).filter(model.session_id.in_(session_ids))\
+                        .delete(synchronize_session=False)
+        for switch_id, table_id, flows in external_flowrules:
+            occupancy.remove(switch_id, table_id, flows)
+        for switch_id, port, flows in external_outputs:
+            port_load.remove(switch_id, port, flows)
+        overlap_index.remove(flow_rule_db_ids)
+        return deleted
+
+    def deleteVlanTunnel(self, tunnel_id):
+        session = get_session()
+        with session.begin():
+            session.query(VlanTunnelModel).filter_by(id=tunnel_id).delete(synchronize_session=False)
+
+    def deleteGroupByID(self, group_db_id):
+        session = get_session()
+        with session.begin():
+            session.query(GroupModel).filter_by(id=group_db_id).delete()
+
     def deleteEndpointByID(self, endpoint_id):
         # delete from tables: EndpointModel.
         session = get_session()
@@ -630,13 +964,24 @@ class GraphSession(object):
 
     def deleteFlowruleByID(self, flow_rule_id):
         # delete from tables: FlowRuleModel, MatchModel, ActionModel, VlanModel, EndpointResourceModel.
+        occupancy = self.getFlowTableOccupancy()
+        port_load = self.getPortLoad()
+        overlap_index = self.getMatchOverlapIndex()
+        external_outputs = self.__countExternalFlowruleOutputs(flow_rule_id=flow_rule_id)
         session = get_session()
         with session.begin():
+            flow_rule = session.query(FlowRuleModel.switch_id, FlowRuleModel.table_id, FlowRuleModel.type)\
+                .filter_by(id=flow_rule_id).first()
             session.query(FlowRuleModel).filter_by(id=flow_rule_id).delete()
             session.query(MatchModel).filter_by(flow_rule_id=flow_rule_id).delete()
             session.query(ActionModel).filter_by(flow_rule_id=flow_rule_id).delete()
             session.query(VlanModel).filter_by(flow_rule_id=flow_rule_id).delete()
             session.query(EndpointResourceModel).filter_by(resource_id=flow_rule_id).filter_by(resource_type='flow-rule').delete()
+        if flow_rule is not None and flow_rule.type == 'external' and flow_rule.switch_id is not None:
+            occupancy.remove(flow_rule.switch_id, flow_rule.table_id or 0)
+        for switch_id, port, flows in external_outputs:
+            port_load.remove(switch_id, port, flows)
+        overlap_index.remove([flow_rule_id])
     
     
     def deletePort(self,  port_id, session_id):
@@ -666,73 +1011,81 @@ class GraphSession(object):
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
     '''
     
-    def dbStoreAction(self, action, flow_rule_db_id, action_db_id=None, output_to_port=None, output_type=None):    
+    def dbStoreAction(self, action, flow_rule_db_id, action_db_id=None, output_to_port=None, output_type=None,
+                      switch_id=None):
+        # switch_id: switch of an external flowrule, whose output port is counted in PortLoad
+        port_load = self.getPortLoad() if switch_id is not None else None
         session = get_session()
-        
-        if action_db_id is None:
-            action_db_id = session.query(func.max(ActionModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(ActionModel.__tablename__):
             if action_db_id is None:
-                action_db_id = 0
-            else:
-                action_db_id = int(action_db_id) + 1
+                action_db_id = session.query(func.max(ActionModel.id).label("max_id")).one().max_id
+                if action_db_id is None:
+                    action_db_id = 0
+                else:
+                    action_db_id = int(action_db_id) + 1
         
-        if output_to_port is None:
-            output_to_port=action.output
+            if output_to_port is None:
+                output_to_port=action.output
             
-        with session.begin():
-            action_ref = ActionModel(id=action_db_id, flow_rule_id=flow_rule_db_id,
-                                     output_type=output_type, output_to_port=output_to_port,
-                                     output_to_controller=action.controller, _drop=action.drop, set_vlan_id=action.set_vlan_id,
-                                     set_vlan_priority=action.set_vlan_priority, push_vlan=action.push_vlan, pop_vlan=action.pop_vlan,
-                                     set_ethernet_src_address=action.set_ethernet_src_address, 
-                                     set_ethernet_dst_address=action.set_ethernet_dst_address,
-                                     set_ip_src_address=action.set_ip_src_address, set_ip_dst_address=action.set_ip_dst_address,
-                                     set_ip_tos=action.set_ip_tos, set_l4_src_port=action.set_l4_src_port,
-                                     set_l4_dst_port=action.set_l4_dst_port, output_to_queue=action.output_to_queue)
-            session.add(action_ref)
-            return action_ref
+            with session.begin():
+                action_ref = ActionModel(id=action_db_id, flow_rule_id=flow_rule_db_id,
+                                         output_type=output_type, output_to_port=output_to_port,
+                                         output_to_controller=action.controller, _drop=action.drop, set_vlan_id=action.set_vlan_id,
+                                         set_vlan_priority=action.set_vlan_priority, push_vlan=action.push_vlan, pop_vlan=action.pop_vlan,
+                                         set_ethernet_src_address=action.set_ethernet_src_address, 
+                                         set_ethernet_dst_address=action.set_ethernet_dst_address,
+                                         set_ip_src_address=action.set_ip_src_address, set_ip_dst_address=action.set_ip_dst_address,
+                                         set_ip_tos=action.set_ip_tos, set_l4_src_port=action.set_l4_src_port,
+                                         set_l4_dst_port=action.set_l4_dst_port, output_to_queue=action.output_to_queue)
+                session.add(action_ref)
+        if port_load is not None and output_to_port is not None:
+            port_load.add(switch_id, output_to_port)
+        return action_ref
 
     def dbStoreVnf(self, session_id, vnf, vnf_db_id, switch_id, application_name):
         session = get_session()
-        if vnf_db_id is None:
-            vnf_db_id = session.query(func.max(VnfModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(VnfModel.__tablename__):
             if vnf_db_id is None:
-                vnf_db_id = 0
-            else:
-                vnf_db_id = int(vnf_db_id) + 1
-        with session.begin():
-            vnf_ref = VnfModel(id=vnf_db_id, graph_vnf_id=vnf.id, session_id=session_id, name=vnf.name,
-                               template=vnf.vnf_template_location, application_name=application_name)
-            session.add(vnf_ref)
-            return vnf_db_id
+                vnf_db_id = session.query(func.max(VnfModel.id).label("max_id")).one().max_id
+                if vnf_db_id is None:
+                    vnf_db_id = 0
+                else:
+                    vnf_db_id = int(vnf_db_id) + 1
+            with session.begin():
+                vnf_ref = VnfModel(id=vnf_db_id, graph_vnf_id=vnf.id, session_id=session_id, name=vnf.name,
+                                   template=vnf.vnf_template_location, application_name=application_name)
+                session.add(vnf_ref)
+                return vnf_db_id
 
     def dbStoreVnfPort(self, vnf_port_id, graph_vnf_port_id, vnf_db_id, name):
         session = get_session()
-        if vnf_port_id is None:
-            vnf_port_id = session.query(func.max(VnfPortModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(VnfPortModel.__tablename__):
             if vnf_port_id is None:
-                vnf_port_id = 0
-            else:
-                vnf_port_id = int(vnf_port_id) + 1
-        with session.begin():
-            vnf_port_ref = VnfPortModel(id=vnf_port_id, graph_port_id=graph_vnf_port_id,
-                                        vnf_id=vnf_db_id, name=name)
-            session.add(vnf_port_ref)
-            return vnf_port_id
+                vnf_port_id = session.query(func.max(VnfPortModel.id).label("max_id")).one().max_id
+                if vnf_port_id is None:
+                    vnf_port_id = 0
+                else:
+                    vnf_port_id = int(vnf_port_id) + 1
+            with session.begin():
+                vnf_port_ref = VnfPortModel(id=vnf_port_id, graph_port_id=graph_vnf_port_id,
+                                            vnf_id=vnf_db_id, name=name)
+                session.add(vnf_port_ref)
+                return vnf_port_id
 
     def dbStoreEndpoint(self, session_id, endpoint_id, graph_endpoint_id, name, _type):
         session = get_session()
-        if endpoint_id is None:
-            endpoint_id = session.query(func.max(EndpointModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(EndpointModel.__tablename__):
             if endpoint_id is None:
-                endpoint_id = 0
-            else:
-                endpoint_id=int(endpoint_id)+1
-        with session.begin():
-            endpoint_ref = EndpointModel(id=endpoint_id, graph_endpoint_id=graph_endpoint_id, 
-                                         session_id=session_id, name=name, type=_type)
-            session.add(endpoint_ref)
-            return endpoint_id
+                endpoint_id = session.query(func.max(EndpointModel.id).label("max_id")).one().max_id
+                if endpoint_id is None:
+                    endpoint_id = 0
+                else:
+                    endpoint_id=int(endpoint_id)+1
+            with session.begin():
+                endpoint_ref = EndpointModel(id=endpoint_id, graph_endpoint_id=graph_endpoint_id, 
+                                             session_id=session_id, name=name, type=_type)
+                session.add(endpoint_ref)
+                return endpoint_id
 
     def dbStoreEndpointResourcePort(self, endpoint_id, port_id):
         session = get_session()
@@ -745,32 +1098,41 @@ class GraphSession(object):
             ep_res_ref = EndpointResourceModel(endpoint_id=endpoint_id,resource_type='flow-rule',resource_id=flow_rule_id)
             session.add(ep_res_ref)
 
-    def dbStoreFlowrule(self, session_id, flow_rule, flow_rule_db_id, switch_id):
+    def dbStoreFlowrule(self, session_id, flow_rule, flow_rule_db_id, switch_id, tunnel_id=None, table_id=None,
+                        mpls_label=None):
+        occupancy = self.getFlowTableOccupancy()
         session = get_session()
-        if flow_rule_db_id is None:
-            flow_rule_db_id = session.query(func.max(FlowRuleModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(FlowRuleModel.__tablename__):
             if flow_rule_db_id is None:
-                flow_rule_db_id = 0
-            else:
-                flow_rule_db_id=int(flow_rule_db_id)+1
-        with session.begin():
-            flow_rule_ref = FlowRuleModel(id=flow_rule_db_id, internal_id=flow_rule.internal_id, 
-                                       graph_flow_rule_id=flow_rule.id, session_id=session_id, switch_id=switch_id,
-                                       priority=flow_rule.priority,  status=None, description=flow_rule.description,
-                                       creation_date=datetime.datetime.now(), last_update=datetime.datetime.now(), type=flow_rule.type)
-            session.add(flow_rule_ref)
-            return flow_rule_db_id
+                flow_rule_db_id = session.query(func.max(FlowRuleModel.id).label("max_id")).one().max_id
+                if flow_rule_db_id is None:
+                    flow_rule_db_id = 0
+                else:
+                    flow_rule_db_id=int(flow_rule_db_id)+1
+            with session.begin():
+                flow_rule_ref = FlowRuleModel(id=flow_rule_db_id, internal_id=flow_rule.internal_id, 
+                                           graph_flow_rule_id=flow_rule.id, session_id=session_id, switch_id=switch_id,
+                                           priority=flow_rule.priority,  status=None, description=flow_rule.description,
+                                           creation_date=datetime.datetime.now(), last_update=datetime.datetime.now(), type=flow_rule.type,
+                                           tunnel_id=tunnel_id, table_id=table_id, mpls_label=mpls_label)
+                session.add(flow_rule_ref)
+        if flow_rule.type == 'external' and switch_id is not None:
+            occupancy.add(switch_id, table_id or 0)
+        return flow_rule_db_id
 
-    def dbStoreGraphSessionFromNffgObject(self, session_id, user_id, nffg):
+    def dbStoreGraphSessionFromNffgObject(self, session_id, user_id, nffg, graph_hash=None, idempotency_key=None):
         session = get_session()
         with session.begin():
             graphsession_ref = GraphSessionModel(session_id=session_id, user_id=user_id, graph_id=nffg.id, 
                                 started_at = datetime.datetime.now(), graph_name=nffg.name,
-                                last_update = datetime.datetime.now(), status='inizialization',
-                                                 description=nffg.description)
+                                last_update = datetime.datetime.now(), status='initialization',
+                                                 description=nffg.description, graph_hash=graph_hash,
+                                                 idempotency_key=idempotency_key)
             session.add(graphsession_ref)
 
-    def dbStoreMatch(self, match, flow_rule_db_id, match_db_id, port_in=None, port_in_type=None):
+    def dbStoreMatch(self, match, flow_rule_db_id, match_db_id, port_in=None, port_in_type=None, switch_id=None):
+        # switch_id: switch of an external flowrule, whose match is indexed in MatchOverlapIndex
+        overlap_index = self.getMatchOverlapIndex() if switch_id is not None else None
         session = get_session()
         with session.begin():
             
@@ -788,29 +1150,35 @@ class GraphSession(object):
                                    source_port=match.source_port, dest_port=match.dest_port,
                                    protocol=match.protocol)
             session.add(match_ref)
-            return match_ref
+        if overlap_index is not None and port_in is not None:
+            flow_rule = session.query(FlowRuleModel.table_id, FlowRuleModel.priority, FlowRuleModel.mpls_label)\
+                .filter_by(id=flow_rule_db_id).one()
+            overlap_index.add(flow_rule_db_id, switch_id, port_in, flow_rule.table_id, flow_rule.priority, match,
+                              flow_rule.mpls_label)
+        return match_ref
     
     def dbStorePort(self, session_id, port_id, graph_port_id, switch_id, vlan_id, status, local_ip, remote_ip, gre_key):
         session = get_session()
-        if port_id is None:
-            port_id = session.query(func.max(PortModel.id).label("max_id")).one().max_id
+        with ResourceLocks().table(PortModel.__tablename__):
             if port_id is None:
-                port_id = 0
-            else:
-                port_id=int(port_id)+1
-        with session.begin():
-            port_ref = PortModel(id=port_id, 
-                                 graph_port_id=graph_port_id,
-                                 session_id=session_id, status=status, 
-                                 switch_id=switch_id,
-                                 vlan_id=vlan_id,
-                                 ipv4_address=local_ip,
-                                 tunnel_remote_ip=remote_ip,
-                                 gre_key=gre_key,
-                                 creation_date=datetime.datetime.now(), 
-                                 last_update=datetime.datetime.now())
-            session.add(port_ref)
-            return port_id
+                port_id = session.query(func.max(PortModel.id).label("max_id")).one().max_id
+                if port_id is None:
+                    port_id = 0
+                else:
+                    port_id=int(port_id)+1
+            with session.begin():
+                port_ref = PortModel(id=port_id, 
+                                     graph_port_id=graph_port_id,
+                                     session_id=session_id, status=status, 
+                                     switch_id=switch_id,
+                                     vlan_id=vlan_id,
+                                     ipv4_address=local_ip,
+                                     tunnel_remote_ip=remote_ip,
+                                     gre_key=gre_key,
+                                     creation_date=datetime.datetime.now(), 
+                                     last_update=datetime.datetime.now())
+                session.add(port_ref)
+                return port_id
 
     '''
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
@@ -819,21 +1187,24 @@ class GraphSession(object):
     * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
     '''
         
-    def addNFFG(self, nffg, user_id):
+    def addNFFG(self, nffg, user_id, graph_hash=None, idempotency_key=None):
         """
 
         :param nffg:
         :param user_id:
+        :param graph_hash: fingerprint of the graph
+        :param idempotency_key: key sent by the client with the creation request, if any
         :type nffg: NF_FG
         :type user_id: str
         :return:
         """
+        from do_core.resource_description import ResourceDescription  # it imports this module
             
         # New session id
         session_id = self.getNewUnivocalSessionID()
         
         # Add a new record in GraphSession
-        self.dbStoreGraphSessionFromNffgObject(session_id, user_id, nffg)
+        self.dbStoreGraphSessionFromNffgObject(session_id, user_id, nffg, graph_hash, idempotency_key)
     
         # [ ENDPOINTS ]
         for endpoint in nffg.end_points:
@@ -847,15 +1218,13 @@ class GraphSession(object):
             if endpoint.type == "interface" or endpoint.type == "vlan":
                 self.addPort(session_id, endpoint_id, None, endpoint.interface, endpoint.node_id, endpoint.vlan_id, 'complete', None, None, None)
             elif endpoint.type == "gre-tunnel":
-                self.addPort(session_id, endpoint_id, None, self.getNextGreInterfaceName(), Configuration().GRE_BRIDGE_ID, endpoint.vlan_id, 'complete', endpoint.local_ip, endpoint.remote_ip, endpoint.gre_key)
+                # the name of the new gre interface is taken when the port is stored
+                with ResourceLocks().table(PortModel.__tablename__):
+                    self.addPort(session_id, endpoint_id, None, self.getNextGreInterfaceName(), Configuration().GRE_BRIDGE_ID, endpoint.vlan_id, 'complete', endpoint.local_ip, endpoint.remote_ip, endpoint.gre_key)
 
         # [ VNF ]
         for vnf in nffg.vnfs:
-            domain_info = DomainInfo.get_from_file(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE)
-            application_name = ""
-            for functional_capability in domain_info.capabilities.functional_capabilities:
-                if functional_capability.type == vnf.name:
-                    application_name = functional_capability.name
+            application_name = ResourceDescription().getApplicationName(vnf.name) or ""
             vnf_id = self.addVnf(session_id, None, vnf, nffg, application_name)
             vnf.db_id = vnf_id
 
@@ -873,8 +1242,8 @@ class GraphSession(object):
         :type nffg: NF_FG
         :return:
         """
-
-        domain_info = DomainInfo.get_from_file(Configuration().DOMAIN_DESCRIPTION_DYNAMIC_FILE)
+        from do_core.resource_description import ResourceDescription  # it imports this module
+        NffgCache().evict(session_id)
 
         # [ ENDPOINTS ]
         for endpoint in nffg.end_points:
@@ -889,7 +1258,8 @@ class GraphSession(object):
                 if endpoint.type == "interface" or endpoint.type=="vlan":
                     self.addPort(session_id, endpoint_id, None, endpoint.interface, endpoint.node_id, endpoint.vlan_id, 'complete', None, None, None)
                 elif endpoint.type == "gre-tunnel":
-                    self.addPort(session_id, endpoint_id, None, self.getNextGreInterfaceName(), Configuration().GRE_BRIDGE_ID, endpoint.vlan_id, 'complete', endpoint.local_ip, endpoint.remote_ip, endpoint.gre_key)
+                    with ResourceLocks().table(PortModel.__tablename__):
+                        self.addPort(session_id, endpoint_id, None, self.getNextGreInterfaceName(), Configuration().GRE_BRIDGE_ID, endpoint.vlan_id, 'complete', endpoint.local_ip, endpoint.remote_ip, endpoint.gre_key)
         
         # [ FLOW RULES ]
         for flow_rule in nffg.flow_rules:
@@ -899,14 +1269,43 @@ class GraphSession(object):
         # [ VNF ]
         for vnf in nffg.vnfs:
             if vnf.status == 'new' or vnf.status is None:
-                application_name = ""
-                for functional_capability in domain_info.capabilities.functional_capabilities:
-                    if functional_capability.type == vnf.name:
-                        application_name = functional_capability.name
+                application_name = ResourceDescription().getApplicationName(vnf.name) or ""
                 vnf_id = self.addVnf(session_id, None, vnf, nffg, application_name)
                 vnf.db_id = vnf_id
 
     def getNFFG(self, session_id):
+        nffg = NffgCache().get(session_id)
+        if nffg is not None:
+            return nffg
+        generation = NffgCache().generation()
+        nffg, status = self.__rebuildNFFG(session_id)
+        if status == 'complete':
+            NffgCache().put(session_id, nffg, generation, self.serializeNFFG(nffg))
+        return nffg
+
+    def getNFFG_JSON(self, session_id):
+        """
+        Json of the graph: from the cache, else from the snapshot of the session, else rebuilt
+        (sessions stored before snapshots were introduced).
+        """
+        nffg_json = NffgCache().get_json(session_id)
+        if nffg_json is not None:
+            return nffg_json
+        session = get_session()
+        snapshot = session.query(GraphSessionModel.snapshot).filter_by(session_id=session_id).one().snapshot
+        if snapshot is not None:
+            return zlib.decompress(snapshot).decode('utf-8')
+        return self.serializeNFFG(self.getNFFG(session_id))
+
+    @staticmethod
+    def serializeNFFG(nffg):
+        return json.dumps(nffg.getDict(), sort_keys=True)
+
+    def __rebuildNFFG(self, session_id):
+        """
+        Build the graph from the database.
+        :return: the graph and the status of its session
+        """
         session = get_session()
         session_ref = session.query(GraphSessionModel).filter_by(session_id=session_id).one()
         
@@ -1018,8 +1417,8 @@ class GraphSession(object):
                                 set_l4_dst_port=action_ref.set_l4_dst_port, output_to_queue=action_ref.output_to_queue,
                                 db_id=action_ref.id)
                 flow_rule.actions.append(action)
-        
-        return nffg    
+
+        return nffg, session_ref.status
 
     def getAllNFFG(self):
         session = get_session()
@@ -1033,6 +1432,23 @@ class GraphSession(object):
                 nffgs.append(nffg)
         return nffgs
 
+    def getAllNFFG_JSON(self):
+        """
+        :return: list of (graph id, json of the graph) of the sessions in status 'complete'
+        """
+        session = get_session()
+        session_refs = session.query(GraphSessionModel.session_id, GraphSessionModel.graph_id,
+                                     GraphSessionModel.snapshot).filter_by(status='complete').all()
+        nffgs = []
+        for session_ref in session_refs:
+            nffg_json = NffgCache().get_json(session_ref.session_id)
+            if nffg_json is None and session_ref.snapshot is not None:
+                nffg_json = zlib.decompress(session_ref.snapshot).decode('utf-8')
+            if nffg_json is None:
+                nffg_json = self.serializeNFFG(self.getNFFG(session_ref.session_id))
+            nffgs.append((session_ref.graph_id, nffg_json))
+        return nffgs
+
     def getNFFG_id(self, nffg_id):
         session = get_session()
         return session.query(GraphSessionModel.graph_id).filter_by(graph_id=nffg_id).all()
@@ -0,0 +1,256 @@
+"""
+Matches of the external flows installed on each port of the switches, indexed to find the flows
+a new flow overlaps with: two matches overlap when some packet matches both of them, that is when
+every field is either equal in both or wildcarded in one of them (IP prefixes overlap when one
+contains the other). Overlapping flows of equal priority are resolved arbitrarily by the switch.
+The index is kept in memory and updated by GraphSession every time external flows are stored or deleted.
+"""
+
+import ipaddress
+import threading
+
+from do_core.config import Singleton
+
+# fields of a match, in the order of the levels of the trie (the most selective ones first)
+MATCH_FIELDS = ('mpls_label', 'vlan_id', 'ether_type', 'protocol', 'dest_ip', 'source_ip', 'dest_port',
+                'source_port', 'dest_mac', 'source_mac', 'vlan_priority', 'tos_bits')
+IP_FIELDS = ('source_ip', 'dest_ip')
+
+MPLS_ETHER_TYPE = 0x8847
+UNTAGGED = 'untagged'
+IP_PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'sctp': 132}
+
+
+def match_key(match, mpls_label=None):
+    """
+    :param match: an object with the fields of MatchModel (nffg Match, MatchModel, query row)
+    :param mpls_label: MPLS label matched by the flow (kept in FlowRuleModel)
+    :return: tuple of the normalized fields, in the order of MATCH_FIELDS (None is a wildcard)
+    """
+    values = []
+    for field in MATCH_FIELDS:
+        value = mpls_label if field == 'mpls_label' else getattr(match, field, None)
+        values.append(_normalize(field, value))
+    # a flow matching a label matches only MPLS packets; paths are tagged either with a vlan or with
+    # a label, never both, so the labelled packets are not considered vlan tagged
+    if values[MATCH_FIELDS.index('mpls_label')] is not None:
+        for field, implied in (('ether_type', MPLS_ETHER_TYPE), ('vlan_id', UNTAGGED)):
+            if values[MATCH_FIELDS.index(field)] is None:
+                values[MATCH_FIELDS.index(field)] = implied
+    return tuple(values)
+
+
+def _normalize(field, value):
+    if value is None or str(value) == '':
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lower()
+    if field in IP_FIELDS:
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            return value
+        return network.version, int(network.network_address), network.prefixlen
+    if field == 'protocol' and value in IP_PROTOCOLS:
+        return IP_PROTOCOLS[value]
+    if field in ('source_mac', 'dest_mac'):
+        return value
+    if field == 'ether_type':
+        # read as the flows pushed read it ('0x800', '2048'); what cannot be decimal ('0800', '86dd') is hexadecimal
+        for base in (0, 16):
+            try:
+                return int(value, base)
+            except ValueError:
+                pass
+        return value
+    for base in (0, 10):
+        try:
+            return int(value, base)
+        except ValueError:
+            pass
+    return value
+
+
+def _supernets(network):
+    # keys of the prefixes containing the network (the network itself included)
+    version, address, prefixlen = network
+    bits = 32 if version == 4 else 128
+    for length in range(prefixlen + 1):
+        mask = ((1 << length) - 1) << (bits - length)
+        yield version, address & mask, length
+
+
+def _contains(network, other):
+    # is other a subnet of network?
+    version, address, prefixlen = network
+    bits = 32 if version == 4 else 128
+    mask = ((1 << prefixlen) - 1) << (bits - prefixlen)
+    return other[0] == version and other[2] >= prefixlen and other[1] & mask == address
+
+
+class MatchTrie(object):
+    """
+    Trie of the matches of the flows sharing ingress port, table and priority: a level for each
+    field of MATCH_FIELDS, a child for each value of the field plus one (key None) for the wildcard.
+    A lookup visits only the child of the value searched and the wildcard one, except for wildcards
+    searched (every child overlaps them) and for IP prefixes searched (their subnets overlap them).
+    """
+
+    def __init__(self):
+        self.__root = {}
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, key, flow_id):
+        node = self.__root
+        for value in key[:-1]:
+            node = node.setdefault(value, {})
+        node.setdefault(key[-1], set()).add(flow_id)
+        self.__size += 1
+
+    def remove(self, key, flow_id):
+        path = [self.__root]
+        for value in key[:-1]:
+            node = path[-1].get(value)
+            if node is None:
+                return
+            path.append(node)
+        flows = path[-1].get(key[-1])
+        if flows is None or flow_id not in flows:
+            return
+        flows.discard(flow_id)
+        self.__size -= 1
+        if len(flows) == 0:
+            del path[-1][key[-1]]
+        # prune the nodes left empty
+        for depth in range(len(path) - 1, 0, -1):
+            if len(path[depth]) > 0:
+                break
+            del path[depth - 1][key[depth - 1]]
+
+    def overlaps(self, key, ignore=()):
+        """
+        :param key: match_key() of the match searched
+        :param ignore: indexes of the fields treated as wildcards in the match searched
+        :return: set of the ids of the flows whose match overlaps the one searched
+        """
+        found = set()
+        self.__search(self.__root, 0, key, ignore, found)
+        return found
+
+    def __search(self, node, depth, key, ignore, found):
+        last = depth == len(key) - 1
+        for child in self.__children(node, MATCH_FIELDS[depth], None if depth in ignore else key[depth]):
+            if last:
+                found.update(child)
+            else:
+                self.__search(child, depth + 1, key, ignore, found)
+
+    @staticmethod
+    def __children(node, field, value):
+        if value is None:
+            return list(node.values())
+        children = []
+        if field in IP_FIELDS and isinstance(value, tuple):
+            for network in _supernets(value):
+                if network in node:
+                    children.append(node[network])
+            # host addresses have no subnets but themselves
+            if value[2] < (32 if value[0] == 4 else 128):
+                children.extend(child for network, child in node.items()
+                                if isinstance(network, tuple) and network[2] > value[2] and _contains(value, network))
+        elif value in node:
+            children.append(node[value])
+        if None in node:
+            children.append(node[None])
+        return children
+
+
+class MatchOverlapIndex(object, metaclass=Singleton):
+    """
+    Matches are read from the database once (see load()), before any flow is stored or deleted:
+    use GraphSession().getMatchOverlapIndex() to get them.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__ports = {}   # (switch id, ingress port) -> {(table id, priority) -> MatchTrie}
+        self.__flows = {}   # flow rule db id -> (switch id, ingress port, table id, priority, match key)
+        self.__loaded = False
+
+    def load(self, loader):
+        """
+        Read the matches, if not done yet.
+        :param loader: function returning the external flows of the switches, as rows with
+                       id, switch_id, table_id, priority, mpls_label and the fields of MatchModel
+        :return: self
+        """
+        with self.__lock:
+            if not self.__loaded:
+                self.__ports.clear()
+                self.__flows.clear()
+                for row in loader():
+                    self.__add(row.id, row.switch_id, row.port_in, row.table_id, row.priority,
+                               match_key(row, row.mpls_label))
+                self.__loaded = True
+        return self
+
+    def add(self, flow_id, switch_id, port_in, table_id, priority, match, mpls_label=None):
+        with self.__lock:
+            self.__add(flow_id, switch_id, port_in, table_id, priority, match_key(match, mpls_label))
+
+    def remove(self, flow_ids):
+        with self.__lock:
+            for flow_id in flow_ids:
+                flow = self.__flows.pop(flow_id, None)
+                if flow is None:
+                    continue
+                switch_id, port_in, table_id, priority, key = flow
+                tries = self.__ports[(switch_id, port_in)]
+                tries[(table_id, priority)].remove(key, flow_id)
+                if len(tries[(table_id, priority)]) == 0:
+                    del tries[(table_id, priority)]
+                    if len(tries) == 0:
+                        del self.__ports[(switch_id, port_in)]
+
+    def reset(self):
+        with self.__lock:
+            self.__ports.clear()
+            self.__flows.clear()
+
+    def overlapping(self, switch_id, port_in, priority, match, table_id=0, mpls_label=None):
+        """
+        :return: set of the ids of the flows on the port, in the same table and with the same priority,
+                 whose match overlaps the given one
+        """
+        key = match_key(match, mpls_label)
+        with self.__lock:
+            trie = self.__ports.get((switch_id, str(port_in)), {}).get((int(table_id or 0), int(priority or 0)))
+            return trie.overlaps(key) if trie is not None else set()
+
+    def overlapping_vlan_ids(self, switch_id, port_in, match):
+        """
+        Vlan ids matched on the port, in any table and with any priority, by flows whose match would overlap
+        the given one if it matched the same vlan id (flows matching any vlan id are not considered).
+        """
+        key = match_key(match)
+        ignore = (MATCH_FIELDS.index('vlan_id'),)
+        vlan_ids = set()
+        with self.__lock:
+            for trie in self.__ports.get((switch_id, str(port_in)), {}).values():
+                for flow_id in trie.overlaps(key, ignore):
+                    vlan_id = self.__flows[flow_id][4][ignore[0]]
+                    if vlan_id is not None and vlan_id != UNTAGGED:
+                        vlan_ids.add(vlan_id)
+        return vlan_ids
+
+    def __add(self, flow_id, switch_id, port_in, table_id, priority, key):
+        if flow_id in self.__flows:
+            return
+        port_in, table_id, priority = str(port_in), int(table_id or 0), int(priority or 0)
+        tries = self.__ports.setdefault((switch_id, port_in), {})
+        tries.setdefault((table_id, priority), MatchTrie()).add(key, flow_id)
+        self.__flows[flow_id] = (switch_id, port_in, table_id, priority, key)
@@ -0,0 +1,97 @@
+"""
+Cache of the graphs deployed, so that reading them does not rebuild them from the database.
+"""
+
+import copy
+import logging
+import threading
+from collections import OrderedDict
+
+from do_core.config import Configuration, Singleton
+
+
+class NffgCache(object, metaclass=Singleton):
+    """
+    Bounded LRU cache: session id -> (NF_FG, its json).
+    Only graphs in status 'complete' are cached: GraphSession evicts a graph every time it changes.
+    A graph read from the database is cached only if nothing was evicted while it was read (see generation()).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__generation = 0
+        self.__capacity = Configuration().NFFG_CACHE_SIZE
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, session_id):
+        """
+        :return: a copy of the cached NF_FG, None if not cached
+        """
+        with self.__lock:
+            entry = self.__lookup(session_id)
+            if entry is None:
+                return None
+            return copy.deepcopy(entry[0])
+
+    def get_json(self, session_id):
+        """
+        :return: the json of the cached NF_FG, None if not cached
+        """
+        with self.__lock:
+            entry = self.__lookup(session_id)
+            if entry is None:
+                return None
+            return entry[1]
+
+    def generation(self):
+        """
+        :return: token to pass to put(), taken before reading a graph from the database
+        """
+        with self.__lock:
+            return self.__generation
+
+    def put(self, session_id, nffg, generation, nffg_json):
+        if self.__capacity <= 0:
+            return
+        entry = (copy.deepcopy(nffg), nffg_json)
+        with self.__lock:
+            if generation != self.__generation:
+                # the graph may have changed while it was read
+                return
+            self.__entries[session_id] = entry
+            self.__entries.move_to_end(session_id)
+            while len(self.__entries) > self.__capacity:
+                self.__entries.popitem(last=False)
+
+    def evict(self, session_id):
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.pop(session_id, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.clear()
+
+    def metrics(self):
+        with self.__lock:
+            requests = self.__hits + self.__misses
+            return {
+                'size': len(self.__entries),
+                'capacity': self.__capacity,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_rate': self.__hits / requests if requests > 0 else None
+            }
+
+    def __lookup(self, session_id):
+        entry = self.__entries.get(session_id)
+        if entry is None:
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__entries.move_to_end(session_id)
+        logging.debug("Graph of session " + str(session_id) + " read from cache")
+        return entry
@@ -0,0 +1,56 @@
+"""
+External flows forwarding packets out of each port of the switches.
+Counters are kept in memory and updated by GraphSession every time external flows are stored or deleted.
+"""
+
+import threading
+
+from do_core.config import Singleton
+
+
+class PortLoad(object, metaclass=Singleton):
+    """
+    Counters are read from the database once (see load()), before any flow is stored or deleted:
+    use GraphSession().getPortLoad() to get them.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__ports = {}   # (switch id, output port) -> flows
+        self.__loaded = False
+
+    def load(self, loader):
+        """
+        Read the counters, if not done yet.
+        :param loader: function returning (switch id, output port, flows) for each port in use
+        :return: self
+        """
+        with self.__lock:
+            if not self.__loaded:
+                self.__ports.clear()
+                for switch_id, port, flows in loader():
+                    self.__ports[(switch_id, str(port))] = flows
+                self.__loaded = True
+        return self
+
+    def add(self, switch_id, port, flows=1):
+        key = (switch_id, str(port))
+        with self.__lock:
+            self.__ports[key] = self.__ports.get(key, 0) + flows
+
+    def remove(self, switch_id, port, flows=1):
+        key = (switch_id, str(port))
+        with self.__lock:
+            if key not in self.__ports:
+                return
+            self.__ports[key] -= flows
+            if self.__ports[key] <= 0:
+                del self.__ports[key]
+
+    def reset(self):
+        with self.__lock:
+            self.__ports.clear()
+
+    def flows(self, switch_id, port):
+        with self.__lock:
+            return self.__ports.get((switch_id, str(port)), 0)
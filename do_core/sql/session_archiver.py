@@ -0,0 +1,124 @@
+"""
+Archival of the sessions of graphs deleted (or failed) long ago: their records are
+exported to the archive file and removed from the database, whose statistics are then
+refreshed (and, with archive_vacuum, the space freed is given back).
+"""
+
+import base64
+import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from do_core.config import Configuration, Singleton
+from do_core.sql.graph_session import GraphSession
+from do_core.sql.sql_server import get_session
+
+# sessions archived in the same transaction
+BATCH_SIZE = 200
+
+
+class SessionArchiver(object, metaclass=Singleton):
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            'runs': 0,
+            'archived_sessions': 0,
+            'deleted_records': 0,
+            'last_run': None,
+            'last_run_seconds': None,
+            'last_run_archived_sessions': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """
+        Archive ended sessions every ARCHIVE_INTERVAL seconds (it never returns).
+        """
+        if Configuration().ARCHIVE_RETENTION_DAYS < 0:
+            logging.info("Session archival disabled")
+            return
+        while True:
+            try:
+                self.archive()
+            except Exception as ex:
+                logging.exception(ex)
+                with self.__lock:
+                    self.__metrics['last_error'] = str(ex)
+            time.sleep(Configuration().ARCHIVE_INTERVAL)
+
+    def archive(self):
+        """
+        Move the sessions ended more than ARCHIVE_RETENTION_DAYS days ago to the archive file.
+        :return: number of sessions archived
+        """
+        start = time.time()
+        before = datetime.datetime.now() - datetime.timedelta(days=Configuration().ARCHIVE_RETENTION_DAYS)
+        archived_sessions = 0
+        deleted_records = 0
+        while True:
+            session_ids = GraphSession().getEndedSessionIDs(before, BATCH_SIZE)
+            if len(session_ids) == 0:
+                break
+            records = GraphSession().getSessionsRecords(session_ids)
+            self.__export(records)
+            deleted_records += GraphSession().deleteSessions(session_ids)
+            archived_sessions += len(session_ids)
+            with self.__lock:
+                self.__metrics['archived_sessions'] += len(session_ids)
+            logging.debug("Archived " + str(archived_sessions) + " sessions")
+
+        if archived_sessions > 0:
+            self.__compact()
+        elapsed = time.time() - start
+
+        with self.__lock:
+            self.__metrics['runs'] += 1
+            self.__metrics['deleted_records'] += deleted_records
+            self.__metrics['last_run'] = datetime.datetime.now().isoformat()
+            self.__metrics['last_run_seconds'] = elapsed
+            self.__metrics['last_run_archived_sessions'] = archived_sessions
+            self.__metrics['last_error'] = None
+        if archived_sessions > 0:
+            logging.info("Archived " + str(archived_sessions) + " sessions (" + str(deleted_records) +
+                         " records) in " + "%.2f" % elapsed + "s")
+        return archived_sessions
+
+    def metrics(self):
+        with self.__lock:
+            return dict(self.__metrics)
+
+    @staticmethod
+    def __export(records):
+        """
+        Append a json line for each session to the archive file, before the session is deleted.
+        """
+        def encode(value):
+            if isinstance(value, datetime.datetime):
+                return value.isoformat()
+            if isinstance(value, bytes):
+                return base64.b64encode(value).decode('ascii')
+            raise TypeError(repr(value) + " is not JSON serializable")
+
+        archive_file = Configuration().ARCHIVE_FILE
+        os.makedirs(os.path.dirname(archive_file), exist_ok=True)
+        with gzip.open(archive_file, "at") as out_file:
+            for session_id, tables in records.items():
+                out_file.write(json.dumps({'session_id': session_id, 'tables': tables}, default=encode) + "\n")
+
+    @staticmethod
+    def __compact():
+        if Configuration().DATABASE_CONNECTION[:6] != "sqlite":
+            return
+        session = get_session()
+        # VACUUM locks the whole database while it rewrites it: only on demand
+        if Configuration().ARCHIVE_VACUUM:
+            # VACUUM cannot run inside a transaction: the session is in autocommit mode
+            session.execute(text("VACUUM"))
+        session.execute(text("ANALYZE"))
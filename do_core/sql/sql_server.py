@@ -3,9 +3,65 @@ Created on Jun 22, 2015
 
 @author: fabiomignini
 '''
-import sqlalchemy, os
-from sqlalchemy.orm import sessionmaker
+import logging
+import sqlalchemy, os, threading
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import LRUCache
 from do_core.config import Configuration
+from do_core.exception import WrongConfigurationFile
+
+'''
+Storage profiles (option 'storage_profile' of the configuration file):
+ - sqlite:     SQLite with default settings, a new connection for every session;
+ - sqlite-wal: SQLite with write-ahead logging (readers do not block the writer), synchronous=NORMAL,
+               busy timeout, pooled connections and write transactions queued in the process;
+ - server:     database server (e.g. PostgreSQL, MySQL) through a sized connection pool,
+               caching the compiled statements.
+'''
+STORAGE_PROFILES = ['sqlite', 'sqlite-wal', 'server']
+
+'''
+Columns (table, column) and tables (table, None) added to the schema of config/db.dump.sql:
+databases created before them are upgraded at startup (see upgrade_schema()).
+'''
+SCHEMA_UPGRADES = [
+    ('graph_session', 'graph_hash'),
+    ('graph_session', 'idempotency_key'),
+    ('graph_session', 'snapshot'),
+    ('flow_rule', 'tunnel_id'),
+    ('vlan_tunnel', None),
+    ('flow_rule', 'table_id'),
+    ('flow_group', None),
+    ('flow_rule', 'mpls_label')
+]
+
+__engine_lock = threading.Lock()
+__session_factory = None
+
+# SQLite has a single writer: write transactions wait here instead of failing with 'database is locked'
+_writer_lock = threading.RLock()
+
+
+class _SingleWriterSession(Session):
+
+    def begin(self, *args, **kwargs):
+        root = self.transaction is None
+        if root:
+            _writer_lock.acquire()
+        try:
+            return super(_SingleWriterSession, self).begin(*args, **kwargs)
+        except Exception:
+            if root:
+                _writer_lock.release()
+            raise
+
+
+@event.listens_for(_SingleWriterSession, 'after_transaction_end')
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        _writer_lock.release()
 
 
 def get_session():
@@ -15,16 +71,16 @@ def get_session():
     Raise the FileNotFoundError exception (if SQLite is used).
     '''
     sqlserver = Configuration().DATABASE_CONNECTION
-    
+
     # Manage SQLite connection
     if sqlserver[:6] == "sqlite":
         if __check_sqlite_database(sqlserver):
             return __create_session(sqlserver)
         else:
             raise FileNotFoundError("SQLite Database File not found")
-    
+
     # Return standard session
-    return __create_session()
+    return __create_session(sqlserver)
 
 def try_session():
     '''
@@ -35,18 +91,84 @@ def try_session():
     s = get_session()
     s.close_all()
     print("Database connection estabilished correctly.\n")
- 
+
+def upgrade_schema(metadata):
+    '''
+    Add to the database the columns and tables of SCHEMA_UPGRADES it has not yet (it can be called every time).
+    :param metadata: sqlalchemy MetaData of the models, defining the types of the columns and the tables to add
+    '''
+    engine = get_session().get_bind()
+    with engine.begin() as connection:
+        inspector = sqlalchemy.inspect(connection)
+        tables = set(inspector.get_table_names())
+        for table_name, column_name in SCHEMA_UPGRADES:
+            table = metadata.tables[table_name]
+            if table_name not in tables:
+                table.create(bind=connection, checkfirst=True)
+                tables.add(table_name)
+                logging.info("Database upgraded: table '" + table_name + "' created")
+                continue
+            if column_name is None:
+                continue
+            if column_name not in [column['name'] for column in inspector.get_columns(table_name)]:
+                column_type = table.c[column_name].type.compile(dialect=engine.dialect)
+                connection.execute(sqlalchemy.text('ALTER TABLE ' + table_name + ' ADD COLUMN ' + column_name +
+                                                   ' ' + column_type))
+                logging.info("Database upgraded: column '" + column_name + "' added to the table '" + table_name + "'")
+
 def __create_session(sqlserver):
-    engine = sqlalchemy.create_engine(sqlserver) # connect to server
+    global __session_factory
+    if __session_factory is None:
+        with __engine_lock:
+            if __session_factory is None:
+                __session_factory = __create_session_factory(sqlserver)
+    return __session_factory()
+
+def __create_session_factory(sqlserver):
+    profile = Configuration().STORAGE_PROFILE
+    if profile not in STORAGE_PROFILES:
+        raise WrongConfigurationFile("Unknown storage profile '" + profile + "', allowed: " + str(STORAGE_PROFILES))
+    if profile.startswith('sqlite') and sqlserver[:6] != "sqlite":
+        raise WrongConfigurationFile("Storage profile '" + profile + "' needs a SQLite database")
+
     session = sessionmaker()
-    session.configure(bind=engine,autocommit=True)
-    return session()
+    if profile == 'sqlite':
+        engine = sqlalchemy.create_engine(sqlserver) # connect to server
+        session.configure(bind=engine, autocommit=True)
+
+    elif profile == 'sqlite-wal':
+        busy_timeout = Configuration().SQLITE_BUSY_TIMEOUT
+        engine = sqlalchemy.create_engine(sqlserver, poolclass=QueuePool,
+                                          pool_size=Configuration().POOL_SIZE,
+                                          max_overflow=Configuration().POOL_MAX_OVERFLOW,
+                                          connect_args={'timeout': busy_timeout, 'check_same_thread': False})
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=" + str(int(busy_timeout * 1000)))
+            cursor.close()
+
+        session.configure(bind=engine, autocommit=True, class_=_SingleWriterSession)
+
+    else:
+        connect_args = {}
+        if sqlserver[:6] == "sqlite":
+            # only used as a local stand-in of a server: connections move between threads
+            connect_args['check_same_thread'] = False
+        engine = sqlalchemy.create_engine(sqlserver, poolclass=QueuePool,
+                                          pool_size=Configuration().POOL_SIZE,
+                                          max_overflow=Configuration().POOL_MAX_OVERFLOW,
+                                          pool_recycle=3600, connect_args=connect_args)
+        # statements are compiled once, then reused
+        engine = engine.execution_options(compiled_cache=LRUCache(500))
+        session.configure(bind=engine, autocommit=True)
+    return session
 
 def __check_sqlite_database(sqlserverconnection):
     # sqlserverconnection starts with "sqlite:///"
     #filename = os.path.basename(sqlserverconnection)
     filename = sqlserverconnection[10:]
     return os.path.exists(filename)
-
-    
-    
\ No newline at end of file
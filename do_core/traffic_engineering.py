@@ -0,0 +1,75 @@
+"""
+Weights of the links for the path computation (option 'path_weights' of the configuration file):
+ - hops:            every link weighs 1;
+ - reserved_flows:  each external flow forwarding packets on a link adds 'flow_weight' to its weight;
+ - port_statistics: a link weighs 1 + 'congestion_weight' * its utilization, measured reading
+                    the port statistics of the controller every 'statistics_interval' seconds.
+"""
+
+import logging
+import threading
+import time
+
+from do_core.config import Configuration, Singleton
+from do_core.exception import WrongConfigurationFile
+from do_core.netmanager import NetManager
+from do_core.sql.graph_session import GraphSession
+
+PATH_WEIGHTS = ['hops', 'reserved_flows', 'port_statistics']
+
+
+class TrafficEngineering(object, metaclass=Singleton):
+
+    def __init__(self):
+        if Configuration().PATH_WEIGHTS not in PATH_WEIGHTS:
+            raise WrongConfigurationFile("Unknown path weights '" + Configuration().PATH_WEIGHTS + "', allowed: " +
+                                         str(PATH_WEIGHTS))
+        self.__lock = threading.Lock()
+        self.__samples = {}     # (switch id, port) -> (bytes sent, time of the reading)
+        self.__rates = {}       # (switch id, port) -> bit/s
+
+    def start(self):
+        """
+        Read the port statistics every STATISTICS_INTERVAL seconds (it never returns).
+        """
+        if Configuration().PATH_WEIGHTS != 'port_statistics':
+            return
+        while True:
+            try:
+                self.update_statistics()
+            except Exception as ex:
+                logging.exception(ex)
+            time.sleep(Configuration().STATISTICS_INTERVAL)
+
+    def update_statistics(self, statistics=None):
+        """
+        Update the traffic of the ports with a new reading of their counters.
+        :param statistics: dict (switch id, port) -> bytes sent; read from the controller if not given
+        """
+        if statistics is None:
+            statistics = NetManager().getPortStatistics()
+        now = time.time()
+        with self.__lock:
+            for port, sent in statistics.items():
+                previous = self.__samples.get(port)
+                if previous is not None and now > previous[1] and sent >= previous[0]:
+                    self.__rates[port] = (sent - previous[0]) * 8 / (now - previous[1])
+                self.__samples[port] = (sent, now)
+
+    def link_weight(self):
+        """
+        :return: function (switch id, output port) -> weight of the link, None if every link weighs 1
+        """
+        if Configuration().PATH_WEIGHTS == 'reserved_flows':
+            port_load = GraphSession().getPortLoad()
+            flow_weight = Configuration().FLOW_WEIGHT
+            return lambda switch_id, port: 1 + flow_weight * port_load.flows(switch_id, port)
+
+        if Configuration().PATH_WEIGHTS == 'port_statistics':
+            with self.__lock:
+                rates = dict(self.__rates)
+            capacity = Configuration().LINK_CAPACITY * 1000000
+            congestion_weight = Configuration().CONGESTION_WEIGHT
+            return lambda switch_id, port: 1 + congestion_weight * min(rates.get((switch_id, str(port)), 0) / capacity,
+                                                                       1)
+        return None
@@ -29,10 +29,16 @@ from do_core.api.api import root_blueprint
 from do_core.api.nffg import api as nffg_api
 from do_core.api.network_topology import api as topology_api
 from do_core.api.user import api as user_api
+from do_core.api.capabilities import api as capabilities_api
+from do_core.api.status import api as status_api
 
 from do_core.config import Configuration
-from do_core.sql.sql_server import try_session
+from do_core.sql.sql_server import try_session, upgrade_schema
+from do_core.sql.graph_session import Base as GraphSessionBase
 from do_core.domain_information_manager import DomainInformationManager
+from do_core.sql.session_archiver import SessionArchiver
+from do_core.traffic_engineering import TrafficEngineering
+from do_core.rerouter import Rerouter
 from do_core.netmanager import NetManager
 
 # Database connection test
@@ -43,12 +49,16 @@ conf = Configuration()
 
 # initialize logging
 conf.log_configuration()
+
+# Columns and tables added since the database was created
+upgrade_schema(GraphSessionBase.metadata)
 print("[ Configuration file is: '" + Configuration().conf_file + "' ]")
 
 logging.debug("SDN Domain Orchestrator Starting...")
 
 # Rest application
-if nffg_api is not None and topology_api is not None and user_api is not None:
+if nffg_api is not None and topology_api is not None and user_api is not None and capabilities_api is not None \
+        and status_api is not None:
     app = Flask(__name__)
     app.register_blueprint(root_blueprint)
     logging.info("Flask Successfully started")
@@ -72,6 +82,18 @@ if len(Configuration().PORTS) > 0:
     else:
         logging.warning('Physical ports to attach found on the config file, however support for ovsdb is not enabled')
 
+# starting the archival of old sessions
+archiver_thread = Thread(target=SessionArchiver().start, daemon=True)
+archiver_thread.start()
+
+# reading the port statistics (if used to weigh the links)
+statistics_thread = Thread(target=TrafficEngineering().start, daemon=True)
+statistics_thread.start()
+
+# rerouting the flow rules when links or devices fail (if enabled)
+rerouter_thread = Thread(target=Rerouter().start, daemon=True)
+rerouter_thread.start()
+
 # starting DomainInformationManager
 domain_information_manager = DomainInformationManager()
 thread = Thread(target=domain_information_manager.start)